@@ -2,7 +2,7 @@ from django.contrib import admin
 
 # Register your models here.
 from django.contrib import admin
-from .models import Patient, Doctor, HealthWorker, MedicalFile, Appointment
+from .models import Patient, Doctor, HealthWorker, MedicalFile, Appointment, DoctorSchedule, AppointmentSlot
 
 @admin.register(Patient)
 class PatientAdmin(admin.ModelAdmin):
@@ -63,7 +63,7 @@ class MedicalFileAdmin(admin.ModelAdmin):
     list_display = ['file_name', 'patient', 'uploader_type', 'uploader_id', 'file_size', 'uploaded_at']
     list_filter = ['uploader_type', 'file_type', 'uploaded_at']
     search_fields = ['file_name', 'patient__name', 'patient__aadhar', 'uploader_id']
-    readonly_fields = ['id', 'uploaded_at']
+    readonly_fields = ['id', 'content_hash', 'uploaded_at']
     ordering = ['-uploaded_at']
     
     fieldsets = (
@@ -74,7 +74,7 @@ class MedicalFileAdmin(admin.ModelAdmin):
             'fields': ('uploader_type', 'uploader_id', 'uploaded_at')
         }),
         ('File Data', {
-            'fields': ('file_data',),
+            'fields': ('content_hash', 'file_data'),
             'classes': ('collapse',)
         }),
     )
@@ -87,7 +87,7 @@ class AppointmentAdmin(admin.ModelAdmin):
     list_display = ['appointment_code', 'patient', 'doctor_name', 'hospital', 'appointment_date', 'appointment_time', 'status', 'created_at']
     list_filter = ['status', 'appointment_date', 'hospital', 'created_at']
     search_fields = ['appointment_code', 'patient__name', 'doctor_name', 'hospital']
-    readonly_fields = ['appointment_code', 'created_at']
+    readonly_fields = ['appointment_code', 'slot', 'created_at']
     ordering = ['-created_at']
     
     fieldsets = (
@@ -95,7 +95,7 @@ class AppointmentAdmin(admin.ModelAdmin):
             'fields': ('appointment_code', 'patient', 'hospital', 'doctor_name')
         }),
         ('Schedule', {
-            'fields': ('appointment_date', 'appointment_time', 'status')
+            'fields': ('slot', 'appointment_date', 'appointment_time', 'status')
         }),
         ('Timestamps', {
             'fields': ('created_at',),
@@ -106,6 +106,27 @@ class AppointmentAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('patient')
 
+@admin.register(DoctorSchedule)
+class DoctorScheduleAdmin(admin.ModelAdmin):
+    list_display = ['doctor', 'hospital', 'weekday', 'start_time', 'end_time', 'slot_minutes', 'capacity']
+    list_filter = ['weekday', 'hospital']
+    search_fields = ['doctor__name', 'doctor__doctor_id', 'hospital']
+    ordering = ['doctor', 'weekday', 'start_time']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('doctor')
+
+@admin.register(AppointmentSlot)
+class AppointmentSlotAdmin(admin.ModelAdmin):
+    list_display = ['doctor', 'hospital', 'date', 'start_time', 'booked', 'capacity']
+    list_filter = ['date', 'hospital']
+    search_fields = ['doctor__name', 'doctor__doctor_id', 'hospital']
+    readonly_fields = ['booked']
+    ordering = ['-date', 'start_time']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('doctor')
+
 # Customize admin site headers
 admin.site.site_header = "Digital Health Record Management"
 admin.site.site_title = "Health Portal Admin"
@@ -0,0 +1,127 @@
+"""
+Moving old medical files to the cold archive.
+
+Files uploaded more than MIN_AGE_DAYS ago, and the files of patients with
+no registration, upload or appointment activity for INACTIVE_DAYS, have
+their bytes moved from the blob store into the ArchiveStore, a separate
+zlib-compressed SQLite database. Their MedicalFile and Blob rows stay, so
+listing, search and exports are unchanged, and MedicalFile.open() falls
+back to the archive once a blob has left the blob store. Files still held
+as data URLs in the main database are moved straight to the archive, which
+is what shrinks the main database.
+"""
+import hashlib
+import io
+import logging
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .blobstore import decode_data_url, get_archive_store, get_blob_store
+from .models import Appointment, Blob, MedicalFile
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_config():
+    config = getattr(settings, 'HEALTH_ARCHIVE', {})
+    return {
+        'MIN_AGE_DAYS': config.get('MIN_AGE_DAYS', 730),
+        'INACTIVE_DAYS': config.get('INACTIVE_DAYS', 1095),
+        'BATCH_SIZE': config.get('BATCH_SIZE', 100),
+    }
+
+
+@receiver(setting_changed)
+def _reset_config(setting, **kwargs):
+    if setting == 'HEALTH_ARCHIVE':
+        get_config.cache_clear()
+
+
+def cold_files(min_age_days=None, inactive_days=None, now=None):
+    """Q matching the MedicalFiles due for the archive"""
+    config = get_config()
+    now = now or timezone.now()
+    old = now - timedelta(days=config['MIN_AGE_DAYS'] if min_age_days is None else min_age_days)
+    idle = now - timedelta(days=config['INACTIVE_DAYS'] if inactive_days is None else inactive_days)
+    recent_upload = MedicalFile.objects.filter(patient=OuterRef('patient'), uploaded_at__gte=idle)
+    recent_appointment = Appointment.objects.filter(
+        Q(updated_at__gte=idle) | Q(appointment_date__gte=timezone.localdate(idle)), patient=OuterRef('patient'))
+    return Q(uploaded_at__lt=old) | Q(Q(patient__created_at__lt=idle), ~Exists(recent_upload),
+                                      ~Exists(recent_appointment))
+
+
+def archivable_blobs(cold):
+    """Blobs still in the blob store whose every file matches ``cold``"""
+    files = MedicalFile.objects.exclude(content_hash='')
+    return (Blob.objects
+            .filter(archived_at__isnull=True, ref_count__gt=0, sha256__in=files.filter(cold).values('content_hash'))
+            .exclude(sha256__in=files.exclude(cold).values('content_hash'))
+            .order_by('sha256'))
+
+
+def archive_blob(digest):
+    """
+    Move one blob from the blob store to the archive; return its size.
+
+    The copy is committed and checked before the blob is marked archived
+    and deleted, so a crash at any point leaves a readable copy. Reads
+    that opened the blob store file before the delete finish from it.
+    """
+    store = get_blob_store()
+    with store.open(digest) as source:
+        archived_digest, size = get_archive_store().put(source)
+    if archived_digest != digest:
+        raise ValueError(f'{digest} does not match its content in the blob store')
+
+    blob = Blob.objects.filter(sha256=digest).values('gzip_hash').first()
+    if blob is None or not Blob.objects.filter(sha256=digest).update(archived_at=timezone.now(), gzip_hash=''):
+        return 0
+    if not Blob.in_store(digest):
+        store.delete(digest)
+    # The gzip copy only sped up downloads from the blob store
+    gzip_hash = blob['gzip_hash']
+    if gzip_hash and not Blob.in_store(gzip_hash):
+        store.delete(gzip_hash)
+    return size
+
+
+def archive_data_urls(files):
+    """
+    Move MedicalFiles still holding a data URL to the archive; return (files moved, bytes freed).
+
+    Content already known as a blob is only pointed at, not stored twice.
+    """
+    archive = get_archive_store()
+    moved, archived = [], set()
+    freed = 0
+    for medical_file in files:
+        try:
+            mime_type, raw = decode_data_url(medical_file.file_data)
+        except ValueError:
+            logger.warning('Not archiving %s: its data URL is not valid base64', medical_file.pk)
+            continue
+        digest = hashlib.sha256(raw).hexdigest()
+        if digest not in archived and not Blob.objects.filter(sha256=digest).exists():
+            archive.put(io.BytesIO(raw))
+            archived.add(digest)
+        freed += len(medical_file.file_data)
+        medical_file.content_hash = digest
+        medical_file.file_data = ''
+        medical_file.file_size = len(raw)
+        medical_file.file_type = medical_file.file_type or mime_type
+        moved.append(medical_file)
+
+    with transaction.atomic():
+        MedicalFile.objects.bulk_update(moved, ['content_hash', 'file_data', 'file_size', 'file_type'])
+        for medical_file in moved:
+            Blob.acquire(medical_file.content_hash, medical_file.file_size)
+        Blob.objects.filter(sha256__in=archived).update(archived_at=timezone.now())
+    return len(moved), freed
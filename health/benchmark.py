@@ -0,0 +1,538 @@
+"""
+Endpoint benchmark harness: a synthetic data seeder, an HTTP driver that
+exercises every route in health.urls, and a baseline comparison.
+
+Used by the seed_bench_data and bench_endpoints management commands.
+"""
+import base64
+import hashlib
+import http.client
+import io
+import json
+import math
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import time as clock, timedelta
+from urllib.parse import urlsplit
+
+from django.db import connection, transaction
+from django.urls import get_resolver
+from django.utils import timezone
+
+from .blobstore import get_blob_store
+from .ids import APPOINTMENT_CODES, DOCTOR_IDS, WORKER_IDS
+from .models import Appointment, AppointmentSlot, Blob, Doctor, DoctorSchedule, HealthWorker, MedicalFile, Patient
+from .qr import issue_token
+from .rollups import ROLLUPS
+from .search import rebuild_doctor_index, rebuild_record_index
+from .slots import generate_slots
+
+# Seeded rows are recognisable by these markers so they can be cleared
+AADHAR_PREFIX = '7770'
+WORKER_PHONE_PREFIX = '7770'
+HOSPITAL_SUFFIX = 'Bench Hospital'
+
+FIRST_NAMES = ['Asha', 'Ravi', 'Meera', 'Arjun', 'Lakshmi', 'Suresh', 'Anjali', 'Vikram', 'Priya', 'Manoj',
+               'Deepa', 'Rahul', 'Kavya', 'Sanjay', 'Nisha', 'Gopal', 'Fatima', 'Joseph', 'Shreya', 'Imran']
+LAST_NAMES = ['Nair', 'Menon', 'Pillai', 'Kumar', 'Sharma', 'Iyer', 'Das', 'Reddy', 'Khan', 'Thomas',
+              'Varghese', 'Patel', 'Singh', 'Rao', 'Bose', 'Gupta', 'Mathew', 'Joshi', 'Ali', 'Verma']
+CITIES = ['Kochi', 'Thrissur', 'Kozhikode', 'Kollam', 'Kannur', 'Palakkad', 'Alappuzha', 'Kottayam', 'Malappuram']
+
+# (MIME type, extension, share of files)
+FILE_TYPES = [('image/jpeg', 'jpg', 0.5), ('application/pdf', 'pdf', 0.35), ('text/plain', 'txt', 0.15)]
+MEDIAN_FILE_SIZE = 150 * 1024
+MIN_FILE_SIZE = 4 * 1024
+MAX_FILE_SIZE = 8 * 1024 * 1024
+
+BATCH_SIZE = 2000
+
+
+@dataclass
+class SeedCounts:
+    patients: int = 0
+    doctors: int = 0
+    workers: int = 0
+    files: int = 0
+    file_bytes: int = 0
+    appointments: int = 0
+    slots: int = 0
+
+
+def _name(rng):
+    return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+
+def _file_size(rng):
+    size = int(rng.lognormvariate(math.log(MEDIAN_FILE_SIZE), 1.0))
+    return max(MIN_FILE_SIZE, min(size, MAX_FILE_SIZE))
+
+
+def seed(patients=10000, doctors=1000, workers=200, files=1000, appointments=20000, seed=42, log=None):
+    """
+    Bulk-insert a synthetic data set and return SeedCounts.
+
+    Rows are written with bulk_create, bypassing signals, so blob reference
+    counts and the search indexes are filled in directly afterwards. Files
+    get log-normally distributed sizes around MEDIAN_FILE_SIZE and unique
+    content, so nothing is deduplicated.
+    """
+    rng = random.Random(seed)
+    counts = SeedCounts()
+    log = log or (lambda message: None)
+    start = Patient.objects.filter(aadhar__startswith=AADHAR_PREFIX).count()
+
+    aadhars = [f'{AADHAR_PREFIX}{i:08d}' for i in range(start, start + patients)]
+    for offset in range(0, len(aadhars), BATCH_SIZE):
+        Patient.objects.bulk_create([
+            Patient(aadhar=aadhar, name=_name(rng), phone=f'9{rng.randrange(10 ** 9):09d}')
+            for aadhar in aadhars[offset:offset + BATCH_SIZE]
+        ], ignore_conflicts=True)
+    counts.patients = len(aadhars)
+    log(f'{counts.patients} patients')
+
+    specializations = [code for code, _ in Doctor.SPECIALIZATIONS]
+    doctor_rows = [
+        Doctor(doctor_id=doctor_id, name=_name(rng), specialization=rng.choice(specializations),
+               hospital=f'{rng.choice(CITIES)} {HOSPITAL_SUFFIX}')
+        for doctor_id in (DOCTOR_IDS.reserve_codes(doctors) if doctors else [])
+    ]
+    Doctor.objects.bulk_create(doctor_rows, batch_size=BATCH_SIZE)
+    DoctorSchedule.objects.bulk_create([
+        DoctorSchedule(doctor=doctor, hospital=doctor.hospital, weekday=weekday,
+                       start_time=clock(9, 0), end_time=clock(12, 0), slot_minutes=15, capacity=4)
+        for doctor in doctor_rows[:max(1, len(doctor_rows) // 10)] for weekday in range(6)
+    ], batch_size=BATCH_SIZE)
+    counts.doctors = len(doctor_rows)
+    log(f'{counts.doctors} doctors')
+
+    HealthWorker.objects.bulk_create([
+        HealthWorker(worker_id=worker_id, name=_name(rng), phone=f'{WORKER_PHONE_PREFIX}{rng.randrange(10 ** 6):06d}')
+        for worker_id in (WORKER_IDS.reserve_codes(workers) if workers else [])
+    ], batch_size=BATCH_SIZE)
+    counts.workers = workers
+    log(f'{counts.workers} workers')
+
+    # Unique content per file, cut from a random pool with a distinct prefix
+    pool = rng.randbytes(MAX_FILE_SIZE)
+    store = get_blob_store()
+    now = timezone.now()
+    medical_files, blobs = [], {}
+    for i in range(files if aadhars else 0):
+        mime_type, extension, _ = rng.choices(FILE_TYPES, weights=[w for _, _, w in FILE_TYPES])[0]
+        size = _file_size(rng)
+        offset = rng.randrange(MAX_FILE_SIZE - size + 1)
+        data = f'bench file {start + i} {rng.random()}\n'.encode() + pool[offset:offset + size]
+        digest, stored_size = store.put(io.BytesIO(data))
+        blobs[digest] = Blob(sha256=digest, size=stored_size, ref_count=1)
+        uploader = rng.choice(['patient', 'doctor', 'worker'])
+        patient = rng.choice(aadhars)
+        medical_files.append(MedicalFile(
+            patient_id=patient, file_name=f'report-{i}.{extension}', content_hash=digest,
+            file_type=mime_type, file_size=stored_size, uploader_type=uploader,
+            uploader_id=patient if uploader == 'patient' else f'{uploader[:3].upper()}000001',
+            uploaded_at=now - timedelta(minutes=rng.randrange(5 * 365 * 24 * 60)),
+        ))
+        counts.files += 1
+        counts.file_bytes += stored_size
+        if len(medical_files) >= BATCH_SIZE:
+            _insert_files(medical_files, blobs)
+            medical_files, blobs = [], {}
+    _insert_files(medical_files, blobs)
+    log(f'{counts.files} files, {counts.file_bytes / 1024 / 1024:.1f} MB')
+
+    today = timezone.localdate()
+    codes = APPOINTMENT_CODES.reserve_codes(appointments) if appointments and aadhars else []
+    for offset in range(0, len(codes), BATCH_SIZE):
+        Appointment.objects.bulk_create([
+            Appointment(
+                appointment_code=code, patient_id=rng.choice(aadhars),
+                hospital=f'{rng.choice(CITIES)} {HOSPITAL_SUFFIX}', doctor_name=f'Dr. {_name(rng)}',
+                appointment_date=today + timedelta(days=rng.randrange(-720, 30)),
+                appointment_time=f'{rng.randrange(9, 17):02d}:{rng.choice(["00", "30"])}',
+                status=rng.choices(['completed', 'scheduled', 'cancelled'], weights=[6, 3, 1])[0],
+            )
+            for code in codes[offset:offset + BATCH_SIZE]
+        ])
+    counts.appointments = len(codes)
+    log(f'{counts.appointments} appointments')
+
+    counts.slots = generate_slots(today, today + timedelta(days=13),
+                                  DoctorSchedule.objects.filter(hospital__endswith=HOSPITAL_SUFFIX))
+    rebuild_doctor_index()
+    rebuild_record_index()
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    log(f'{counts.slots} slots, search indexes rebuilt')
+    refresh_rollups()
+    log('analytics rollups rebuilt')
+    return counts
+
+
+def refresh_rollups():
+    # bulk_create skips the signals that would have marked the days dirty
+    for rollup in ROLLUPS.values():
+        rollup.refresh(full=True)
+
+
+def _insert_files(medical_files, blobs):
+    with transaction.atomic():
+        Blob.objects.bulk_create(blobs.values(), ignore_conflicts=True)
+        MedicalFile.objects.bulk_create(medical_files)
+
+
+def clear():
+    """Delete every seeded row; blobs are left for gc_blobs to collect"""
+    patients = Patient.objects.filter(aadhar__startswith=AADHAR_PREFIX)
+    hashes = list(MedicalFile.objects.filter(patient__in=patients).exclude(content_hash='')
+                  .values_list('content_hash', flat=True))
+    Appointment.objects.filter(patient__in=patients).delete()
+    AppointmentSlot.objects.filter(hospital__endswith=HOSPITAL_SUFFIX).delete()
+    MedicalFile.objects.filter(patient__in=patients).delete()
+    for offset in range(0, len(hashes), 500):
+        Blob.objects.filter(sha256__in=hashes[offset:offset + 500]).update(ref_count=0, updated_at=timezone.now())
+    patients.delete()
+    Doctor.objects.filter(hospital__endswith=HOSPITAL_SUFFIX).delete()
+    HealthWorker.objects.filter(phone__startswith=WORKER_PHONE_PREFIX).delete()
+    rebuild_doctor_index()
+    rebuild_record_index()
+    refresh_rollups()
+
+
+# Driver
+
+@dataclass
+class Fixture:
+    """Sample of seeded rows that route requests are built from"""
+    patients: list
+    doctor_ids: list
+    worker_ids: list
+    file_ids: list
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    serial: int = 0
+
+    def unique(self):
+        """Next number of a per-run sequence, for rows that must not collide"""
+        with self.lock:
+            self.serial += 1
+            return self.serial
+
+
+def load_fixture(sample=500):
+    patients = list(Patient.objects.filter(aadhar__startswith=AADHAR_PREFIX)
+                    .order_by('?').values('aadhar', 'name', 'phone')[:sample])
+    if not patients:
+        raise ValueError('No seeded data found; run seed_bench_data first')
+    aadhars = [p['aadhar'] for p in patients]
+    return Fixture(
+        patients=patients,
+        doctor_ids=list(Doctor.objects.filter(hospital__endswith=HOSPITAL_SUFFIX)
+                        .values_list('doctor_id', flat=True)[:sample]),
+        worker_ids=list(HealthWorker.objects.filter(phone__startswith=WORKER_PHONE_PREFIX)
+                        .values_list('worker_id', flat=True)[:sample]),
+        file_ids=[str(i) for i in MedicalFile.objects.filter(patient_id__in=aadhars)
+                  .values_list('id', flat=True)[:sample]],
+    )
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    body: bytes = b''
+    headers: dict = field(default_factory=dict)
+
+
+def _json(method, path, data):
+    return Request(method, path, json.dumps(data).encode(), {'Content-Type': 'application/json'})
+
+
+class Client:
+    """Keep-alive HTTP client for one driver thread"""
+
+    def __init__(self, base_url):
+        url = urlsplit(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.conn = None
+
+    def send(self, request):
+        """Return (status, body bytes), reconnecting once if the server closed the connection"""
+        for attempt in (1, 2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                self.conn.request(request.method, request.path, body=request.body or None,
+                                  headers=request.headers)
+                response = self.conn.getresponse()
+                body = response.read()
+                if response.getheader('Connection', '').lower() == 'close':
+                    self.close()
+                return response.status, body
+            except (http.client.HTTPException, ConnectionError):
+                self.close()
+                if attempt == 2:
+                    raise
+
+    def call(self, request):
+        """send() for setup steps, returning the decoded JSON body"""
+        return json.loads(self.send(request)[1])
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def _patient(fx, rng):
+    return rng.choice(fx.patients)
+
+
+def _new_aadhar(fx):
+    return f'6{int(time.time()) % 10 ** 5:05d}{fx.unique():06d}'
+
+
+def _upload_session(client, fx, rng, size=64 * 1024):
+    data = rng.randbytes(size)
+    result = client.call(_json('POST', '/api/uploads/', {
+        'patient_aadhar': _patient(fx, rng)['aadhar'], 'file_name': 'bench-chunked.bin',
+        'file_type': 'application/octet-stream', 'file_size': len(data),
+        'uploader_type': 'patient', 'uploader_id': 'bench',
+    }))
+    return result['upload_id'], data
+
+
+def _chunk_request(upload_id, data):
+    return Request('PUT', f'/api/uploads/{upload_id}/chunks/0/', data,
+                   {'Content-Type': 'application/octet-stream',
+                    'X-Chunk-SHA256': hashlib.sha256(data).hexdigest()})
+
+
+def _upload_chunk(client, fx, rng):
+    return _chunk_request(*_upload_session(client, fx, rng))
+
+
+def _upload_status(client, fx, rng):
+    upload_id, _ = _upload_session(client, fx, rng)
+    return Request('GET', f'/api/uploads/{upload_id}/')
+
+
+def _commit_upload(client, fx, rng):
+    upload_id, data = _upload_session(client, fx, rng)
+    client.send(_chunk_request(upload_id, data))
+    return _json('POST', f'/api/uploads/{upload_id}/commit/', {})
+
+
+def _cancel_appointment(client, fx, rng):
+    booked = client.call(_json('POST', '/api/book-appointment/', {
+        'patient_aadhar': _patient(fx, rng)['aadhar'], 'hospital': 'Bench', 'doctor_name': 'Bench',
+        'appointment_date': str(timezone.localdate()), 'appointment_time': '09:00',
+    }))
+    return _json('POST', '/api/cancel-appointment/', {'appointment_code': booked['appointment_code']})
+
+
+def _import_patients(client, fx, rng):
+    lines = [json.dumps({'aadhar': _new_aadhar(fx), 'name': _name(rng), 'phone': '9000000000'})
+             for _ in range(50)]
+    return Request('POST', '/api/import-patients/?format=jsonl', '\n'.join(lines).encode(),
+                   {'Content-Type': 'application/x-ndjson'})
+
+
+def _upload_file(client, fx, rng):
+    data = base64.b64encode(rng.randbytes(_file_size(rng) // 4)).decode()
+    return _json('POST', '/api/upload-file/', {
+        'patient_aadhar': _patient(fx, rng)['aadhar'], 'file_name': 'bench-upload.jpg',
+        'file_data': f'data:image/jpeg;base64,{data}', 'file_type': 'image/jpeg',
+        'uploader_type': 'patient', 'uploader_id': 'bench',
+    })
+
+
+def _batch(client, fx, rng):
+    # One patient visit: register, book and attach a report
+    aadhar = _new_aadhar(fx)
+    data = base64.b64encode(rng.randbytes(4096)).decode()
+    return _json('POST', '/api/batch/', {'atomic': True, 'operations': [
+        {'op': 'register_patient', 'data': {'aadhar': aadhar, 'name': _name(rng), 'phone': '9000000000'}},
+        {'op': 'book_appointment', 'data': {
+            'patient_aadhar': aadhar, 'hospital': 'Bench', 'doctor_name': 'Bench',
+            'appointment_date': str(timezone.localdate()), 'appointment_time': '12:00'}},
+        {'op': 'upload_file', 'data': {
+            'patient_aadhar': aadhar, 'file_name': 'bench-visit.bin',
+            'file_data': f'data:application/octet-stream;base64,{data}', 'uploader_type': 'worker', 'uploader_id': rng.choice(fx.worker_ids)}},
+    ]})
+
+
+def _sync_push(client, fx, rng):
+    operations = []
+    for _ in range(10):
+        aadhar = _new_aadhar(fx)
+        operations += [
+            {'key': f'{aadhar}-r', 'op': 'register_patient',
+             'data': {'aadhar': aadhar, 'name': _name(rng), 'phone': '9000000000'}},
+            {'key': f'{aadhar}-b', 'op': 'book_appointment',
+             'data': {'patient_aadhar': aadhar, 'hospital': 'Bench', 'doctor_name': 'Bench',
+                      'appointment_date': str(timezone.localdate()), 'appointment_time': '11:00'}},
+        ]
+    return _json('POST', '/api/sync/push/', {'worker_id': rng.choice(fx.worker_ids), 'operations': operations})
+
+
+def _analytics(client, fx, rng):
+    name = rng.choice(list(ROLLUPS))
+    start = timezone.localdate() - timedelta(days=365)
+    return Request('GET', f'/api/analytics/{name}/?from={start}&group_by={rng.choice(ROLLUPS[name].dimensions)}')
+
+
+# URL name -> builder(client, fixture, rng) returning the Request to time.
+# Builders may make untimed setup calls through the client first.
+ROUTES = {
+    'index': lambda c, fx, rng: Request('GET', '/'),
+    'metrics': lambda c, fx, rng: Request('GET', '/metrics'),
+    'register_patient': lambda c, fx, rng: _json('POST', '/api/register-patient/', {
+        'aadhar': _new_aadhar(fx), 'name': _name(rng), 'phone': '9000000000'}),
+    'login_patient': lambda c, fx, rng: _json('POST', '/api/login-patient/', {
+        k: v for k, v in _patient(fx, rng).items() if k in ('name', 'phone')}),
+    'import_patients': _import_patients,
+    'get_patient_files': lambda c, fx, rng: Request('GET', f"/api/patient-files/{_patient(fx, rng)['aadhar']}/"),
+    'search_patient_records': lambda c, fx, rng: Request(
+        'GET', f"/api/patient-files/{_patient(fx, rng)['aadhar']}/search/?q={rng.choice(['report', 'pdf', 'kochi', 'completed'])}"),
+    'export_patient_record': lambda c, fx, rng: Request('GET', f"/api/patient/{_patient(fx, rng)['aadhar']}/export/"),
+    'patient_timeline': lambda c, fx, rng: Request('GET', f"/api/patient/{_patient(fx, rng)['aadhar']}/timeline/"),
+    'analytics': _analytics,
+    'verify_patient_qr': lambda c, fx, rng: Request('GET', f"/api/verify-patient/{_patient(fx, rng)['aadhar']}/"),
+    'verify_qr_tokens': lambda c, fx, rng: _json('POST', '/api/verify-qr-tokens/', {
+        'tokens': [issue_token(_patient(fx, rng) | {'email': None}) for _ in range(20)]}),
+    'register_doctor': lambda c, fx, rng: _json('POST', '/api/register-doctor/', {
+        'name': _name(rng), 'specialization': 'General', 'hospital': f'{rng.choice(CITIES)} {HOSPITAL_SUFFIX}'}),
+    'login_doctor': lambda c, fx, rng: _json('POST', '/api/login-doctor/', {'doctor_id': rng.choice(fx.doctor_ids)}),
+    'doctor_search': lambda c, fx, rng: Request(
+        'GET', f"/api/doctors/search/?q={rng.choice(FIRST_NAMES).lower()[:rng.randint(3, 5)]}"),
+    'register_worker': lambda c, fx, rng: _json('POST', '/api/register-worker/', {
+        'name': _name(rng), 'phone': f'{WORKER_PHONE_PREFIX}{rng.randrange(10 ** 6):06d}'}),
+    'login_worker': lambda c, fx, rng: _json('POST', '/api/login-worker/', {'worker_id': rng.choice(fx.worker_ids)}),
+    'sync_changes': lambda c, fx, rng: Request('GET', f'/api/sync/changes/?worker_id={rng.choice(fx.worker_ids)}'),
+    'sync_push': _sync_push,
+    'upload_file': _upload_file,
+    'book_appointment': lambda c, fx, rng: _json('POST', '/api/book-appointment/', {
+        'patient_aadhar': _patient(fx, rng)['aadhar'], 'hospital': 'Bench', 'doctor_name': 'Bench',
+        'appointment_date': str(timezone.localdate()), 'appointment_time': '10:00'}),
+    'cancel_appointment': _cancel_appointment,
+    'batch': _batch,
+    'available_slots': lambda c, fx, rng: Request('GET', f'/api/slots/?hospital={rng.choice(CITIES)}+{HOSPITAL_SUFFIX.replace(" ", "+")}'),
+    'download_file': lambda c, fx, rng: Request('GET', f'/api/files/{rng.choice(fx.file_ids)}/'),
+    'file_preview': lambda c, fx, rng: Request('GET', f'/api/files/{rng.choice(fx.file_ids)}/preview/'),
+    'init_upload': lambda c, fx, rng: _json('POST', '/api/uploads/', {
+        'patient_aadhar': _patient(fx, rng)['aadhar'], 'file_name': 'bench-chunked.bin',
+        'file_type': 'application/octet-stream', 'file_size': 1024 * 1024,
+        'uploader_type': 'patient', 'uploader_id': 'bench'}),
+    'upload_status': _upload_status,
+    'upload_chunk': _upload_chunk,
+    'commit_upload': _commit_upload,
+}
+
+# Routes whose expected answer is a 404 when the optional preview libraries are missing
+EXPECTED_STATUSES = {'file_preview': (200, 404)}
+
+
+def url_names():
+    """Every named route of the health app"""
+    resolver = get_resolver()
+    names = set()
+    for pattern in resolver.url_patterns:
+        if getattr(pattern, 'namespace', None) == 'health':
+            names.update(p.name for p in pattern.url_patterns if p.name)
+    return names
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def run_route(base_url, name, fixture, requests, concurrency, seed=0):
+    """Send ``requests`` requests for one route from ``concurrency`` threads; return its stats"""
+    builder = ROUTES[name]
+    expected = EXPECTED_STATUSES.get(name, (200,))
+    latencies, errors, unsuccessful = [], 0, 0
+    failures = []  # First few failure messages, to tell what went wrong
+    lock = threading.Lock()
+
+    def record(elapsed=None, error=None, failed=False):
+        nonlocal errors, unsuccessful
+        with lock:
+            if error is None:
+                latencies.append(elapsed)
+                unsuccessful += bool(failed)
+            else:
+                errors += 1
+            if (error or failed) and len(failures) < 5:
+                failures.append(error or failed)
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        client = Client(base_url)
+        mine = requests // concurrency + (1 if index < requests % concurrency else 0)
+        try:
+            for _ in range(mine):
+                try:
+                    request = builder(client, fixture, rng)
+                    began = time.perf_counter()
+                    status, body = client.send(request)
+                    elapsed = time.perf_counter() - began
+                except Exception as e:
+                    record(error=f'{type(e).__name__}: {e}')
+                    continue
+                if status not in expected:
+                    record(error=f'HTTP {status}')
+                elif status == 200 and body[:1] == b'{' and b'"success": false' in body[:200]:
+                    record(elapsed, failed=json.loads(body).get('error', 'success false'))
+                else:
+                    record(elapsed)
+        finally:
+            client.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'unsuccessful': unsuccessful,
+        'rps': round(len(latencies) / wall, 1) if wall else 0.0,
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        'failures': failures,
+    }
+
+
+def compare(results, baseline, threshold=0.2, min_delta_ms=2.0):
+    """
+    List regressions of ``results`` against ``baseline`` (both as written by bench_endpoints).
+
+    A route regresses when its p95 latency grows by more than ``threshold``
+    (a fraction) and by more than ``min_delta_ms``, or when it fails
+    requests the baseline did not.
+    """
+    regressions = []
+    for name, base in baseline.get('routes', {}).items():
+        current = results['routes'].get(name)
+        if current is None:
+            continue
+        limit = max(base['p95_ms'] * (1 + threshold), base['p95_ms'] + min_delta_ms)
+        if current['p95_ms'] > limit:
+            regressions.append(f"{name}: p95 {current['p95_ms']:.2f} ms vs baseline {base['p95_ms']:.2f} ms "
+                               f"(limit {limit:.2f} ms)")
+        base_rate = base['errors'] / max(base['requests'], 1)
+        rate = current['errors'] / max(current['requests'], 1)
+        if rate > base_rate + 0.01:
+            regressions.append(f"{name}: error rate {rate:.1%} vs baseline {base_rate:.1%}")
+    return regressions
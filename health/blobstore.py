@@ -0,0 +1,306 @@
+import base64
+import binascii
+import hashlib
+import io
+import os
+import sqlite3
+import tempfile
+import threading
+import zlib
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import storages
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+CHUNK_SIZE = 64 * 1024
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+
+
+def decode_data_url(data_url):
+    """Split a base64 data URL into (mime_type, raw bytes)"""
+    mime_type = ''
+    payload = data_url
+    if data_url.startswith('data:') and ',' in data_url:
+        header, payload = data_url.split(',', 1)
+        mime_type = header[5:].split(';', 1)[0]
+    try:
+        return mime_type, base64.b64decode(payload, validate=False)
+    except (binascii.Error, ValueError):
+        raise ValueError('File data is not valid base64')
+
+
+def encode_data_url(mime_type, raw):
+    """Build a base64 data URL from raw bytes"""
+    encoded = base64.b64encode(raw).decode('ascii')
+    return f"data:{mime_type or 'application/octet-stream'};base64,{encoded}"
+
+
+class BlobStore:
+    """Content-addressed storage keyed by the SHA-256 hex digest of the bytes"""
+
+    def put(self, stream):
+        """Store the contents of a binary stream and return (digest, size)"""
+        raise NotImplementedError
+
+    def put_bytes(self, data):
+        return self.put(io.BytesIO(data))
+
+    def open(self, digest):
+        """Return a binary file object for the blob"""
+        raise NotImplementedError
+
+    def exists(self, digest):
+        raise NotImplementedError
+
+    def delete(self, digest):
+        raise NotImplementedError
+
+    def size(self, digest):
+        raise NotImplementedError
+
+    @staticmethod
+    def shard(digest):
+        """Relative path of a blob, sharded two levels deep by its digest"""
+        return os.path.join(digest[:2], digest[2:4], digest)
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs kept as plain files under a local directory"""
+
+    def __init__(self, root):
+        self.root = str(root)
+        self.tmp_dir = os.path.join(self.root, 'tmp')
+
+    def path(self, digest):
+        return os.path.join(self.root, self.shard(digest))
+
+    def put(self, stream):
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+            digest = hasher.hexdigest()
+            final_path = self.path(digest)
+            if os.path.exists(final_path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(tmp_path, final_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return digest, size
+
+    def open(self, digest):
+        return open(self.path(digest), 'rb')
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def delete(self, digest):
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+    def size(self, digest):
+        return os.path.getsize(self.path(digest))
+
+
+class StorageBlobStore(BlobStore):
+    """Blobs kept in any Django Storage backend, looked up by STORAGES alias"""
+
+    def __init__(self, storage='default', prefix='blobs'):
+        self.storage = storages[storage] if isinstance(storage, str) else storage
+        self.prefix = prefix
+
+    def name(self, digest):
+        return f"{self.prefix}/{self.shard(digest)}".replace(os.sep, '/')
+
+    def put(self, stream):
+        hasher = hashlib.sha256()
+        size = 0
+        with tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE * 16) as tmp:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                hasher.update(chunk)
+                tmp.write(chunk)
+                size += len(chunk)
+            digest = hasher.hexdigest()
+            name = self.name(digest)
+            if not self.storage.exists(name):
+                tmp.seek(0)
+                self.storage.save(name, File(tmp))
+        return digest, size
+
+    def open(self, digest):
+        return self.storage.open(self.name(digest), 'rb')
+
+    def exists(self, digest):
+        return self.storage.exists(self.name(digest))
+
+    def delete(self, digest):
+        self.storage.delete(self.name(digest))
+
+    def size(self, digest):
+        return self.storage.size(self.name(digest))
+
+
+class ArchiveStore(BlobStore):
+    """
+    Cold storage: blobs zlib-compressed into a separate SQLite database.
+
+    Content is split into ARCHIVE_CHUNK_SIZE pieces compressed one by one,
+    so files are written and read in constant memory and a read can start
+    at any offset, as Range requests need. Each thread has its own
+    connection, opened on first use.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    def connection(self):
+        db = getattr(self._local, 'connection', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5)
+            db.execute('PRAGMA journal_mode = WAL')
+            db.execute('PRAGMA synchronous = NORMAL')
+            db.execute('CREATE TABLE IF NOT EXISTS blobs (sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL, '
+                       'chunk_size INTEGER NOT NULL, stored INTEGER NOT NULL)')
+            db.execute('CREATE TABLE IF NOT EXISTS chunks (sha256 TEXT, seq INTEGER, data BLOB NOT NULL, '
+                       'PRIMARY KEY (sha256, seq)) WITHOUT ROWID')
+            self._local.connection = db
+        return db
+
+    def put(self, stream):
+        db = self.connection()
+        hasher = hashlib.sha256()
+        size = stored = 0
+        tmp = f'tmp-{os.getpid()}-{threading.get_ident()}'
+        with db:
+            db.execute('DELETE FROM chunks WHERE sha256 = ?', (tmp,))
+            for seq, chunk in enumerate(iter(lambda: stream.read(ARCHIVE_CHUNK_SIZE), b'')):
+                hasher.update(chunk)
+                data = zlib.compress(chunk, 6)
+                db.execute('INSERT INTO chunks VALUES (?, ?, ?)', (tmp, seq, data))
+                size += len(chunk)
+                stored += len(data)
+            digest = hasher.hexdigest()
+            if db.execute('SELECT 1 FROM blobs WHERE sha256 = ?', (digest,)).fetchone():
+                db.execute('DELETE FROM chunks WHERE sha256 = ?', (tmp,))
+            else:
+                db.execute('UPDATE chunks SET sha256 = ? WHERE sha256 = ?', (digest, tmp))
+                db.execute('INSERT INTO blobs VALUES (?, ?, ?, ?)', (digest, size, ARCHIVE_CHUNK_SIZE, stored))
+        return digest, size
+
+    def open(self, digest):
+        row = self.connection().execute('SELECT size, chunk_size FROM blobs WHERE sha256 = ?', (digest,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(f'{digest} is not in the archive')
+        return ArchivedFile(self, digest, *row)
+
+    def exists(self, digest):
+        return self.connection().execute('SELECT 1 FROM blobs WHERE sha256 = ?', (digest,)).fetchone() is not None
+
+    def delete(self, digest):
+        with self.connection() as db:
+            db.execute('DELETE FROM chunks WHERE sha256 = ?', (digest,))
+            db.execute('DELETE FROM blobs WHERE sha256 = ?', (digest,))
+
+    def size(self, digest):
+        row = self.connection().execute('SELECT size FROM blobs WHERE sha256 = ?', (digest,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(f'{digest} is not in the archive')
+        return row[0]
+
+    def read_chunk(self, digest, seq):
+        row = self.connection().execute('SELECT data FROM chunks WHERE sha256 = ? AND seq = ?',
+                                        (digest, seq)).fetchone()
+        if row is None:
+            raise OSError(f'{digest} is missing chunk {seq}')
+        return zlib.decompress(row[0])
+
+
+class ArchivedFile(io.RawIOBase):
+    """Seekable read-only file over an archived blob, decompressing one chunk at a time"""
+
+    def __init__(self, store, digest, size, chunk_size):
+        self.store = store
+        self.digest = digest
+        self.size = size
+        self.chunk_size = chunk_size
+        self._position = 0
+        self._chunk = (None, b'')
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError('Negative seek position')
+        self._position = offset
+        return offset
+
+    def readinto(self, buffer):
+        if self._position >= self.size:
+            return 0
+        seq, offset = divmod(self._position, self.chunk_size)
+        if self._chunk[0] != seq:
+            self._chunk = (seq, self.store.read_chunk(self.digest, seq))
+        data = self._chunk[1][offset:offset + len(buffer)]
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+@lru_cache(maxsize=None)
+def get_archive_store():
+    """Return the cold ArchiveStore at settings.HEALTH_ARCHIVE['PATH']"""
+    config = getattr(settings, 'HEALTH_ARCHIVE', {})
+    return ArchiveStore(config.get('PATH', os.path.join(settings.BASE_DIR, 'archive.sqlite3')))
+
+
+def open_blob(digest):
+    """Open a blob from the blob store, or from the archive once it has been moved there"""
+    try:
+        return get_blob_store().open(digest)
+    except FileNotFoundError:
+        return get_archive_store().open(digest)
+
+
+@lru_cache(maxsize=None)
+def get_blob_store():
+    """Return the blob store configured by settings.HEALTH_BLOB_STORE"""
+    config = getattr(settings, 'HEALTH_BLOB_STORE', {})
+    backend = import_string(config.get('BACKEND', 'health.blobstore.LocalBlobStore'))
+    options = config.get('OPTIONS', {'root': os.path.join(settings.BASE_DIR, 'blobstore')})
+    return backend(**options)
+
+
+@receiver(setting_changed)
+def _reset_blob_store(setting, **kwargs):
+    if setting in ('HEALTH_BLOB_STORE', 'STORAGES'):
+        get_blob_store.cache_clear()
+    if setting == 'HEALTH_ARCHIVE':
+        get_archive_store.cache_clear()
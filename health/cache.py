@@ -0,0 +1,214 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .models import Patient, login_name
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache whose entries expire after ``ttl`` seconds"""
+
+    def __init__(self, max_entries=10000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def profile_of(patient):
+    return {
+        'aadhar': patient.aadhar,
+        'name': patient.name,
+        'phone': patient.phone,
+        'email': patient.email
+    }
+
+
+class PatientCache:
+    """
+    Read-through cache of patient profiles keyed by Aadhar number.
+
+    Lookups try the in-process LRU, then the optional shared Django cache
+    (HEALTH_PATIENT_CACHE['BACKEND'], a CACHES alias), then the database.
+    Only found patients are cached, so patients created without signals
+    (e.g. bulk imports) are never hidden by a stale miss. Saves and deletes
+    invalidate entries through signals, again once their transaction has
+    committed; the TTL bounds how long another process's in-process copy
+    can lag behind.
+    """
+
+    def __init__(self, max_entries=10000, ttl=60, backend=None):
+        self.local = LRUCache(max_entries, ttl)
+        self.ttl = ttl
+        self.backend = caches[backend] if backend else None
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def key(aadhar):
+        return f'health:patient:{aadhar}'
+
+    @staticmethod
+    def login_key(name, phone):
+        return f"health:login:{phone}:{login_name(name)}"
+
+    def _lookup(self, key):
+        value = self.local.get(key)
+        if value is None and self.backend is not None:
+            value = self.backend.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def _count(self, hits=0, misses=0):
+        with self._stats_lock:
+            self.hits += hits
+            self.misses += misses
+
+    def _store(self, key, value):
+        self.local.set(key, value)
+        if self.backend is not None:
+            self.backend.set(key, value, self.ttl)
+
+    def get(self, aadhar):
+        """Return the patient's profile dict, or raise Patient.DoesNotExist"""
+        key = self.key(aadhar)
+        profile = self._lookup(key)
+        if profile is not None:
+            self._count(hits=1)
+            return profile
+        self._count(misses=1)
+        profile = profile_of(Patient.objects.get(aadhar=aadhar))
+        self._store(key, profile)
+        return profile
+
+    async def aget(self, aadhar):
+        """get() for async views; only a miss in the in-process LRU leaves the event loop"""
+        profile = self.local.get(self.key(aadhar))
+        if profile is not None:
+            self._count(hits=1)
+            return profile
+        return await sync_to_async(self.get)(aadhar)
+
+    def get_many(self, aadhars):
+        """Return {aadhar: profile} for those patients that exist, loading all misses in one query"""
+        found = {}
+        missing = []
+        for aadhar in set(aadhars):
+            profile = self._lookup(self.key(aadhar))
+            if profile is not None:
+                found[aadhar] = profile
+            else:
+                missing.append(aadhar)
+        self._count(hits=len(found), misses=len(missing))
+        if missing:
+            for patient in Patient.objects.filter(aadhar__in=missing):
+                profile = profile_of(patient)
+                self._store(self.key(patient.aadhar), profile)
+                found[patient.aadhar] = profile
+        return found
+
+    def get_by_login(self, name, phone):
+        """Return the profile for a patient login, or raise Patient.DoesNotExist"""
+        login_key = self.login_key(name, phone)
+        aadhar = self._lookup(login_key)
+        if aadhar is not None:
+            profile = self._lookup(self.key(aadhar))
+            # The name or phone may have changed since the login was cached
+            if profile is not None and self.login_key(profile['name'], profile['phone']) == login_key:
+                self._count(hits=1)
+                return profile
+        self._count(misses=1)
+        profile = profile_of(Patient.objects.matching_login(name, phone).get())
+        self._store(self.key(profile['aadhar']), profile)
+        self._store(login_key, profile['aadhar'])
+        return profile
+
+    def invalidate(self, aadhar):
+        key = self.key(aadhar)
+        self.local.delete(key)
+        if self.backend is not None:
+            self.backend.delete(key)
+
+    def clear(self):
+        self.local.clear()
+        with self._stats_lock:
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+            'entries': len(self.local),
+        }
+
+    def render_stats(self):
+        """stats() in the Prometheus text format, for /metrics; the counts are this process's"""
+        stats = self.stats()
+        lines = []
+        for name, kind, help_text, value in (
+            ('health_patient_cache_hits_total', 'counter', 'Patient lookups answered from the cache.', stats['hits']),
+            ('health_patient_cache_misses_total', 'counter', 'Patient lookups that went to the database.',
+             stats['misses']),
+            ('health_patient_cache_entries', 'gauge', 'Entries in the in-process patient cache.', stats['entries']),
+        ):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+@lru_cache(maxsize=None)
+def get_patient_cache():
+    """Return the process-wide PatientCache configured by settings.HEALTH_PATIENT_CACHE"""
+    config = getattr(settings, 'HEALTH_PATIENT_CACHE', {})
+    return PatientCache(
+        max_entries=config.get('MAX_ENTRIES', 10000),
+        ttl=config.get('TTL', 60),
+        backend=config.get('BACKEND'),
+    )
+
+
+@receiver(setting_changed)
+def _reset_patient_cache(setting, **kwargs):
+    if setting in ('HEALTH_PATIENT_CACHE', 'CACHES'):
+        get_patient_cache.cache_clear()
@@ -0,0 +1,170 @@
+"""
+Response compression.
+
+CompressionMiddleware compresses text and JSON responses above a size
+threshold with Brotli (when the optional ``brotli`` package is installed)
+or gzip. Images, PDFs and streamed files are left alone. Text-like medical
+files are immutable, so their gzip copy is made once in the background and
+kept in the blob store, like previews.
+"""
+import gzip
+import logging
+import re
+import shutil
+import tempfile
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection, transaction
+from django.dispatch import receiver
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from .blobstore import get_blob_store
+from .models import Blob
+from .previews import get_executor
+
+try:
+    import brotli  # Optional; gzip is used without it
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = {'application/json', 'application/xml', 'application/javascript', 'image/svg+xml'}
+ENCODING_RE = re.compile(r'^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?\s*$')
+
+
+def is_compressible(mime_type):
+    mime_type = mime_type.split(';')[0].strip().lower()
+    return mime_type.startswith('text/') or mime_type in COMPRESSIBLE_TYPES
+
+
+def accepted_encodings(header):
+    """The codings an Accept-Encoding header allows, ignoring those with q=0"""
+    accepted = set()
+    for part in (header or '').split(','):
+        match = ENCODING_RE.match(part)
+        if match and (match.group(2) is None or _quality(match.group(2)) > 0):
+            accepted.add(match.group(1).lower())
+    return accepted
+
+
+def _quality(value):
+    try:
+        return float(value)
+    except ValueError:
+        return 0
+
+
+def choose_encoding(request):
+    accepted = accepted_encodings(request.headers.get('Accept-Encoding'))
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=4)  # Fast enough to run per response
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+@lru_cache(maxsize=None)
+def get_config():
+    config = getattr(settings, 'HEALTH_COMPRESSION', {})
+    return {
+        'MIN_SIZE': config.get('MIN_SIZE', 1024),
+    }
+
+
+@receiver(setting_changed)
+def _reset_config(setting, **kwargs):
+    if setting == 'HEALTH_COMPRESSION':
+        get_config.cache_clear()
+
+
+class CompressionMiddleware:
+    """
+    Compress text and JSON responses of at least MIN_SIZE bytes.
+
+    JSON GET responses that set no Cache-Control get ``private, no-cache``,
+    so clients keep them but revalidate with the ETag added by
+    ConditionalGetMiddleware. Compressing weakens a strong ETag, as the
+    bytes sent are no longer the ones it was computed from.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '')
+        if response.streaming or not is_compressible(content_type):
+            return response
+        if (request.method in ('GET', 'HEAD') and content_type.startswith('application/json')
+                and not response.has_header('Cache-Control')):
+            patch_cache_control(response, private=True, no_cache=True)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if (response.status_code != 200 or response.has_header('Content-Encoding')
+                or len(response.content) < get_config()['MIN_SIZE']):
+            return response
+        encoding = choose_encoding(request)
+        if encoding is None:
+            return response
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+
+def schedule_compression(digest, mime_type):
+    """Queue making the gzip copy of a text-like blob once the current transaction commits"""
+    if is_compressible(mime_type):
+        transaction.on_commit(lambda: get_executor().submit(_compress_in_worker, digest))
+
+
+def _compress_in_worker(digest):
+    try:
+        compress_blob(digest)
+    finally:
+        connection.close()
+
+
+def compress_blob(digest):
+    """Store the gzip copy of one blob and record it on the Blob row"""
+    try:
+        if Blob.objects.filter(sha256=digest).exclude(gzip_hash='').exists():
+            return
+        store = get_blob_store()
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as out:
+            with store.open(digest) as source, gzip.GzipFile(fileobj=out, mode='wb', mtime=0) as target:
+                shutil.copyfileobj(source, target)
+            out.seek(0)
+            gzip_hash, _ = store.put(out)
+        Blob.objects.filter(sha256=digest).update(gzip_hash=gzip_hash)
+    except Exception:
+        logger.exception('Compression failed for %s', digest)
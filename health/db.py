@@ -0,0 +1,75 @@
+import contextvars
+import functools
+import inspect
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+READ_ONLY_ALIAS = 'readonly'
+
+_read_only = contextvars.ContextVar('health_read_only', default=False)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """Apply settings.HEALTH_SQLITE_PRAGMAS to every new SQLite connection"""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'HEALTH_SQLITE_PRAGMAS', {})
+    read_only = 'mode=ro' in str(connection.settings_dict['NAME'])
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            if name == 'journal_mode' and read_only:
+                continue  # Persistent, and set by the writable connection
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def read_only(view):
+    """
+    Route the ORM reads a view makes to the read-only database, when configured.
+
+    Works for sync and async views; the flag lives in a context variable so
+    it follows the request into sync_to_async threads.
+    """
+    if inspect.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            token = _read_only.set(True)
+            try:
+                return await view(*args, **kwargs)
+            finally:
+                _read_only.reset(token)
+    else:
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            token = _read_only.set(True)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                _read_only.reset(token)
+    return wrapper
+
+
+class ReadOnlyRouter:
+    """Send reads made inside @read_only views to the 'readonly' database"""
+
+    def db_for_read(self, model, **hints):
+        if not _read_only.get() or READ_ONLY_ALIAS not in settings.DATABASES:
+            return None
+        # Under the test runner the alias is a mirror of 'default', and only
+        # the default connection sees the data of the running test
+        if connections[READ_ONLY_ALIAS].settings_dict['NAME'] == connections[DEFAULT_DB_ALIAS].settings_dict['NAME']:
+            return None
+        return READ_ONLY_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Never follow an instance back to the connection it was read from
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # Both aliases are the same database file
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != READ_ONLY_ALIAS
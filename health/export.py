@@ -0,0 +1,268 @@
+"""
+A patient's whole record as one ZIP, for handing over when they move.
+
+The archive holds ``manifest.json`` (profile, appointments and file
+metadata) and every medical file's original bytes. It is generated while
+it is read, so memory use does not depend on the size of the record.
+Members are stored uncompressed and their sizes are known before any
+byte is read, so the archive's length and layout are fixed up front: the
+stream can be seeked, which is what lets an interrupted download resume
+with a Range request. Each blob's CRC-32 is stored the first time an
+export reads it, so a resumed download of files exported before does not
+read them again.
+"""
+import hashlib
+import io
+import json
+import os
+import re
+import struct
+import tempfile
+import zlib
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable, Optional
+
+from django.utils import timezone
+
+from .cache import profile_of
+from .http import file_size
+from .models import Blob, MedicalFile, Patient
+from .sync import appointment_data, file_data
+
+CHUNK_SIZE = 64 * 1024
+ZIP_LIMIT = 0xFFFFFFFF  # Sizes and offsets beyond this need ZIP64, which is not written
+UNSAFE_NAME_RE = re.compile(r'[^\w.() -]+')
+
+# Flags: sizes and CRC follow the data (bit 3), names are UTF-8 (bit 11)
+FLAGS = 0x0808
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+DATA_DESCRIPTOR = struct.Struct('<IIII')
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+END_OF_CENTRAL_DIRECTORY = struct.Struct('<IHHHHIIH')
+
+
+@dataclass
+class ZipMember:
+    name: str
+    size: int
+    modified: object  # Aware datetime
+    open: Callable  # Returns a binary file object with exactly ``size`` bytes
+    crc: Optional[int] = None  # CRC-32 of the content, if already known
+    on_crc: Optional[Callable] = None  # Called with the CRC-32 once it has been computed
+
+
+def _dos_time(moment):
+    moment = timezone.localtime(moment)
+    if moment.year < 1980:
+        return 0, (1 << 5) | 1  # 1980-01-01, the earliest a ZIP can record
+    return ((moment.hour << 11) | (moment.minute << 5) | (moment.second // 2),
+            ((moment.year - 1980) << 9) | (moment.month << 5) | moment.day)
+
+
+class ZipStream(io.RawIOBase):
+    """
+    A stored (uncompressed) ZIP archive of ``members``, generated as it is read.
+
+    Seeking is free. Reading from an offset inside the archive skips the
+    members before it and starts the member it falls in from the offset,
+    but the CRC-32 of every member, needed for data descriptors and the
+    central directory, must be known: members whose ``crc`` was not given
+    are re-read, without sending, and ``on_crc`` is told the result.
+    """
+
+    def __init__(self, members):
+        self.members = members
+        self.crcs = {index: member.crc for index, member in enumerate(members) if member.crc is not None}
+        self.headers = []
+        offset = 0
+        for member in members:
+            name = member.name.encode()
+            time, date = _dos_time(member.modified)
+            self.headers.append((offset, name, time, date))
+            offset += LOCAL_HEADER.size + len(name) + member.size + DATA_DESCRIPTOR.size
+        self.central_directory_offset = offset
+        self.size = offset + sum(CENTRAL_HEADER.size + len(name) for _, name, _, _ in self.headers)
+        self.size += END_OF_CENTRAL_DIRECTORY.size
+        if self.size > ZIP_LIMIT or len(members) > 0xFFFF:
+            raise ValueError('Record is too large to export as one ZIP')
+        self._position = 0
+        self._chunks = None
+        self._pending = b''
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError('Negative seek position')
+        if offset != self._position:
+            self._stop()
+            self._position = offset
+        return offset
+
+    def readinto(self, buffer):
+        if self._chunks is None:
+            self._chunks = self._generate(self._position)
+        while not self._pending:
+            self._pending = next(self._chunks, None)
+            if self._pending is None:
+                self._pending = b''
+                return 0
+        count = min(len(buffer), len(self._pending))
+        buffer[:count] = self._pending[:count]
+        self._pending = self._pending[count:]
+        self._position += count
+        return count
+
+    def close(self):
+        self._stop()
+        super().close()
+
+    def _stop(self):
+        if self._chunks is not None:
+            self._chunks.close()  # Closes the member being read
+        self._chunks = None
+        self._pending = b''
+
+    def _generate(self, start):
+        """Yield the archive's bytes from offset ``start`` on"""
+        for index, (member, (offset, name, time, date)) in enumerate(zip(self.members, self.headers)):
+            data_offset = offset + LOCAL_HEADER.size + len(name)
+            end = data_offset + member.size + DATA_DESCRIPTOR.size
+            if end <= start and index in self.crcs:
+                continue
+            header = LOCAL_HEADER.pack(0x04034b50, 20, FLAGS, 0, time, date, 0, 0, 0, len(name), 0) + name
+            yield from _part(header, offset, start)
+            crc = yield from self._member_data(member, data_offset, start, self.crcs.get(index))
+            if index not in self.crcs and member.on_crc:
+                member.on_crc(crc)
+            self.crcs[index] = crc
+            descriptor = DATA_DESCRIPTOR.pack(0x08074b50, crc, member.size, member.size)
+            yield from _part(descriptor, data_offset + member.size, start)
+
+        entries = []
+        for index, (member, (offset, name, time, date)) in enumerate(zip(self.members, self.headers)):
+            entries.append(CENTRAL_HEADER.pack(
+                0x02014b50, 20, 20, FLAGS, 0, time, date, self.crcs[index], member.size, member.size,
+                len(name), 0, 0, 0, 0, 0o100644 << 16, offset,
+            ) + name)
+        central_directory = b''.join(entries)
+        end_record = END_OF_CENTRAL_DIRECTORY.pack(0x06054b50, 0, 0, len(entries), len(entries),
+                                                   len(central_directory), self.central_directory_offset, 0)
+        yield from _part(central_directory + end_record, self.central_directory_offset, start)
+
+    def _member_data(self, member, offset, start, crc=None):
+        """Yield a member's bytes from ``start`` on and return its CRC-32, reading all of it unless known"""
+        read = 0 if crc is None else min(max(0, start - offset), member.size)
+        computed = 0
+        with member.open() as source:
+            if read:
+                source.seek(read)
+            while chunk := source.read(CHUNK_SIZE):
+                if crc is None:
+                    computed = zlib.crc32(chunk, computed)
+                yield from _part(chunk, offset + read, start)
+                read += len(chunk)
+        if read != member.size:
+            raise OSError(f'{member.name} is {read} bytes, expected {member.size}')
+        return computed if crc is None else crc
+
+
+def _part(data, offset, start):
+    """Yield what of ``data``, found at ``offset`` in the archive, lies at or after ``start``"""
+    if offset + len(data) > start:
+        yield data[max(0, start - offset):]
+
+
+def _open_legacy(file_id):
+    # Loaded when the member is read, so only one data URL is held at a time
+    return MedicalFile.objects.only('content_hash', 'file_data').get(pk=file_id).open()
+
+
+def _remember_crc(digest, crc):
+    Blob.objects.filter(sha256=digest).update(crc32=crc)
+
+
+def _safe_name(name):
+    return UNSAFE_NAME_RE.sub('_', name).strip(' .') or 'file'
+
+
+def patient_archive(aadhar):
+    """
+    Return (ZipStream, ETag) for a patient's record.
+
+    Raises Patient.DoesNotExist, or ValueError if the record needs ZIP64.
+    The ETag is a digest of the manifest, which lists every file's hash.
+    """
+    patient = Patient.objects.get(aadhar=aadhar)
+    files = list(patient.medical_files.defer('file_data').order_by('uploaded_at', 'id'))
+    appointments = list(patient.appointments.order_by('appointment_date', 'appointment_time', 'id'))
+    blobs = {digest: (size, crc) for digest, size, crc in
+             Blob.objects.filter(sha256__in={f.content_hash for f in files if f.content_hash})
+             .values_list('sha256', 'size', 'crc32')}
+
+    members = []
+    listed = []
+    for index, medical_file in enumerate(files, start=1):
+        digest = medical_file.content_hash
+        if digest:
+            size, crc = blobs.get(digest, (medical_file.file_size, None))
+            on_crc = partial(_remember_crc, digest) if digest in blobs else None
+            open_member = medical_file.open
+        else:
+            open_member = partial(_open_legacy, medical_file.pk)  # Still a data URL in the database
+            with open_member() as legacy:
+                size = file_size(legacy)
+            crc = on_crc = None
+        path = f'files/{index:04d}-{_safe_name(medical_file.file_name)}'
+        members.append(ZipMember(path, size, medical_file.uploaded_at, open_member, crc, on_crc))
+        listed.append({**file_data(medical_file), 'path': path, 'size': size,
+                       'sha256': medical_file.content_hash or None})
+
+    manifest = json.dumps({
+        'format': 'health-record',
+        'version': 1,
+        'patient': {**profile_of(patient), 'registered_at': timezone.localtime(patient.created_at).isoformat()},
+        'appointments': [appointment_data(appointment) for appointment in appointments],
+        'files': listed,
+    }, indent=2, ensure_ascii=False).encode()
+    modified = max([patient.created_at] + [f.uploaded_at for f in files] + [a.updated_at for a in appointments])
+    members.insert(0, ZipMember('manifest.json', len(manifest), modified, lambda: io.BytesIO(manifest),
+                                zlib.crc32(manifest)))
+
+    etag = f'"{hashlib.sha256(manifest).hexdigest()[:32]}"'
+    return ZipStream(members), etag
+
+
+def export_to_file(aadhar, directory, overwrite=False):
+    """
+    Write ``<directory>/<aadhar>.zip``; return its size, or None if it already existed.
+
+    The archive is written to a temporary file and renamed into place, so an
+    interrupted bulk export never leaves a partial ZIP behind.
+    """
+    path = os.path.join(directory, f'{aadhar}.zip')
+    if not overwrite and os.path.exists(path):
+        return None
+    stream, _ = patient_archive(aadhar)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out, stream:
+            while chunk := stream.read(CHUNK_SIZE):
+                out.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return stream.size
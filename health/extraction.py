@@ -0,0 +1,80 @@
+import logging
+
+from django.db import connection, transaction
+
+from .blobstore import get_blob_store
+from .previews import get_executor
+from .search import set_medical_file_text
+
+try:
+    import fitz  # PyMuPDF, optional, extracts the text layer of PDFs
+except ImportError:
+    fitz = None
+
+logger = logging.getLogger(__name__)
+
+MAX_TEXT_BYTES = 1024 * 1024  # Only the start of long documents is indexed
+MAX_PDF_PAGES = 50
+
+_extractors = {}
+
+
+def register_extractor(*mime_types):
+    """
+    Register a function ``extract(fileobj) -> str`` for the given MIME types.
+
+    A type ending in ``/*`` matches every subtype, e.g. ``text/*``.
+    """
+    def decorator(func):
+        for mime_type in mime_types:
+            _extractors[mime_type] = func
+        return func
+    return decorator
+
+
+def get_extractor(mime_type):
+    return _extractors.get(mime_type) or _extractors.get(mime_type.split('/')[0] + '/*')
+
+
+@register_extractor('text/*', 'application/json', 'application/xml')
+def extract_plain_text(fileobj):
+    return fileobj.read(MAX_TEXT_BYTES).decode('utf-8', errors='replace')
+
+
+if fitz is not None:
+    @register_extractor('application/pdf')
+    def extract_pdf_text(fileobj):
+        parts = []
+        size = 0
+        with fitz.open(stream=fileobj.read(), filetype='pdf') as doc:
+            for page in doc.pages(0, min(len(doc), MAX_PDF_PAGES)):
+                text = page.get_text()
+                parts.append(text)
+                size += len(text)
+                if size >= MAX_TEXT_BYTES:
+                    break
+        return ''.join(parts)[:MAX_TEXT_BYTES]
+
+
+def schedule_extraction(medical_file):
+    """Queue text extraction for a file once the current transaction commits"""
+    if medical_file.content_hash and get_extractor(medical_file.file_type):
+        file_id, digest, mime_type = medical_file.pk, medical_file.content_hash, medical_file.file_type
+        transaction.on_commit(lambda: get_executor().submit(_extract_in_worker, file_id, digest, mime_type))
+
+
+def _extract_in_worker(file_id, digest, mime_type):
+    try:
+        extract_text(file_id, digest, mime_type)
+    finally:
+        connection.close()
+
+
+def extract_text(file_id, digest, mime_type):
+    """Extract a file's text from the blob store into the record search index"""
+    try:
+        with get_blob_store().open(digest) as fileobj:
+            text = get_extractor(mime_type)(fileobj)
+        set_medical_file_text(file_id, ' '.join(text.split()))
+    except Exception:
+        logger.exception('Text extraction failed for file %s', file_id)
@@ -0,0 +1,165 @@
+import io
+import re
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range ``Range`` header into an inclusive (start, end) pair.
+
+    Returns None when the header is absent or not something we serve as a
+    partial response (e.g. multiple ranges), and raises ValueError when the
+    range cannot be satisfied for a file of ``size`` bytes.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise ValueError('Unsatisfiable range')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError('Unsatisfiable range')
+    return start, end
+
+
+class FileRange(io.RawIOBase):
+    """Read-only view of ``length`` bytes of a file starting at ``start``"""
+
+    def __init__(self, fileobj, start, length):
+        self.fileobj = fileobj
+        self.remaining = length
+        fileobj.seek(start)
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.fileobj.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.fileobj.close()
+        super().close()
+
+
+def file_size(fileobj):
+    position = fileobj.tell()
+    fileobj.seek(0, io.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(position)
+    return size
+
+
+def request_body(request, max_size):
+    """
+    The request body, inflated if the client sent it gzip-compressed.
+
+    Raises ValueError for an unsupported Content-Encoding, a corrupt body,
+    or one that inflates beyond ``max_size`` bytes.
+    """
+    encoding = request.headers.get('Content-Encoding', '').strip().lower()
+    if encoding in ('', 'identity'):
+        return request.body
+    if encoding != 'gzip':
+        raise ValueError(f'Unsupported Content-Encoding {encoding}')
+    inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        body = inflater.decompress(request.body, max_size)
+    except zlib.error:
+        raise ValueError('Body is not valid gzip')
+    if inflater.unconsumed_tail:
+        raise ValueError('Body is too large')
+    return body
+
+
+def etag_matches(request, etag):
+    """Whether If-None-Match lists ``etag``, compared weakly as RFC 9110 asks for GET"""
+    header = request.headers.get('If-None-Match')
+    if not header or not etag:
+        return False
+    if header.strip() == '*':
+        return True
+    return etag.removeprefix('W/') in {tag.removeprefix('W/') for tag in parse_etags(header)}
+
+
+def not_modified(etag, cache_control=None):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    if cache_control:
+        response['Cache-Control'] = cache_control
+    return response
+
+
+def ranged_file_response(request, fileobj, content_type, filename, as_attachment=False, etag=None):
+    """
+    Stream a file, answering single-range requests with 206 Partial Content.
+
+    With ``etag`` given, a Range sent with an If-Range that no longer
+    matches gets the whole file, as the client's part is stale.
+    """
+    size = file_size(fileobj)
+    range_header = request.headers.get('Range')
+    if range_header and request.headers.get('If-Range') not in (None, etag):
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        fileobj.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        response = FileResponse(fileobj, content_type=content_type,
+                                as_attachment=as_attachment, filename=filename)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(FileRange(fileobj, start, length), status=206,
+                                content_type=content_type,
+                                as_attachment=as_attachment, filename=filename)
+        response['Content-Length'] = length
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    if etag:
+        response['ETag'] = etag
+    return response
+
+
+async def aread_chunks(fileobj, chunk_size):
+    """Async iterator over a file's chunks; each read runs in a worker thread"""
+    read = sync_to_async(fileobj.read, thread_sensitive=False)
+    while chunk := await read(chunk_size):
+        yield chunk
+
+
+def stream_async(request, response):
+    """
+    Under ASGI, serve a FileResponse from an async iterator.
+
+    Django would otherwise read a synchronous file iterator to the end in one
+    go before sending anything to an ASGI server. Under WSGI the response is
+    returned unchanged.
+    """
+    if isinstance(request, ASGIRequest) and isinstance(response, FileResponse) and response.file_to_stream:
+        response.streaming_content = aread_chunks(response.file_to_stream, response.block_size)
+    return response
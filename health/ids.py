@@ -0,0 +1,106 @@
+import os
+import re
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+
+class IdAllocator:
+    """
+    Hands out sequential, zero-padded codes such as ``DOC000042``.
+
+    Values come from a row in IdSequence. Outside a transaction each process
+    reserves a block of HEALTH_ID_BLOCK_SIZE values with one UPDATE and then
+    serves codes from memory, so inserts need no lookups and never retry.
+    Inside a transaction only a single value is taken, so that a rollback
+    returns it to the sequence instead of leaving this process holding a
+    block another process may also be given.
+
+    Codes issued before the allocator existed (e.g. ``DOC1234``) have
+    ``legacy_width`` digits, fewer than ``width``, so they can never collide
+    with new ones and are left as typed by parse().
+    """
+
+    def __init__(self, name, prefix, width, legacy_width=None):
+        self.name = name
+        self.prefix = prefix
+        self.width = width
+        self.legacy_width = legacy_width
+        self.pattern = re.compile(rf'^{prefix}(\d+)$')
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+
+    def format(self, value):
+        return f"{self.prefix}{value:0{self.width}d}"
+
+    def parse(self, raw):
+        """
+        Normalise a typed code; anything not of the form prefix + digits is
+        only trimmed and upper-cased.
+
+        Accepted, ignoring case and surrounding spaces:
+        - a full new-style code, ``DOC000042``
+        - a new-style code without its leading zeros, ``DOC42`` or
+          ``DOC12345``, padded back to ``width`` digits
+        - a legacy code of exactly ``legacy_width`` digits, ``DOC1234``,
+          kept as typed; new code 1234 must be typed in full, ``DOC001234``
+        """
+        code = raw.strip().upper()
+        match = self.pattern.match(code)
+        if not match:
+            return code
+        digits = match.group(1)
+        if len(digits) < self.width and len(digits) != self.legacy_width:
+            return self.format(int(digits))
+        return code
+
+    def _reserve(self, count):
+        from .models import IdSequence
+
+        # UPDATE first so the write lock is taken before anything is read
+        with transaction.atomic():
+            sequence = IdSequence.objects.filter(name=self.name)
+            if not sequence.update(next_value=F('next_value') + count):
+                IdSequence.objects.get_or_create(name=self.name)
+                sequence.update(next_value=F('next_value') + count)
+            end = sequence.values_list('next_value', flat=True).get()
+        return end - count, end
+
+    def reserve_codes(self, count):
+        """Reserve ``count`` consecutive codes at once, e.g. for a bulk insert"""
+        start, end = self._reserve(count)
+        return [self.format(value) for value in range(start, end)]
+
+    def reset(self):
+        """Drop the reserved block, e.g. in a freshly forked worker process"""
+        self._next = self._end = 0
+
+    def next(self):
+        if connection.in_atomic_block:
+            start, _ = self._reserve(1)
+            return self.format(start)
+        with self._lock:
+            if self._next >= self._end:
+                self._next, self._end = self._reserve(getattr(settings, 'HEALTH_ID_BLOCK_SIZE', 100))
+            value = self._next
+            self._next += 1
+        return self.format(value)
+
+
+DOCTOR_IDS = IdAllocator('doctor', 'DOC', 6, legacy_width=4)
+WORKER_IDS = IdAllocator('worker', 'WRK', 6, legacy_width=4)
+APPOINTMENT_CODES = IdAllocator('appointment', 'APT', 8, legacy_width=6)
+
+
+def _reset_after_fork():
+    for allocator in (DOCTOR_IDS, WORKER_IDS, APPOINTMENT_CODES):
+        allocator._lock = threading.Lock()
+        allocator.reset()
+
+
+# A block reserved before a pre-forking server forks must not be shared by its workers
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
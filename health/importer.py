@@ -0,0 +1,124 @@
+import csv
+import json
+from dataclasses import dataclass, field
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from .models import Patient, SyncChange
+from .validation import clean_patient
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    duplicates: int = 0
+    rows: int = 0  # Last row number processed (1-based, header excluded)
+    errors: list = field(default_factory=list)  # (row number, aadhar, message)
+
+
+def read_records(lines, fmt):
+    """Yield dicts from an iterable of text lines in CSV (with header) or JSONL format"""
+    if fmt == 'csv':
+        yield from csv.DictReader(lines)
+    elif fmt == 'jsonl':
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                record = None
+            yield record if isinstance(record, dict) else {'_invalid': line}
+    else:
+        raise ValueError(f'Unsupported format: {fmt}')
+
+
+def import_patients(records, batch_size=DEFAULT_BATCH_SIZE, skip_rows=0, on_batch=None):
+    """
+    Validate and insert patient records in batches.
+
+    Each batch is checked against existing aadhar numbers with one query and
+    written with bulk_create in its own transaction (row by row if a patient
+    was registered in between), so an interrupted import can be resumed by passing the last reported row count as ``skip_rows``.
+    ``on_batch`` is called with the running ImportResult after every commit.
+    """
+    result = ImportResult(rows=skip_rows)
+    batch = []
+
+    for row_number, record in enumerate(records, start=1):
+        if row_number <= skip_rows:
+            continue
+        batch.append((row_number, record))
+        if len(batch) >= batch_size:
+            _import_batch(batch, result)
+            batch = []
+            if on_batch:
+                on_batch(result)
+
+    if batch:
+        _import_batch(batch, result)
+        if on_batch:
+            on_batch(result)
+    return result
+
+
+def _import_batch(batch, result):
+    valid = {}
+    for row_number, record in batch:
+        if '_invalid' in record:
+            result.errors.append((row_number, '', 'Invalid JSON data'))
+            continue
+        try:
+            fields = clean_patient(record)
+        except ValidationError as e:
+            result.errors.append((row_number, str(record.get('aadhar') or ''), e.messages[0]))
+            continue
+        if fields['aadhar'] in valid:
+            result.duplicates += 1
+            result.errors.append((row_number, fields['aadhar'], 'Duplicate Aadhar in import'))
+            continue
+        valid[fields['aadhar']] = (row_number, fields)
+
+    with transaction.atomic():
+        existing = set(Patient.objects.filter(aadhar__in=list(valid)).values_list('aadhar', flat=True))
+        new_patients = [Patient(**fields) for aadhar, (_, fields) in valid.items() if aadhar not in existing]
+        new_patients = _insert_patients(new_patients, existing)
+        SyncChange.record_many('patient', [patient.aadhar for patient in new_patients])
+
+    for aadhar in existing:
+        result.errors.append((valid[aadhar][0], aadhar, 'Patient with this Aadhar already exists'))
+    result.errors.sort()
+    result.created += len(new_patients)
+    result.duplicates += len(existing)
+    result.rows = batch[-1][0]
+
+
+def _insert_patients(patients, existing):
+    """
+    Insert patients, returning those written.
+
+    A patient registered since the existence check makes the bulk insert
+    fail; the batch is then inserted row by row and such patients are added
+    to ``existing`` instead of aborting the import.
+    """
+    try:
+        with transaction.atomic():
+            Patient.objects.bulk_create(patients)
+        return patients
+    except IntegrityError:
+        pass
+
+    inserted = []
+    for patient in patients:
+        try:
+            with transaction.atomic():
+                Patient.objects.bulk_create([patient])
+        except IntegrityError:
+            existing.add(patient.aadhar)
+        else:
+            inserted.append(patient)
+    return inserted
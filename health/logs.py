@@ -0,0 +1,189 @@
+"""
+Logging that stays off the request thread.
+
+QueuedFileHandler puts records on an in-memory queue; a listener thread
+formats them and writes them to a size-rotated file. Formatters redact
+Aadhar and phone numbers. AccessLogMiddleware writes one JSON line per
+request (or a sample of them) to the ``health.access`` logger.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .metrics import UNMATCHED, response_size
+
+access_logger = logging.getLogger('health.access')
+
+AADHAR_RE = re.compile(r'(?<!\d)\d{4}[ -]?\d{4}[ -]?(\d{4})(?!\d)')
+PHONE_RE = re.compile(r'(?<!\d)[6-9]\d{5}(\d{4})(?!\d)')
+REQUEST_ID_RE = re.compile(r'^[\w.-]{1,64}$')
+
+# Attributes of access log records copied into the JSON line
+ACCESS_FIELDS = ('request_id', 'method', 'route', 'path', 'status', 'latency_ms', 'request_bytes', 'response_bytes')
+
+
+def redact(text):
+    """Mask Aadhar and mobile numbers, keeping their last four digits"""
+    return PHONE_RE.sub(r'XXXXXX\1', AADHAR_RE.sub(r'XXXXXXXX\1', text))
+
+
+class RedactingFormatter(logging.Formatter):
+    def format(self, record):
+        return redact(super().format(record))
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the access log fields when present"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for name in ACCESS_FIELDS:
+            if hasattr(record, name):
+                entry[name] = getattr(record, name)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return redact(json.dumps(entry, default=str))
+
+
+class QueuedFileHandler(QueueHandler):
+    """
+    Hand records to a background thread that writes them to a rotating file.
+
+    The file is rotated at ``max_bytes`` and ``backup_count`` old files are
+    kept, so it never grows without bound. When the queue is full records
+    are dropped and counted rather than blocking the caller. Rotation is
+    per process, so processes must not share a file: ``{pid}`` in
+    ``filename`` is replaced by the process id.
+    """
+
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, backup_count=5, queue_size=10000):
+        super().__init__(queue.Queue(queue_size))
+        filename = str(filename).replace('{pid}', str(os.getpid()))
+        self.target = RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count,
+                                          encoding='utf-8', delay=True)
+        self.dropped = 0
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+        atexit.register(self.close)
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the listener thread
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Fix the message now, as its arguments may change after we return
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.stop()  # Writes out what is still queued
+            self.listener = None
+            self.target.close()
+        super().close()
+
+
+@lru_cache(maxsize=None)
+def get_config():
+    config = getattr(settings, 'HEALTH_ACCESS_LOG', {})
+    return {
+        'ENABLED': config.get('ENABLED', True),
+        'SAMPLE_RATE': config.get('SAMPLE_RATE', 1.0),
+        'SLOW_MS': config.get('SLOW_MS', 1000),
+    }
+
+
+@receiver(setting_changed)
+def _reset_config(setting, **kwargs):
+    if setting == 'HEALTH_ACCESS_LOG':
+        get_config.cache_clear()
+
+
+class AccessLogMiddleware:
+    """
+    Log each request to ``health.access`` and tag it with a request id.
+
+    A client-sent X-Request-ID is kept, otherwise one is generated; it is
+    returned in the response. Only SAMPLE_RATE of the requests are logged,
+    but server errors and requests slower than SLOW_MS always are.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not get_config()['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        began = self.start(request)
+        response = self.get_response(request)
+        self.finish(request, response, began)
+        return response
+
+    async def __acall__(self, request):
+        began = self.start(request)
+        response = await self.get_response(request)
+        self.finish(request, response, began)
+        return response
+
+    def start(self, request):
+        request_id = request.headers.get('X-Request-ID', '')
+        request.request_id = request_id if REQUEST_ID_RE.match(request_id) else uuid.uuid4().hex
+        return time.perf_counter()
+
+    def finish(self, request, response, began):
+        latency_ms = (time.perf_counter() - began) * 1000
+        response['X-Request-ID'] = request.request_id
+        config = get_config()
+        if (response.status_code < 500 and latency_ms < config['SLOW_MS']
+                and random.random() >= config['SAMPLE_RATE']):
+            return
+        if not access_logger.isEnabledFor(logging.INFO):
+            return
+        match = request.resolver_match
+        length = request.META.get('CONTENT_LENGTH', '')
+        access_logger.info('%s %s %s', request.method, request.path, response.status_code, extra={
+            'request_id': request.request_id,
+            'method': request.method,
+            'route': match.view_name if match else UNMATCHED,
+            'path': request.path,
+            'status': response.status_code,
+            'latency_ms': round(latency_ms, 2),
+            'request_bytes': int(length) if length.isdigit() else 0,
+            'response_bytes': response_size(response),
+        })
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from health.archive import archivable_blobs, archive_blob, archive_data_urls, cold_files, get_config
+from health.models import MedicalFile
+
+
+class Command(BaseCommand):
+    help = ('Move the bytes of old files, and of patients inactive for a long time, from the blob store '
+            'and the database into the cold archive. Archived files can still be downloaded.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age-days', type=int, help='Archive files uploaded this long ago')
+        parser.add_argument('--inactive-days', type=int,
+                            help='Archive all files of patients without activity for this long')
+        parser.add_argument('--batch-size', type=int, help='Number of files moved per transaction')
+        parser.add_argument('--limit', type=int, help='Stop after archiving this many files and blobs')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be archived')
+        parser.add_argument('--no-vacuum', action='store_true',
+                            help='Skip the VACUUM after data URL rows are moved')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size'] or get_config()['BATCH_SIZE']
+        limit = options['limit']
+        if batch_size < 1 or (limit is not None and limit < 1):
+            raise CommandError('--batch-size and --limit must be at least 1')
+        cold = cold_files(options['min_age_days'], options['inactive_days'])
+        legacy = (MedicalFile.objects
+                  .filter(cold, content_hash='')
+                  .exclude(file_data='')
+                  .order_by('pk')
+                  .only('pk', 'file_data', 'file_type', 'file_size'))
+        blobs = archivable_blobs(cold)
+
+        if options['dry_run']:
+            self.stdout.write(f"Would archive {legacy.count()} data URL files and {blobs.count()} blobs")
+            return
+
+        archived = failed = freed = legacy_freed = 0
+        last_pk = None
+        while limit is None or archived < limit:
+            batch_qs = legacy if last_pk is None else legacy.filter(pk__gt=last_pk)
+            size = batch_size if limit is None else min(batch_size, limit - archived)
+            batch = list(batch_qs[:size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            moved, batch_freed = archive_data_urls(batch)
+            failed += len(batch) - moved
+            archived += moved
+            legacy_freed += batch_freed
+            self.stdout.write(f"Archived {archived} data URL files")
+        legacy_archived = archived
+        freed += legacy_freed
+
+        last_digest = ''
+        while limit is None or archived < limit:
+            size = batch_size if limit is None else min(batch_size, limit - archived)
+            digests = list(blobs.filter(sha256__gt=last_digest).values_list('sha256', flat=True)[:size])
+            if not digests:
+                break
+            last_digest = digests[-1]
+            for digest in digests:
+                try:
+                    freed += archive_blob(digest)
+                    archived += 1
+                except (OSError, ValueError) as e:
+                    failed += 1
+                    self.stderr.write(f"{digest}: {e}")
+            self.stdout.write(f"Archived {archived - legacy_archived} blobs")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {legacy_archived} data URL files and {archived - legacy_archived} blobs "
+            f"({freed / 1024 / 1024:.1f} MB freed), {failed} failed"))
+
+        if (legacy_freed and not options['no_vacuum'] and connection.vendor == 'sqlite'
+                and not connection.in_atomic_block):
+            self.stdout.write('Running VACUUM')
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM')
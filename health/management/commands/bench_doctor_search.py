@@ -0,0 +1,63 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from health.models import Doctor
+from health.search import rebuild_doctor_index, search_doctors
+
+FIRST_NAMES = ['Asha', 'Ravi', 'Meera', 'Arjun', 'Lakshmi', 'Suresh', 'Anjali', 'Vikram', 'Priya', 'Manoj',
+               'Deepa', 'Rahul', 'Kavya', 'Sanjay', 'Nisha', 'Gopal', 'Fatima', 'Joseph', 'Shreya', 'Imran']
+LAST_NAMES = ['Nair', 'Menon', 'Pillai', 'Kumar', 'Sharma', 'Iyer', 'Das', 'Reddy', 'Khan', 'Thomas',
+              'Varghese', 'Patel', 'Singh', 'Rao', 'Bose', 'Gupta', 'Mathew', 'Joshi', 'Ali', 'Verma']
+HOSPITALS = ['General Hospital', 'Medical College', 'District Hospital', 'Taluk Hospital', 'Community Health Centre']
+CITIES = ['Kochi', 'Thrissur', 'Kozhikode', 'Kollam', 'Kannur', 'Palakkad', 'Alappuzha', 'Kottayam', 'Malappuram']
+QUERIES = ['asha', 'menon', 'kochi', 'meera nair', 'medcal colege', 'ravi kumr', 'thrisur', 'distr',
+           'lakshmi pillai kollam', 'vikram']
+
+
+class Command(BaseCommand):
+    help = ('Seed a large doctor directory and time /api/doctors/search queries. '
+            'Run against a scratch database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the seeded doctors instead of deleting them')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        specializations = [code for code, _ in Doctor.SPECIALIZATIONS]
+        count = options['doctors']
+
+        start = time.perf_counter()
+        ids = [f'BENCH{i:09d}' for i in range(count)]
+        for offset in range(0, count, 5000):
+            Doctor.objects.bulk_create([
+                Doctor(doctor_id=doctor_id, name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                       specialization=rng.choice(specializations),
+                       hospital=f'{rng.choice(HOSPITALS)} {rng.choice(CITIES)}')
+                for doctor_id in ids[offset:offset + 5000]
+            ])
+        rebuild_doctor_index()
+        self.stdout.write(f"Seeded and indexed {count} doctors in {time.perf_counter() - start:.1f}s")
+
+        try:
+            for query in QUERIES:
+                timings = []
+                for _ in range(options['repeat']):
+                    began = time.perf_counter()
+                    results = search_doctors(query, limit=20)
+                    timings.append((time.perf_counter() - began) * 1000)
+                top = results[0] if results else None
+                self.stdout.write(
+                    f"{query!r:>26}  median {statistics.median(timings):6.2f} ms  "
+                    f"max {max(timings):6.2f} ms  top: {top.name + ', ' + top.hospital if top else '-'}"
+                )
+        finally:
+            if not options['keep']:
+                for offset in range(0, count, 500):
+                    Doctor.objects.filter(doctor_id__in=ids[offset:offset + 500]).delete()
+                rebuild_doctor_index()
@@ -0,0 +1,93 @@
+import json
+import platform
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from health import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Drive every route in health.urls concurrently against a running server and '
+            'report throughput and p50/p95/p99 latency. Seed the server\'s database with '
+            'seed_bench_data first. With --baseline, exits non-zero on a regression.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per route')
+        parser.add_argument('--warmup', type=int, default=10, help='Untimed requests per route first')
+        parser.add_argument('--routes', nargs='+', metavar='NAME', help='Only these URL names')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='Compare against results written by an earlier run')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed p95 growth over the baseline, as a fraction (default 0.2)')
+        parser.add_argument('--min-delta', type=float, default=2.0,
+                            help='Ignore p95 growth below this many milliseconds (default 2)')
+
+    def handle(self, *args, **options):
+        if urlsplit(options['url']).scheme != 'http':
+            raise CommandError('Only http:// URLs are supported')
+        names = options['routes'] or sorted(benchmark.ROUTES)
+        unknown = set(names) - set(benchmark.ROUTES)
+        if unknown:
+            raise CommandError(f"No benchmark for {', '.join(sorted(unknown))}")
+        uncovered = benchmark.url_names() - set(benchmark.ROUTES)
+        for name in sorted(uncovered):
+            self.stdout.write(self.style.WARNING(f'Route {name} has no benchmark'))
+
+        try:
+            fixture = benchmark.load_fixture()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"{len(names)} routes, {options['requests']} requests each at concurrency "
+                          f"{options['concurrency']} against {options['url']}")
+        routes = {}
+        for name in names:
+            if options['warmup']:
+                benchmark.run_route(options['url'], name, fixture, options['warmup'],
+                                    min(options['concurrency'], options['warmup']), seed=options['seed'] + 1)
+            stats = benchmark.run_route(options['url'], name, fixture, options['requests'],
+                                        options['concurrency'], seed=options['seed'])
+            routes[name] = stats
+            line = (f"  {name:>22}: {stats['rps']:8.1f}/s  p50 {stats['p50_ms']:8.2f}  "
+                    f"p95 {stats['p95_ms']:8.2f}  p99 {stats['p99_ms']:8.2f} ms")
+            if stats['errors']:
+                line += f"  {stats['errors']} errors"
+            if stats['unsuccessful']:
+                line += f"  {stats['unsuccessful']} unsuccessful"
+            self.stdout.write(self.style.WARNING(line) if stats['errors'] else line)
+            for failure in sorted(set(stats['failures'])):
+                self.stdout.write(f'      {failure}')
+
+        results = {
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'url': options['url'],
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'profile': settings.HEALTH_DB_PROFILE,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'routes': routes,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            regressions = benchmark.compare(results, baseline, options['threshold'], options['min_delta'])
+            if regressions:
+                for regression in regressions:
+                    self.stdout.write(self.style.ERROR(f'  {regression}'))
+                raise CommandError(f'{len(regressions)} regressions against {options["baseline"]}')
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['baseline']}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{sum(s['requests'] for s in routes.values())} requests, "
+                                                 f"{sum(s['errors'] for s in routes.values())} errors"))
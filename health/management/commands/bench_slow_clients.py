@@ -0,0 +1,137 @@
+import asyncio
+import base64
+import io
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from health.models import MedicalFile, Patient
+
+BENCH_AADHAR = '999900000001'
+SCENARIOS = ('download', 'upload', 'lookup', 'mixed')
+
+
+class Command(BaseCommand):
+    help = ('Hold many slow clients open against a running server (WSGI or ASGI) and '
+            'report latencies. The server must use the same database and blob store.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--clients', type=int, default=500)
+        parser.add_argument('--scenario', choices=SCENARIOS, default='mixed')
+        parser.add_argument('--rate', type=int, default=32 * 1024,
+                            help='Bytes per second each client sends or reads (default: a slow 3G link)')
+        parser.add_argument('--size', type=int, default=256 * 1024,
+                            help='Size in bytes of the downloaded and uploaded file')
+        parser.add_argument('--timeout', type=float, default=120)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded patient and files')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http':
+            raise CommandError('Only http:// URLs are supported')
+
+        patient, _ = Patient.objects.get_or_create(aadhar=BENCH_AADHAR,
+                                                   defaults={'name': 'Bench Patient', 'phone': '9000000000'})
+        payload = bytes(range(256)) * (options['size'] // 256 + 1)
+        payload = payload[:options['size']]
+        medical_file = MedicalFile(patient=patient, file_name='bench.bin', file_type='application/octet-stream',
+                                   file_size=0, uploader_type='patient', uploader_id=BENCH_AADHAR)
+        medical_file.store_content(io.BytesIO(payload))
+        medical_file.save()
+        upload_body = json.dumps({
+            'patient_aadhar': BENCH_AADHAR, 'file_name': 'bench-upload.bin', 'uploader_type': 'patient',
+            'uploader_id': BENCH_AADHAR,
+            'file_data': 'data:application/octet-stream;base64,' + base64.b64encode(payload).decode(),
+        }).encode()
+
+        requests = {
+            'download': ('GET', f'/api/files/{medical_file.id}/', b''),
+            'upload': ('POST', '/api/upload-file/', upload_body),
+            'lookup': ('GET', f'/api/verify-patient/{BENCH_AADHAR}/', b''),
+        }
+        scenarios = list(requests) if options['scenario'] == 'mixed' else [options['scenario']]
+
+        try:
+            results = asyncio.run(self.run_clients(url, requests, scenarios, options))
+        finally:
+            if not options['keep']:
+                MedicalFile.objects.filter(patient=patient).delete()
+                patient.delete()
+
+        self.report(results, options)
+
+    async def run_clients(self, url, requests, scenarios, options):
+        started = time.perf_counter()
+        jobs = []
+        for i in range(options['clients']):
+            scenario = scenarios[i % len(scenarios)]
+            method, path, body = requests[scenario]
+            jobs.append(self.client(url, scenario, method, path, body, options))
+        results = await asyncio.gather(*jobs)
+        return results, time.perf_counter() - started
+
+    async def client(self, url, scenario, method, path, body, options):
+        """One slow client: trickles the request body and reads the response at ``rate``"""
+        began = time.perf_counter()
+        try:
+            status = await asyncio.wait_for(self.exchange(url, method, path, body, options['rate']),
+                                            options['timeout'])
+            ok = 200 <= status < 300
+            error = None if ok else f'HTTP {status}'
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+            ok, error = False, type(e).__name__
+        return scenario, ok, error, time.perf_counter() - began
+
+    async def exchange(self, url, method, path, body, rate):
+        reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+        try:
+            head = (f'{method} {path} HTTP/1.1\r\nHost: {url.netloc}\r\nConnection: close\r\n'
+                    f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n')
+            writer.write(head.encode())
+            step = max(rate // 10, 1)  # Send and read in tenths of a second
+            for offset in range(0, len(body), step):
+                writer.write(body[offset:offset + step])
+                await writer.drain()
+                await asyncio.sleep(0.1)
+            await writer.drain()
+
+            status_line = await reader.readline()
+            status = int(status_line.split()[1])
+            while (await reader.readline()) not in (b'\r\n', b''):
+                pass
+            while await reader.read(step):
+                await asyncio.sleep(0.1)
+            return status
+        finally:
+            writer.close()
+
+    def report(self, results, options):
+        results, elapsed = results
+        by_scenario = {}
+        for scenario, ok, error, latency in results:
+            by_scenario.setdefault(scenario, []).append((ok, error, latency))
+
+        self.stdout.write(f"{options['clients']} clients at {options['rate']} B/s against {options['url']}, "
+                          f"{elapsed:.1f}s wall time")
+        failures = 0
+        for scenario, outcomes in sorted(by_scenario.items()):
+            latencies = sorted(latency for ok, _, latency in outcomes if ok)
+            errors = [error for ok, error, _ in outcomes if not ok]
+            failures += len(errors)
+            if latencies:
+                p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+                timing = (f"p50 {statistics.median(latencies):6.2f}s  p95 {p95:6.2f}s  "
+                          f"max {latencies[-1]:6.2f}s")
+            else:
+                timing = 'no successful requests'
+            summary = f"  {scenario:>8}: {len(latencies):>4} ok  {len(errors):>4} failed  {timing}"
+            if errors:
+                summary += f"  ({', '.join(sorted(set(errors)))})"
+            self.stdout.write(summary)
+
+        style = self.style.SUCCESS if not failures else self.style.WARNING
+        self.stdout.write(style(f"{len(results) - failures}/{len(results)} requests succeeded"))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from health.models import HealthWorker
+
+
+class Command(BaseCommand):
+    help = ('Register many health workers one save() at a time and report how ID '
+            'allocation latency holds up. Run against a scratch database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100000)
+        parser.add_argument('--report-every', type=int, default=10000)
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the created workers instead of deleting them')
+
+    def handle(self, *args, **options):
+        count = options['count']
+        report_every = options['report_every']
+        created = []
+
+        start = window_start = time.perf_counter()
+        for i in range(1, count + 1):
+            worker = HealthWorker(name=f'Bench Worker {i}', phone='9000000000')
+            worker.save()
+            created.append(worker.worker_id)
+            if i % report_every == 0 or i == count:
+                now = time.perf_counter()
+                window = i % report_every or report_every
+                self.stdout.write(
+                    f"{i:>8} workers  {window / (now - window_start):9.0f}/s  "
+                    f"{(now - window_start) / window * 1e6:8.1f} us/save"
+                )
+                window_start = now
+        elapsed = time.perf_counter() - start
+
+        unique = len(set(created))
+        self.stdout.write(self.style.SUCCESS(
+            f"Registered {count} workers in {elapsed:.1f}s ({count / elapsed:.0f}/s), "
+            f"{unique} unique IDs, last {created[-1]}"
+        ))
+
+        if not options['keep']:
+            for offset in range(0, len(created), 500):
+                HealthWorker.objects.filter(worker_id__in=created[offset:offset + 500]).delete()
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from health.compression import compress_blob, is_compressible
+from health.models import Blob, MedicalFile
+
+
+class Command(BaseCommand):
+    help = 'Make the missing gzip copies of text-like files already in the blob store'
+
+    def handle(self, *args, **options):
+        missing = Blob.objects.filter(gzip_hash='', ref_count__gt=0, archived_at__isnull=True).values('sha256')
+        files = (MedicalFile.objects
+                 .filter(content_hash__in=missing)
+                 .values_list('content_hash', 'file_type')
+                 .distinct())
+
+        done = set()
+        for digest, mime_type in files.iterator():
+            if digest in done or not is_compressible(mime_type):
+                continue
+            done.add(digest)
+            compress_blob(digest)
+
+        compressed = Blob.objects.filter(sha256__in=done).exclude(gzip_hash='').count()
+        self.stdout.write(self.style.SUCCESS(f"Compressed {compressed} files"))
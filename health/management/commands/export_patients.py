@@ -0,0 +1,69 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from health.export import export_to_file
+from health.models import Patient
+
+
+def _export(aadhar, directory, overwrite):
+    try:
+        return aadhar, export_to_file(aadhar, directory, overwrite), None
+    except Exception as e:
+        return aadhar, None, str(e) or e.__class__.__name__
+
+
+class Command(BaseCommand):
+    help = ('Write each patient\'s record bundle to <output>/<aadhar>.zip, in parallel worker processes. '
+            'Bundles already written are skipped, so an interrupted run can simply be repeated.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('aadhars', nargs='*', metavar='AADHAR', help='Default: every patient')
+        parser.add_argument('--output', required=True, help='Directory to write the ZIP files to')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes; 1 exports in this process')
+        parser.add_argument('--overwrite', action='store_true', help='Export again patients already exported')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        os.makedirs(options['output'], exist_ok=True)
+        aadhars = options['aadhars'] or list(Patient.objects.order_by('aadhar').values_list('aadhar', flat=True))
+        export = partial(_export, directory=options['output'], overwrite=options['overwrite'])
+
+        started = time.perf_counter()
+        written = skipped = failed = 0
+        total_bytes = 0
+        if options['workers'] == 1:
+            results = map(export, aadhars)
+        else:
+            # Children must open their own connections, not share the parent's
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup)
+            results = executor.map(export, aadhars, chunksize=16)
+        try:
+            for done, (aadhar, size, error) in enumerate(results, start=1):
+                if error:
+                    failed += 1
+                    self.stderr.write(f"  {aadhar}: {error}")
+                elif size is None:
+                    skipped += 1
+                else:
+                    written += 1
+                    total_bytes += size
+                if done % 1000 == 0:
+                    self.stdout.write(f"  {done}/{len(aadhars)} patients")
+        finally:
+            if options['workers'] > 1:
+                executor.shutdown(cancel_futures=True)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {written} patients ({total_bytes / 1024 / 1024:.1f} MB) in {elapsed:.1f}s, "
+            f"{skipped} already exported, {failed} failed"
+        ))
@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from health.blobstore import get_archive_store, get_blob_store
+from health.models import Blob
+
+
+class Command(BaseCommand):
+    help = 'Delete blobs that are no longer referenced by any medical file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-minutes', type=int, default=60,
+                            help='Only collect blobs unreferenced for at least this long')
+
+    def handle(self, *args, **options):
+        store = get_blob_store()
+        cutoff = timezone.now() - timedelta(minutes=options['grace_minutes'])
+        candidates = (Blob.objects
+                      .filter(ref_count=0, updated_at__lt=cutoff)
+                      .values_list('sha256', 'preview_hash', 'gzip_hash', 'archived_at'))
+
+        collected = 0
+        for digest, preview_hash, gzip_hash, archived_at in list(candidates):
+            # Conditional delete: skip blobs re-acquired or re-written since the scan.
+            # The bytes go in the same transaction, so an upload's Blob.touch()
+            # either keeps the row or finds the bytes gone and writes them again.
+            with transaction.atomic():
+                deleted, _ = Blob.objects.filter(sha256=digest, ref_count=0, updated_at__lt=cutoff).delete()
+                if deleted and not Blob.in_store(digest):
+                    store.delete(digest)
+            if deleted:
+                if archived_at:
+                    get_archive_store().delete(digest)
+                for derived in (preview_hash, gzip_hash):
+                    if derived and not Blob.in_store(derived):
+                        store.delete(derived)
+                collected += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Collected {collected} blobs"))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from health.models import Blob, MedicalFile
+from health.previews import can_preview, generate_preview
+
+
+class Command(BaseCommand):
+    help = 'Generate missing thumbnails for files already in the blob store'
+
+    def handle(self, *args, **options):
+        missing = Blob.objects.filter(preview_hash='', ref_count__gt=0).values('sha256')
+        files = (MedicalFile.objects
+                 .filter(content_hash__in=missing)
+                 .values_list('content_hash', 'file_type')
+                 .distinct())
+
+        done = set()
+        for digest, mime_type in files.iterator():
+            if digest in done or not can_preview(mime_type):
+                continue
+            done.add(digest)
+            generate_preview(digest, mime_type)
+
+        generated = Blob.objects.filter(sha256__in=done).exclude(preview_hash='').count()
+        self.stdout.write(self.style.SUCCESS(f"Generated {generated} previews"))
@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from health.slots import generate_slots
+
+
+class Command(BaseCommand):
+    help = 'Create appointment slots from doctor schedules for the coming days'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=14,
+                            help='Number of days ahead (including today) to generate slots for')
+
+    def handle(self, *args, **options):
+        start = timezone.localdate()
+        end = start + timedelta(days=options['days'] - 1)
+        count = generate_slots(start, end)
+        self.stdout.write(self.style.SUCCESS(f"Generated {count} slots from {start} to {end}"))
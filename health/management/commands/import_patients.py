@@ -0,0 +1,72 @@
+import csv
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from health.importer import DEFAULT_BATCH_SIZE, import_patients, read_records
+
+
+class Command(BaseCommand):
+    help = 'Bulk-register patients from a CSV (with header) or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file with name, phone, aadhar and optional email')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Input format; guessed from the file extension by default')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--errors', help='Write rejected rows to this CSV file')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore saved progress and start from the first row')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        progress_path = f'{path}.progress'
+
+        skip_rows = 0
+        if os.path.exists(progress_path) and not options['restart']:
+            with open(progress_path) as f:
+                skip_rows = json.load(f)['rows']
+            self.stdout.write(f"Resuming after row {skip_rows}")
+
+        errors_file = None
+        errors_writer = None
+        if options['errors']:
+            errors_file = open(options['errors'], 'a' if skip_rows else 'w', newline='')
+            errors_writer = csv.writer(errors_file)
+            if not skip_rows:
+                errors_writer.writerow(['row', 'aadhar', 'error'])
+
+        written = 0
+
+        def on_batch(result):
+            nonlocal written
+            if errors_writer:
+                errors_writer.writerows(result.errors[written:])
+                errors_file.flush()
+                written = len(result.errors)
+            with open(progress_path, 'w') as f:
+                json.dump({'rows': result.rows}, f)
+            self.stdout.write(f"Row {result.rows}: {result.created} created, "
+                              f"{len(result.errors)} rejected")
+
+        start = time.perf_counter()
+        try:
+            with open(path, newline='', encoding='utf-8-sig') as f:
+                result = import_patients(read_records(f, fmt), options['batch_size'],
+                                         skip_rows=skip_rows, on_batch=on_batch)
+        except FileNotFoundError:
+            raise CommandError(f'File not found: {path}')
+        finally:
+            if errors_file:
+                errors_file.close()
+        elapsed = time.perf_counter() - start
+
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.created} patients from {result.rows - skip_rows} rows in {elapsed:.1f}s "
+            f"({result.duplicates} duplicates, {len(result.errors)} rejected)"
+        ))
@@ -0,0 +1,75 @@
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import time as clock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from health.models import Appointment, AppointmentSlot, Doctor, Patient
+from health.slots import SlotUnavailable, book_slot
+
+PATIENT_PREFIX = '99'
+
+
+class Command(BaseCommand):
+    help = ('Fire many concurrent bookings at a single slot and check it is never '
+            'overbooked. Run against a scratch database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=200)
+        parser.add_argument('--capacity', type=int, default=20)
+        parser.add_argument('--workers', type=int, default=32)
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the created slot, patients and appointments')
+
+    def handle(self, *args, **options):
+        bookings = options['bookings']
+        doctor = Doctor.objects.create(name='Load Test', specialization='General', hospital='Load Test')
+        slot = AppointmentSlot.objects.create(doctor=doctor, hospital=doctor.hospital, date=timezone.localdate(),
+                                              start_time=clock(9, 0), capacity=options['capacity'])
+        patients = [f'{PATIENT_PREFIX}{i:010d}' for i in range(bookings)]
+        Patient.objects.bulk_create(
+            [Patient(aadhar=aadhar, name=f'Load Patient {i}', phone='9000000000') for i, aadhar in enumerate(patients)],
+            ignore_conflicts=True,
+        )
+
+        def book(aadhar):
+            try:
+                book_slot(aadhar, slot.id)
+                return 'booked'
+            except SlotUnavailable as e:
+                return str(e)
+            except Exception as e:
+                return f'error: {e}'
+            finally:
+                connection.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            outcomes = Counter(executor.map(book, patients))
+        elapsed = time.perf_counter() - start
+
+        slot.refresh_from_db()
+        appointments = Appointment.objects.filter(slot=slot, status='scheduled').count()
+        for outcome, count in outcomes.most_common():
+            self.stdout.write(f"{count:>6}  {outcome}")
+        self.stdout.write(f"{bookings} bookings in {elapsed:.2f}s ({bookings / elapsed:.0f}/s)")
+
+        try:
+            if slot.booked > slot.capacity or slot.booked != appointments or appointments != outcomes['booked']:
+                raise CommandError(
+                    f"Inconsistent slot: capacity {slot.capacity}, booked {slot.booked}, "
+                    f"{appointments} appointments, {outcomes['booked']} successful bookings"
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f"Slot consistent: {slot.booked}/{slot.capacity} booked, no overbooking"
+            ))
+        finally:
+            if not options['keep']:
+                Appointment.objects.filter(slot=slot).delete()
+                slot.delete()
+                doctor.delete()
+                for offset in range(0, len(patients), 500):
+                    Patient.objects.filter(aadhar__in=patients[offset:offset + 500]).delete()
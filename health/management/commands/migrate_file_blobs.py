@@ -0,0 +1,62 @@
+import io
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from health.blobstore import decode_data_url
+from health.models import Blob, MedicalFile
+
+
+class Command(BaseCommand):
+    help = 'Move base64 MedicalFile.file_data rows into the blob store and shrink the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of rows moved per transaction')
+        parser.add_argument('--no-vacuum', action='store_true',
+                            help='Skip the VACUUM after all rows are moved')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        pending = (MedicalFile.objects
+                   .filter(content_hash='')
+                   .exclude(file_data='')
+                   .order_by('pk')
+                   .only('pk', 'file_data', 'file_type', 'file_size'))
+
+        moved = failed = 0
+        last_pk = None
+        while True:
+            batch_qs = pending if last_pk is None else pending.filter(pk__gt=last_pk)
+            batch = list(batch_qs[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            done = []
+            for medical_file in batch:
+                try:
+                    mime_type, raw = decode_data_url(medical_file.file_data)
+                except ValueError as e:
+                    failed += 1
+                    self.stderr.write(f"{medical_file.pk}: {e}")
+                    continue
+                medical_file.store_content(io.BytesIO(raw))
+                medical_file.file_type = medical_file.file_type or mime_type
+                done.append(medical_file)
+
+            with transaction.atomic():
+                MedicalFile.objects.bulk_update(
+                    done, ['content_hash', 'file_data', 'file_size', 'file_type'])
+                for medical_file in done:
+                    Blob.acquire(medical_file.content_hash, medical_file.file_size)
+            moved += len(done)
+            self.stdout.write(f"Moved {moved} files")
+
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} files, {failed} failed"))
+
+        if (moved and not options['no_vacuum'] and connection.vendor == 'sqlite'
+                and not connection.in_atomic_block):
+            self.stdout.write('Running VACUUM')
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM')
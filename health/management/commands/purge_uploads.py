@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from health.models import UploadSession
+from health.uploads import discard
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked upload sessions that have not been touched recently'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=48,
+                            help='Age in hours after which an upload session is purged')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        stale = UploadSession.objects.filter(updated_at__lt=cutoff)
+
+        purged = 0
+        for session in stale.iterator():
+            discard(session)
+            purged += 1
+        stale.delete()
+
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} upload sessions"))
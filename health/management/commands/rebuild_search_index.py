@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from health.extraction import extract_text, get_extractor
+from health.models import MedicalFile
+from health.search import rebuild_doctor_index, rebuild_record_index
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the doctor and patient record search indexes, e.g. after '
+            'rows were bulk-loaded without signals')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--extract', action='store_true',
+                            help='Also re-extract the text of every file that has an extractor')
+
+    def handle(self, *args, **options):
+        rebuild_doctor_index()
+        rebuild_record_index()
+        self.stdout.write("Rebuilt doctor and record indexes")
+
+        if options['extract']:
+            files = (MedicalFile.objects
+                     .exclude(content_hash='')
+                     .values_list('id', 'content_hash', 'file_type'))
+            extracted = 0
+            for file_id, digest, mime_type in files.iterator():
+                if get_extractor(mime_type):
+                    extract_text(file_id, digest, mime_type)
+                    extracted += 1
+            self.stdout.write(f"Extracted text from {extracted} files")
+
+        self.stdout.write(self.style.SUCCESS("Search indexes are up to date"))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from health.rollups import ROLLUPS
+
+
+class Command(BaseCommand):
+    help = ('Bring the daily analytics rollups up to date. Only days changed since the last '
+            'run are rebuilt, so this is cheap to run every minute from cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('rollups', nargs='*', metavar='ROLLUP', help=f"Default: all of {', '.join(ROLLUPS)}")
+        parser.add_argument('--full', action='store_true', help='Rebuild every day from scratch')
+
+    def handle(self, *args, **options):
+        names = options['rollups'] or list(ROLLUPS)
+        unknown = set(names) - set(ROLLUPS)
+        if unknown:
+            raise CommandError(f"Unknown rollups: {', '.join(sorted(unknown))}")
+
+        for name in names:
+            started = time.perf_counter()
+            days = ROLLUPS[name].refresh(full=options['full'])
+            rebuilt = 'all days' if days is None else f'{days} days'
+            self.stdout.write(f"  {name}: rebuilt {rebuilt} in {time.perf_counter() - started:.2f}s")
+        self.stdout.write(self.style.SUCCESS(f"Refreshed {len(names)} rollups"))
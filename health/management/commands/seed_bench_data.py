@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from health import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Bulk-insert synthetic patients, doctors, workers, files and appointments for '
+            'bench_endpoints. Use a scratch database, e.g. HEALTH_DB_PATH=/tmp/bench.sqlite3.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=10000)
+        parser.add_argument('--doctors', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=200)
+        parser.add_argument('--files', type=int, default=1000)
+        parser.add_argument('--appointments', type=int, default=20000)
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, for reproducible data sets')
+        parser.add_argument('--clear', action='store_true', help='Delete previously seeded rows first')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            benchmark.clear()
+            self.stdout.write('Cleared seeded rows; run gc_blobs to reclaim their files')
+
+        started = time.perf_counter()
+        counts = benchmark.seed(
+            patients=options['patients'], doctors=options['doctors'], workers=options['workers'],
+            files=options['files'], appointments=options['appointments'], seed=options['seed'],
+            log=lambda message: self.stdout.write(f'  {message}'),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {counts.patients} patients, {counts.doctors} doctors, {counts.workers} workers, '
+            f'{counts.files} files and {counts.appointments} appointments in {time.perf_counter() - started:.1f}s'
+        ))
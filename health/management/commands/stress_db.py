@@ -0,0 +1,122 @@
+import io
+import random
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+
+from health.db import read_only
+from health.models import Appointment, MedicalFile, Patient
+
+AADHAR_PREFIX = '98'
+
+
+@read_only
+def read_patient(aadhar):
+    patient = Patient.objects.get(aadhar=aadhar)
+    return list(MedicalFile.objects.filter(patient=patient).order_by('-uploaded_at', '-id')
+                .values_list('id', 'file_name')[:50])
+
+
+class Command(BaseCommand):
+    help = ('Run concurrent writer and reader threads against the database and count '
+            'failures such as "database is locked". Run against a scratch database, '
+            'e.g. HEALTH_DB_PATH=/tmp/stress.sqlite3 HEALTH_DB_PROFILE=production.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--readers', type=int, default=16)
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--keep', action='store_true', help='Keep the rows written by the test')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Profile {settings.HEALTH_DB_PROFILE}, database {settings.DATABASES['default']['NAME']}, "
+                          f"reads via {', '.join(connections.settings)}")
+        seed = [f'{AADHAR_PREFIX}{i:010d}' for i in range(100)]
+        Patient.objects.bulk_create(
+            [Patient(aadhar=aadhar, name=f'Stress {aadhar}', phone='9000000000') for aadhar in seed],
+            ignore_conflicts=True,
+        )
+
+        deadline = time.monotonic() + options['seconds']
+        counts = Counter()
+        errors = Counter()
+        latencies = {'write': [], 'read': []}
+        lock = threading.Lock()
+        next_id = iter(range(100, 10 ** 10))
+
+        def record(kind, began, error=None):
+            with lock:
+                if error is None:
+                    counts[kind] += 1
+                    latencies[kind].append(time.perf_counter() - began)
+                else:
+                    errors[f'{kind}: {error}'] += 1
+
+        def writer():
+            rng = random.Random()
+            try:
+                while time.monotonic() < deadline:
+                    began = time.perf_counter()
+                    try:
+                        action = rng.random()
+                        if action < 0.4:
+                            with lock:
+                                aadhar = f'{AADHAR_PREFIX}{next(next_id):010d}'
+                            Patient.objects.create(aadhar=aadhar, name='Stress', phone='9000000000')
+                        elif action < 0.7:
+                            Appointment.objects.create(patient_id=rng.choice(seed), hospital='Stress Hospital',
+                                                       doctor_name='Stress', appointment_date='2026-01-01',
+                                                       appointment_time='09:00')
+                        else:
+                            medical_file = MedicalFile(patient_id=rng.choice(seed), file_name='stress.txt',
+                                                       file_type='text/plain', file_size=0,
+                                                       uploader_type='patient', uploader_id='stress')
+                            medical_file.store_content(io.BytesIO(rng.randbytes(2048)))
+                            medical_file.save()
+                        record('write', began)
+                    except Exception as e:
+                        record('write', began, str(e) or type(e).__name__)
+            finally:
+                connection.close()
+
+        def reader():
+            rng = random.Random()
+            try:
+                while time.monotonic() < deadline:
+                    began = time.perf_counter()
+                    try:
+                        read_patient(rng.choice(seed))
+                        record('read', began)
+                    except Exception as e:
+                        record('read', began, str(e) or type(e).__name__)
+            finally:
+                connections.close_all()
+
+        threads = ([threading.Thread(target=writer) for _ in range(options['writers'])] +
+                   [threading.Thread(target=reader) for _ in range(options['readers'])])
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for kind in ('write', 'read'):
+            samples = sorted(latencies[kind])
+            if samples:
+                p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+                self.stdout.write(f"{kind:>6}s: {counts[kind] / options['seconds']:8.0f}/s  "
+                                  f"p50 {samples[len(samples) // 2] * 1000:7.2f} ms  p99 {p99 * 1000:7.2f} ms")
+        for error, count in errors.most_common():
+            self.stdout.write(self.style.WARNING(f"{count:>6}  {error}"))
+
+        if not options['keep']:
+            patients = Patient.objects.filter(aadhar__startswith=AADHAR_PREFIX)
+            MedicalFile.objects.filter(patient__in=patients).delete()
+            patients.delete()
+
+        failed = sum(errors.values())
+        style = self.style.SUCCESS if not failed else self.style.ERROR
+        self.stdout.write(style(f"{sum(counts.values())} operations, {failed} failed"))
@@ -0,0 +1,335 @@
+"""
+Per-endpoint request metrics, exposed at /metrics in the Prometheus text format.
+
+Each thread records into its own shard, so the request path takes no lock;
+the exposition sums the shards. Failures count 4xx and 5xx responses and,
+as these views report most errors with status 200, JSON bodies with
+``"success": false``; FailureMiddleware spots those before compression. With HEALTH_METRICS['MULTIPROCESS_DIR'] set,
+every process also writes its totals to ``<dir>/<pid>.json`` at most every
+FLUSH_INTERVAL seconds and /metrics adds up the files of all processes, e.g.
+for several gunicorn workers. Clear the directory when the server starts.
+"""
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import setting_changed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Layout of a row: totals for one (view, status class) pair
+COUNT, SECONDS, QUERIES, QUERY_SECONDS, BYTES, FAILURES = range(6)
+FIRST_BUCKET = 6
+ROW_LENGTH = FIRST_BUCKET + len(BUCKETS)
+
+UNMATCHED = '<unmatched>'
+
+# Every JSON response of the API starts with its success flag
+FAILED_JSON = b'{"success": false'
+
+
+class QueryCounter:
+    """Queries of the request being served; sync_to_async threads may add to it at the same time"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.seconds += seconds
+
+
+# QueryCounter of the request being served, shared with sync_to_async threads
+_queries = contextvars.ContextVar('health_metrics_queries', default=None)
+
+
+@lru_cache(maxsize=None)
+def get_config():
+    config = getattr(settings, 'HEALTH_METRICS', {})
+    return {
+        'ENABLED': config.get('ENABLED', True),
+        'MULTIPROCESS_DIR': config.get('MULTIPROCESS_DIR'),
+        'FLUSH_INTERVAL': config.get('FLUSH_INTERVAL', 5),
+    }
+
+
+@receiver(setting_changed)
+def _reset_config(setting, **kwargs):
+    if setting == 'HEALTH_METRICS':
+        get_config.cache_clear()
+
+
+class Registry:
+    """Request totals kept in one dict per thread, merged on read"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()  # Taken once per thread, on its first request
+        self._flush_lock = threading.Lock()
+        self._flushed = time.monotonic()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def record(self, view, status, seconds, queries, query_seconds, size, failed=False):
+        key = (view, f'{status // 100}xx')
+        shard = self._shard()
+        row = shard.get(key)
+        if row is None:
+            row = shard[key] = [0] * ROW_LENGTH
+        row[COUNT] += 1
+        row[SECONDS] += seconds
+        row[QUERIES] += queries
+        row[QUERY_SECONDS] += query_seconds
+        row[BYTES] += size
+        row[FAILURES] += failed
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                row[FIRST_BUCKET + i] += 1
+                break
+
+    def snapshot(self):
+        """Return {(view, status class): row} summed over all threads"""
+        totals = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for key, row in list(shard.items()):
+                _add_row(totals, key, row)
+        return totals
+
+    def reset(self):
+        with self._shards_lock:
+            for shard in self._shards:
+                shard.clear()
+
+    def maybe_flush(self, directory, interval):
+        """Write this process's totals to the multiprocess directory if they are due"""
+        if time.monotonic() - self._flushed < interval or not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._flushed = time.monotonic()
+            self.flush(directory)
+        finally:
+            self._flush_lock.release()
+
+    def flush(self, directory):
+        rows = [[view, status, *row] for (view, status), row in self.snapshot().items()]
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        # Written to a temporary file first so readers never see a partial file
+        with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False) as f:
+            json.dump(rows, f)
+        os.replace(f.name, directory / f'{os.getpid()}.json')
+
+
+registry = Registry()
+
+
+def _add_row(totals, key, row):
+    total = totals.get(key)
+    if total is None:
+        totals[key] = list(row)
+    else:
+        for i, value in enumerate(row):
+            total[i] += value
+
+
+def collect():
+    """This process's totals plus, in multiprocess mode, those flushed by the others"""
+    totals = registry.snapshot()
+    directory = get_config()['MULTIPROCESS_DIR']
+    if directory:
+        own = f'{os.getpid()}.json'
+        for path in Path(directory).glob('*.json'):
+            if path.name == own:
+                continue
+            try:
+                rows = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue  # Removed or replaced while we read it
+            for view, status, *row in rows:
+                _add_row(totals, (view, status), row)
+    return totals
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render(totals=None):
+    """Format the totals in the Prometheus text exposition format"""
+    if totals is None:
+        totals = collect()
+    by_view = {}
+    for (view, _), row in totals.items():
+        _add_row(by_view, view, row)
+
+    lines = [
+        '# HELP health_http_requests_total Requests by URL name and status class.',
+        '# TYPE health_http_requests_total counter',
+    ]
+    for (view, status), row in sorted(totals.items()):
+        lines.append(f'health_http_requests_total{{view="{_escape(view)}",status="{status}"}} {row[COUNT]}')
+
+    lines += [
+        '# HELP health_http_request_duration_seconds Time spent serving requests.',
+        '# TYPE health_http_request_duration_seconds histogram',
+    ]
+    for view, row in sorted(by_view.items()):
+        label = _escape(view)
+        cumulative = 0
+        for i, bound in enumerate(BUCKETS):
+            cumulative += row[FIRST_BUCKET + i]
+            lines.append(f'health_http_request_duration_seconds_bucket{{view="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'health_http_request_duration_seconds_bucket{{view="{label}",le="+Inf"}} {row[COUNT]}')
+        lines.append(f'health_http_request_duration_seconds_sum{{view="{label}"}} {row[SECONDS]:.6f}')
+        lines.append(f'health_http_request_duration_seconds_count{{view="{label}"}} {row[COUNT]}')
+
+    for name, index, kind, help_text in (
+        ('health_db_queries_total', QUERIES, 'counter', 'Database queries made while serving requests.'),
+        ('health_db_query_seconds_total', QUERY_SECONDS, 'counter', 'Time spent in database queries.'),
+        ('health_http_response_bytes_total', BYTES, 'counter', 'Response body bytes sent.'),
+        ('health_http_request_failures_total', FAILURES, 'counter',
+         'Failed requests: 4xx and 5xx responses and JSON bodies with success false.'),
+    ):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        for view, row in sorted(by_view.items()):
+            value = f'{row[index]:.6f}' if isinstance(row[index], float) else row[index]
+            lines.append(f'{name}{{view="{_escape(view)}"}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def _count_query(execute, sql, params, many, context):
+    counter = _queries.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    began = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        counter.add(time.perf_counter() - began)
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    """Count the queries of every connection, including those used from sync_to_async threads"""
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def is_failure(response):
+    """Whether a response reports an error, by its status or, for the API's JSON, its body"""
+    if response.status_code >= 400:
+        return True
+    if (response.streaming or response.has_header('Content-Encoding')
+            or not response.get('Content-Type', '').startswith('application/json')):
+        return False
+    return response.content.startswith(FAILED_JSON)
+
+
+def response_size(response):
+    if not response.streaming:
+        return len(response.content)
+    length = response.get('Content-Length')  # Set by FileResponse; other streams are not counted
+    return int(length) if length and length.isdigit() else 0
+
+
+class MetricsMiddleware:
+    """Record count, latency, queries and response size of every request by URL name"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not get_config()['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = QueryCounter()
+        token = _queries.set(counter)
+        began = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _queries.reset(token)
+        self.record(request, response, time.perf_counter() - began, counter)
+        return response
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        token = _queries.set(counter)
+        began = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _queries.reset(token)
+        self.record(request, response, time.perf_counter() - began, counter)
+        return response
+
+    def record(self, request, response, seconds, counter):
+        match = request.resolver_match
+        view = match.view_name if match else UNMATCHED
+        failed = getattr(request, 'metrics_failed', None)
+        if failed is None:  # FailureMiddleware is not installed
+            failed = is_failure(response)
+        registry.record(view, response.status_code, seconds, counter.count, counter.seconds,
+                        response_size(response), failed)
+        config = get_config()
+        if config['MULTIPROCESS_DIR']:
+            registry.maybe_flush(config['MULTIPROCESS_DIR'], config['FLUSH_INTERVAL'])
+
+
+class FailureMiddleware:
+    """
+    Note on the request whether its response is a failure, for MetricsMiddleware.
+
+    Goes below CompressionMiddleware, as a JSON body is unreadable once compressed.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not get_config()['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        request.metrics_failed = is_failure(response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        request.metrics_failed = is_failure(response)
+        return response
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalfile',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='medicalfile',
+            name='file_data',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:04
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def count_existing_blobs(apps, schema_editor):
+    MedicalFile = apps.get_model('health', 'MedicalFile')
+    Blob = apps.get_model('health', 'Blob')
+    counts = (MedicalFile.objects
+              .exclude(content_hash='')
+              .values('content_hash')
+              .annotate(refs=Count('id'), size=Max('file_size')))
+    Blob.objects.bulk_create(
+        [Blob(sha256=row['content_hash'], size=row['size'], ref_count=row['refs']) for row in counts],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0003_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('size', models.BigIntegerField()),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(count_existing_blobs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0004_blob_ref_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='preview_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='blob',
+            name='preview_type',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0005_blob_previews'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('name', models.CharField(max_length=30, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField(default=1)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='appointment_code',
+            field=models.CharField(max_length=20, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='doctor',
+            name='doctor_id',
+            field=models.CharField(max_length=20, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='healthworker',
+            name='worker_id',
+            field=models.CharField(max_length=20, primary_key=True, serialize=False),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:08
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0006_id_sequences'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'appointment_date'], name='appointment_patient_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicalfile',
+            index=models.Index(fields=['patient', '-uploaded_at', '-id'], name='medicalfile_patient_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(models.F('phone'), django.db.models.functions.text.Lower('name'), name='patient_login_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+import re
+import unicodedata
+
+from django.db import migrations
+
+WORD_RE = re.compile(r'[^\W_]+')
+
+
+def words(text):
+    text = unicodedata.normalize('NFKD', text.lower())
+    return WORD_RE.findall(''.join(ch for ch in text if not unicodedata.combining(ch)))
+
+
+def create_doctor_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE health_doctor_fts USING fts5("
+        "name, hospital, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    schema_editor.execute("CREATE TABLE health_doctor_word (word TEXT PRIMARY KEY) WITHOUT ROWID")
+    schema_editor.execute(
+        "INSERT INTO health_doctor_fts (rowid, name, hospital) "
+        "SELECT rowid, name, hospital FROM health_doctor"
+    )
+    Doctor = apps.get_model('health', 'Doctor')
+    vocabulary = set()
+    for name, hospital in Doctor.objects.values_list('name', 'hospital').iterator():
+        vocabulary.update(words(f'{name} {hospital}'))
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany("INSERT INTO health_doctor_word (word) VALUES (%s)", [(word,) for word in vocabulary])
+
+
+def drop_doctor_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS health_doctor_fts")
+    schema_editor.execute("DROP TABLE IF EXISTS health_doctor_word")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0008_appointment_slots'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_doctor_index, drop_doctor_index),
+    ]
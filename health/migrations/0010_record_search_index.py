@@ -0,0 +1,38 @@
+from django.db import migrations
+
+
+def create_record_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE health_record_fts USING fts5("
+        "patient, kind UNINDEXED, ref UNINDEXED, title, details, content, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    schema_editor.execute(
+        "INSERT INTO health_record_fts (rowid, patient, kind, ref, title, details, content) "
+        "SELECT rowid * 2, patient_id, 'file', id, file_name, "
+        "file_type || ' ' || uploader_type || ' ' || uploader_id, '' FROM health_medicalfile"
+    )
+    schema_editor.execute(
+        "INSERT INTO health_record_fts (rowid, patient, kind, ref, title, details, content) "
+        "SELECT rowid * 2 + 1, patient_id, 'appointment', appointment_code, doctor_name, "
+        "hospital || ' ' || status || ' ' || appointment_date, '' FROM health_appointment"
+    )
+
+
+def drop_record_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS health_record_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0009_doctor_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_record_index, drop_record_index),
+    ]
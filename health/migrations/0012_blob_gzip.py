@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0011_appointment_timeline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='gzip_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
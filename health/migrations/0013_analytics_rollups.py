@@ -0,0 +1,99 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0012_blob_gzip'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupState',
+            fields=[
+                ('name', models.CharField(max_length=30, primary_key=True, serialize=False)),
+                ('watermark', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='doctor',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='healthworker',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='medicalfile',
+            name='uploaded_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='DailyAppointmentStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('hospital', models.CharField(max_length=200)),
+                ('doctor_name', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('scheduled', 'Scheduled'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=10)),
+                ('count', models.IntegerField()),
+            ],
+            options={
+                'verbose_name_plural': 'daily appointment stats',
+                'constraints': [models.UniqueConstraint(fields=('date', 'hospital', 'doctor_name', 'status'), name='unique_daily_appointment_stats')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyRegistrationStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('kind', models.CharField(choices=[('patient', 'Patient'), ('doctor', 'Doctor'), ('worker', 'Health Worker')], max_length=10)),
+                ('count', models.IntegerField()),
+            ],
+            options={
+                'verbose_name_plural': 'daily registration stats',
+                'constraints': [models.UniqueConstraint(fields=('date', 'kind'), name='unique_daily_registration_stats')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyUploadStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('uploader_type', models.CharField(choices=[('patient', 'Patient'), ('doctor', 'Doctor'), ('worker', 'Health Worker')], max_length=10)),
+                ('file_type', models.CharField(max_length=50)),
+                ('count', models.IntegerField()),
+                ('bytes', models.BigIntegerField()),
+            ],
+            options={
+                'verbose_name_plural': 'daily upload stats',
+                'constraints': [models.UniqueConstraint(fields=('date', 'uploader_type', 'file_type'), name='unique_daily_upload_stats')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupDirtyDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rollup', models.CharField(max_length=30)),
+                ('date', models.DateField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('rollup', 'date'), name='unique_rollup_dirty_day')],
+            },
+        ),
+    ]
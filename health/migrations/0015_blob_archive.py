@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0014_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:06
+
+from django.db import migrations, models
+
+
+def fill_name_keys(apps, schema_editor):
+    # Same normalisation as health.models.login_name
+    Patient = apps.get_model('health', 'Patient')
+    patients = Patient.objects.only('aadhar', 'name').order_by('aadhar')
+    batch = []
+    for patient in patients.iterator(chunk_size=2000):
+        patient.name_key = ' '.join(patient.name.split()).casefold()
+        batch.append(patient)
+        if len(batch) == 2000:
+            Patient.objects.bulk_update(batch, ['name_key'])
+            batch = []
+    Patient.objects.bulk_update(batch, ['name_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0015_blob_archive'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='patient',
+            name='patient_login_idx',
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='name_key',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_name_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['phone', 'name_key'], name='patient_login_idx'),
+        ),
+    ]
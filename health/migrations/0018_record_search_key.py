@@ -0,0 +1,58 @@
+from django.db import migrations
+
+
+def key_record_index(apps, schema_editor):
+    # The index used the source tables' rowids as its key, which SQLite
+    # renumbers whenever a migration rebuilds a table, so saved text may sit
+    # under another patient's file. It is dropped rather than carried over;
+    # run `manage.py rebuild_search_index --extract` to extract it again.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS health_record_fts")
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE health_record_fts USING fts5("
+        "patient, kind UNINDEXED, ref, title, details, content, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    schema_editor.execute(
+        "INSERT INTO health_record_fts (patient, kind, ref, title, details, content) "
+        "SELECT patient_id, 'file', id, file_name, "
+        "file_type || ' ' || uploader_type || ' ' || uploader_id, '' FROM health_medicalfile"
+    )
+    schema_editor.execute(
+        "INSERT INTO health_record_fts (patient, kind, ref, title, details, content) "
+        "SELECT patient_id, 'appointment', appointment_code, doctor_name, "
+        "hospital || ' ' || status || ' ' || appointment_date, '' FROM health_appointment"
+    )
+
+
+def unkey_record_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS health_record_fts")
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE health_record_fts USING fts5("
+        "patient, kind UNINDEXED, ref UNINDEXED, title, details, content, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    schema_editor.execute(
+        "INSERT INTO health_record_fts (rowid, patient, kind, ref, title, details, content) "
+        "SELECT rowid * 2, patient_id, 'file', id, file_name, "
+        "file_type || ' ' || uploader_type || ' ' || uploader_id, '' FROM health_medicalfile"
+    )
+    schema_editor.execute(
+        "INSERT INTO health_record_fts (rowid, patient, kind, ref, title, details, content) "
+        "SELECT rowid * 2 + 1, patient_id, 'appointment', appointment_code, doctor_name, "
+        "hospital || ' ' || status || ' ' || appointment_date, '' FROM health_appointment"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0017_doctor_search_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(key_record_index, unkey_record_index),
+    ]
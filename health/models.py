@@ -1,13 +1,59 @@
-from django.db import models
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
+import io
 import uuid
 
+from .blobstore import decode_data_url, encode_data_url, get_blob_store, open_blob
+from .ids import APPOINTMENT_CODES, DOCTOR_IDS, WORKER_IDS
+
+class IdSequence(models.Model):
+    """Next unreserved value for each allocator in health.ids"""
+    name = models.CharField(max_length=30, primary_key=True)
+    next_value = models.BigIntegerField(default=1)
+    
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+def login_name(name):
+    """A patient name as compared at login, ignoring case and spacing"""
+    return ' '.join(name.split()).casefold()
+
+class PatientQuerySet(models.QuerySet):
+    def matching_login(self, name, phone):
+        """Patients with this phone whose name matches ignoring case and spacing"""
+        return self.filter(phone=phone, name_key=login_name(name))
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for patient in objs:
+            patient.name_key = login_name(patient.name)  # save() is skipped
+        return super().bulk_create(objs, *args, **kwargs)
+
 class Patient(models.Model):
     aadhar = models.CharField(max_length=12, primary_key=True)
     name = models.CharField(max_length=100)
+    name_key = models.CharField(max_length=255, editable=False, default='')  # login_name(name), written by save()
     phone = models.CharField(max_length=10)
     email = models.EmailField(blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    objects = PatientQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            # Serves login_patient's phone + name lookup
+            models.Index(fields=['phone', 'name_key'], name='patient_login_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        self.name_key = login_name(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'name_key'}
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.name} - {self.aadhar}"
@@ -35,44 +81,104 @@ class Doctor(models.Model):
         ('Rheumatology', 'Rheumatology'),
     ]
     
-    doctor_id = models.CharField(max_length=10, primary_key=True)
+    doctor_id = models.CharField(max_length=20, primary_key=True)
     name = models.CharField(max_length=100)
     specialization = models.CharField(max_length=50, choices=SPECIALIZATIONS)
     hospital = models.CharField(max_length=200)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     
     def save(self, *args, **kwargs):
         if not self.doctor_id:
-            import random
-            while True:
-                new_id = f"DOC{random.randint(1000, 9999)}"
-                if not Doctor.objects.filter(doctor_id=new_id).exists():
-                    self.doctor_id = new_id
-                    break
+            self.doctor_id = DOCTOR_IDS.next()
+            kwargs['force_insert'] = True
         super().save(*args, **kwargs)
     
     def __str__(self):
         return f"Dr. {self.name} - {self.specialization}"
 
 class HealthWorker(models.Model):
-    worker_id = models.CharField(max_length=10, primary_key=True)
+    worker_id = models.CharField(max_length=20, primary_key=True)
     name = models.CharField(max_length=100)
     phone = models.CharField(max_length=10)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     
     def save(self, *args, **kwargs):
         if not self.worker_id:
-            import random
-            while True:
-                new_id = f"WRK{random.randint(1000, 9999)}"
-                if not HealthWorker.objects.filter(worker_id=new_id).exists():
-                    self.worker_id = new_id
-                    break
+            self.worker_id = WORKER_IDS.next()
+            kwargs['force_insert'] = True
         super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.name} - {self.worker_id}"
 
+class Blob(models.Model):
+    """
+    Reference count for content shared by medical files.
+
+    A blob whose count has dropped to zero is only removed from the blob
+    store by the gc_blobs command after a grace period, so an upload that
+    is writing the same content at the same moment never loses its bytes.
+    Blobs of old files are moved to the cold archive (see health.archive).
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.BigIntegerField()
+    ref_count = models.IntegerField(default=0)
+    preview_hash = models.CharField(max_length=64, blank=True)  # Thumbnail kept in the blob store
+    preview_type = models.CharField(max_length=50, blank=True)
+    gzip_hash = models.CharField(max_length=64, blank=True)  # Compressed copy of text-like content
+    archived_at = models.DateTimeField(null=True, blank=True)  # Moved to the cold archive by archive_files
+    crc32 = models.BigIntegerField(null=True, blank=True)  # Set by the first record export that reads it
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    @classmethod
+    def acquire(cls, digest, size):
+        blobs = cls.objects.filter(sha256=digest)
+        if blobs.update(ref_count=F('ref_count') + 1, updated_at=timezone.now()):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(sha256=digest, size=size, ref_count=1)
+        except IntegrityError:
+            # Another upload of the same content created the row first
+            blobs.update(ref_count=F('ref_count') + 1, updated_at=timezone.now())
+    
+    @classmethod
+    def release(cls, digest):
+        cls.objects.filter(sha256=digest, ref_count__gt=0).update(ref_count=F('ref_count') - 1, updated_at=timezone.now())
+    
+    @classmethod
+    def touch(cls, digest, size):
+        """
+        Mark a blob as just written so garbage collection leaves it alone.
+        
+        Content new to the store gets a row without references, so gc_blobs
+        collects it if no file ends up pointing at it (a checksum mismatch,
+        a failed save). Returns False when the bytes are gone: gc_blobs
+        collected the blob after put() found it already stored, and it must
+        be put again. The update and the check run in one transaction, which
+        gc_blobs' delete of the row and the bytes excludes.
+        """
+        with transaction.atomic():
+            # Written to the blob store again, so no longer only in the archive
+            if not cls.objects.filter(sha256=digest).update(updated_at=timezone.now(), archived_at=None):
+                cls.objects.bulk_create([cls(sha256=digest, size=size)], ignore_conflicts=True)
+            return get_blob_store().exists(digest)
+    
+    @classmethod
+    def in_store(cls, digest):
+        """
+        Whether the blob store must keep ``digest``.
+        
+        Thumbnails and gzip copies share the content namespace with files, so
+        the same bytes may be one blob's content and another blob's preview.
+        """
+        return cls.objects.filter(Q(sha256=digest, archived_at__isnull=True) | Q(preview_hash=digest)
+                                  | Q(gzip_hash=digest)).exists()
+    
+    def __str__(self):
+        return f"{self.sha256} ({self.ref_count} refs)"
+
 class MedicalFile(models.Model):
     UPLOADER_TYPES = [
         ('patient', 'Patient'),
@@ -83,16 +189,98 @@ class MedicalFile(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='medical_files')
     file_name = models.CharField(max_length=255)
-    file_data = models.TextField()  # Base64 encoded file data
-    file_type = models.CharField(max_length=50)
+    file_data = models.TextField(blank=True, default='')  # Legacy base64 data URL, emptied once moved to the blob store
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)  # SHA-256 of the bytes in the blob store
+    file_type = models.CharField(max_length=50)  # MIME type
     file_size = models.IntegerField()
     uploader_type = models.CharField(max_length=10, choices=UPLOADER_TYPES)
     uploader_id = models.CharField(max_length=20)  # Doctor ID or Worker ID
-    uploaded_at = models.DateTimeField(auto_now_add=True)
+    uploaded_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        indexes = [
+            # Newest-first keyset pagination in get_patient_files
+            models.Index(fields=['patient', '-uploaded_at', '-id'], name='medicalfile_patient_recent_idx'),
+        ]
+    
+    def store_content(self, stream):
+        """Write the file bytes from a seekable stream to the blob store and record hash and size"""
+        store = get_blob_store()
+        start = stream.tell()
+        self.content_hash, self.file_size = store.put(stream)
+        if not Blob.touch(self.content_hash, self.file_size):
+            # Collected meanwhile; with its row gone gc_blobs cannot collect it again
+            stream.seek(start)
+            store.put(stream)
+        self.file_data = ''
+    
+    async def astore_content(self, stream):
+        """store_content() for async views; the blob is written in a worker thread"""
+        put = sync_to_async(get_blob_store().put, thread_sensitive=False)
+        start = stream.tell()
+        self.content_hash, self.file_size = await put(stream)
+        if not await sync_to_async(Blob.touch)(self.content_hash, self.file_size):
+            stream.seek(start)
+            await put(stream)
+        self.file_data = ''
+    
+    def open(self):
+        """Return a binary file object with the original file bytes"""
+        if self.content_hash:
+            return open_blob(self.content_hash)
+        return io.BytesIO(decode_data_url(self.file_data)[1])
+    
+    def as_data_url(self):
+        with self.open() as f:
+            return encode_data_url(self.file_type, f.read())
     
     def __str__(self):
         return f"{self.file_name} - {self.patient.name}"
 
+class DoctorSchedule(models.Model):
+    """A doctor's recurring weekly OPD session at one hospital"""
+    WEEKDAYS = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+    
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='schedules')
+    hospital = models.CharField(max_length=200)
+    weekday = models.IntegerField(choices=WEEKDAYS)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    slot_minutes = models.IntegerField(default=15)
+    capacity = models.IntegerField(default=1)  # Patients per slot
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.doctor.name} @ {self.hospital} {self.get_weekday_display()} {self.start_time}-{self.end_time}"
+
+class AppointmentSlot(models.Model):
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='slots')
+    hospital = models.CharField(max_length=200)
+    date = models.DateField()
+    start_time = models.TimeField()
+    capacity = models.IntegerField()
+    booked = models.IntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'date', 'start_time'], name='unique_doctor_slot'),
+            models.CheckConstraint(condition=models.Q(booked__lte=models.F('capacity')), name='slot_not_overbooked'),
+        ]
+        indexes = [
+            models.Index(fields=['hospital', 'date', 'start_time'], name='slot_hospital_date_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.doctor_id} {self.date} {self.start_time} ({self.booked}/{self.capacity})"
+
 class Appointment(models.Model):
     STATUS_CHOICES = [
         ('scheduled', 'Scheduled'),
@@ -100,24 +288,190 @@ class Appointment(models.Model):
         ('cancelled', 'Cancelled'),
     ]
     
-    appointment_code = models.CharField(max_length=10, unique=True)
+    appointment_code = models.CharField(max_length=20, unique=True)
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='appointments')
     hospital = models.CharField(max_length=200)
     doctor_name = models.CharField(max_length=100)
     appointment_date = models.DateField()
     appointment_time = models.CharField(max_length=20)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='scheduled')
+    slot = models.ForeignKey(AppointmentSlot, on_delete=models.PROTECT, null=True, blank=True, related_name='appointments')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Timeline ETag and rollup watermark
+    
+    class Meta:
+        constraints = [
+            # A patient holds at most one live booking per slot
+            models.UniqueConstraint(fields=['patient', 'slot'], condition=models.Q(status='scheduled'),
+                                    name='unique_patient_slot_booking'),
+        ]
+        indexes = [
+            # Date lookups, and newest-first keyset pagination in the patient timeline
+            models.Index(fields=['patient', 'appointment_date', 'appointment_time', 'id'],
+                         name='appointment_patient_date_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.appointment_code:
-            import random
-            while True:
-                new_code = f"APT{random.randint(100000, 999999)}"
-                if not Appointment.objects.filter(appointment_code=new_code).exists():
-                    self.appointment_code = new_code
-                    break
+            self.appointment_code = APPOINTMENT_CODES.next()
         super().save(*args, **kwargs)
     
     def __str__(self):
-        return f"{self.appointment_code} - {self.patient.name} with {self.doctor_name}"
\ No newline at end of file
+        return f"{self.appointment_code} - {self.patient.name} with {self.doctor_name}"
+
+class UploadSession(models.Model):
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('committed', 'Committed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='upload_sessions')
+    file_name = models.CharField(max_length=255)
+    file_type = models.CharField(max_length=50)
+    file_size = models.BigIntegerField()
+    chunk_size = models.IntegerField()
+    sha256 = models.CharField(max_length=64, blank=True)  # Optional checksum of the whole file, checked on commit
+    uploader_type = models.CharField(max_length=10, choices=MedicalFile.UPLOADER_TYPES)
+    uploader_id = models.CharField(max_length=20)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open')
+    medical_file = models.ForeignKey(MedicalFile, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.file_size // self.chunk_size))
+    
+    def expected_chunk_size(self, index):
+        if index == self.chunk_count - 1:
+            return self.file_size - index * self.chunk_size
+        return self.chunk_size
+    
+    def __str__(self):
+        return f"{self.file_name} ({self.status})"
+
+class UploadChunk(models.Model):
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    index = models.IntegerField()
+    size = models.IntegerField()
+    sha256 = models.CharField(max_length=64)
+    received_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'index'], name='unique_upload_chunk'),
+        ]
+    
+    def __str__(self):
+        return f"{self.session_id} #{self.index}"
+
+
+# Daily rollups for the analytics API, maintained by health.rollups
+
+class DailyAppointmentStats(models.Model):
+    date = models.DateField()  # Appointment date
+    hospital = models.CharField(max_length=200)
+    doctor_name = models.CharField(max_length=100)
+    status = models.CharField(max_length=10, choices=Appointment.STATUS_CHOICES)
+    count = models.IntegerField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'hospital', 'doctor_name', 'status'],
+                                    name='unique_daily_appointment_stats'),
+        ]
+        verbose_name_plural = 'daily appointment stats'
+
+class DailyUploadStats(models.Model):
+    date = models.DateField()
+    uploader_type = models.CharField(max_length=10, choices=MedicalFile.UPLOADER_TYPES)
+    file_type = models.CharField(max_length=50)
+    count = models.IntegerField()
+    bytes = models.BigIntegerField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'uploader_type', 'file_type'], name='unique_daily_upload_stats'),
+        ]
+        verbose_name_plural = 'daily upload stats'
+
+class DailyRegistrationStats(models.Model):
+    KINDS = [
+        ('patient', 'Patient'),
+        ('doctor', 'Doctor'),
+        ('worker', 'Health Worker'),
+    ]
+    
+    date = models.DateField()
+    kind = models.CharField(max_length=10, choices=KINDS)
+    count = models.IntegerField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'kind'], name='unique_daily_registration_stats'),
+        ]
+        verbose_name_plural = 'daily registration stats'
+
+class RollupState(models.Model):
+    """How far each rollup has been brought up to date"""
+    name = models.CharField(max_length=30, primary_key=True)
+    watermark = models.DateTimeField(null=True)
+    
+    def __str__(self):
+        return f"{self.name} @ {self.watermark}"
+
+class RollupDirtyDay(models.Model):
+    """A day whose rollup rows must be rebuilt, e.g. after a deletion the watermark cannot see"""
+    rollup = models.CharField(max_length=30)
+    date = models.DateField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['rollup', 'date'], name='unique_rollup_dirty_day'),
+        ]
+
+
+# Offline sync for health workers, maintained by health.sync
+
+class SyncChange(models.Model):
+    """One write to a synced record; the id orders the feed clients pull from"""
+    KINDS = [
+        ('patient', 'Patient'),
+        ('appointment', 'Appointment'),
+        ('file', 'Medical File'),
+    ]
+    
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=12, choices=KINDS)
+    key = models.CharField(max_length=36)  # Aadhar, appointment code or file id
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(auto_now_add=True)
+    
+    @classmethod
+    def record(cls, kind, key, deleted=False):
+        cls.objects.create(kind=kind, key=str(key), deleted=deleted)
+    
+    @classmethod
+    def record_many(cls, kind, keys):
+        """record() for rows written by bulk_create or update(), which send no signals"""
+        cls.objects.bulk_create([cls(kind=kind, key=str(key)) for key in keys])
+    
+    def __str__(self):
+        return f"#{self.id} {self.kind} {self.key}{' deleted' if self.deleted else ''}"
+
+class SyncOperation(models.Model):
+    """A successful offline operation, so a retried push returns the same result instead of repeating it"""
+    worker = models.ForeignKey(HealthWorker, on_delete=models.CASCADE, related_name='sync_operations')
+    key = models.CharField(max_length=64)  # Idempotency key chosen by the client
+    operation = models.CharField(max_length=30)
+    result = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['worker', 'key'], name='unique_sync_operation'),
+        ]
+    
+    def __str__(self):
+        return f"{self.worker_id} {self.key} {self.operation}"
@@ -0,0 +1,191 @@
+"""
+Writes shared by the single-record views, /api/batch and the offline sync push.
+
+Each takes the JSON fields a client sends, validates them the way the
+view always has and raises ValidationError with the message to return.
+apply_operations() runs a list of them in one transaction.
+"""
+import io
+from contextvars import ContextVar
+
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import transaction
+
+from .blobstore import decode_data_url
+from .cache import get_patient_cache, profile_of
+from .models import Appointment, Blob, MedicalFile, Patient
+from .slots import SlotUnavailable, book_slot
+from .validation import clean_patient
+
+# (digest, size) of the content apply_operations() stored, whose Blob rows a rollback may undo
+_stored_blobs = ContextVar('stored_blobs', default=None)
+
+
+def existing_patient(aadhar, patients=None):
+    """
+    Return the Aadhar of an existing patient, or raise ValidationError.
+
+    ``patients`` maps Aadhar numbers to profiles already looked up.
+    """
+    if patients is not None and aadhar in patients:
+        return aadhar
+    try:
+        return get_patient_cache().get(aadhar)['aadhar']
+    except ObjectDoesNotExist:
+        raise ValidationError('Patient not found')
+
+
+def register_patient(data):
+    """Create and return a Patient"""
+    fields = clean_patient(data)
+    if Patient.objects.filter(aadhar=fields['aadhar']).exists():
+        raise ValidationError('Patient with this Aadhar already exists')
+    return Patient.objects.create(**fields)
+
+
+def book_appointment(data, patients=None):
+    """Book into a slot (``slot_id``) or make a free-text appointment; return the Appointment"""
+    patient_aadhar = str(data.get('patient_aadhar') or '').strip()
+    slot_id = data.get('slot_id')
+    hospital = str(data.get('hospital') or '').strip()
+    doctor_name = str(data.get('doctor_name') or '').strip()
+    appointment_date = str(data.get('appointment_date') or '').strip()
+    appointment_time = str(data.get('appointment_time') or '').strip()
+
+    if slot_id is None and not all([patient_aadhar, hospital, doctor_name, appointment_date, appointment_time]):
+        raise ValidationError('All fields are required')
+    if not patient_aadhar:
+        raise ValidationError('Patient Aadhar is required')
+
+    patient_aadhar = existing_patient(patient_aadhar, patients)
+
+    if slot_id is not None:
+        # Structured booking against a slot's capacity
+        try:
+            return book_slot(patient_aadhar, int(slot_id))
+        except (TypeError, ValueError):
+            raise ValidationError('Slot not found')
+        except SlotUnavailable as e:
+            raise ValidationError(str(e))
+
+    # Free-text booking for hospitals without published schedules
+    return Appointment.objects.create(
+        patient_id=patient_aadhar,
+        hospital=hospital,
+        doctor_name=doctor_name,
+        appointment_date=appointment_date,
+        appointment_time=appointment_time
+    )
+
+
+def clean_upload(data):
+    """
+    Validate a data URL upload; return (MedicalFile fields, raw bytes).
+
+    The patient is not looked up: ``patient_aadhar`` is returned as given.
+    """
+    patient_aadhar = str(data.get('patient_aadhar') or '').strip()
+    file_name = str(data.get('file_name') or '').strip()
+    file_data = str(data.get('file_data') or '')
+    uploader_type = str(data.get('uploader_type') or '')
+
+    if not all([patient_aadhar, file_name, file_data, uploader_type]):
+        raise ValidationError('Required fields missing')
+
+    try:
+        mime_type, raw = decode_data_url(file_data)
+    except ValueError as e:
+        raise ValidationError(str(e))
+
+    return {
+        'patient_id': patient_aadhar,
+        'file_name': file_name,
+        'file_type': data.get('file_type') or mime_type,
+        'file_size': data.get('file_size', 0),
+        'uploader_type': uploader_type,
+        'uploader_id': data.get('uploader_id', ''),
+    }, raw
+
+
+def upload_file(data, patients=None):
+    """Store a data URL upload in the blob store and return the MedicalFile"""
+    fields, raw = clean_upload(data)
+    fields['patient_id'] = existing_patient(fields['patient_id'], patients)
+    medical_file = MedicalFile(**fields)
+    medical_file.store_content(io.BytesIO(raw))
+    stored = _stored_blobs.get()
+    if stored is not None:
+        stored.append((medical_file.content_hash, medical_file.file_size))
+    medical_file.save()
+    return medical_file
+
+
+def _register_patient(data, patients):
+    patient = register_patient(data)
+    patients[patient.aadhar] = profile_of(patient)  # Later operations may refer to it
+    return {'aadhar': patient.aadhar}
+
+
+# Operation name -> handler(data, patients) returning the result fields sent back on success
+OPERATIONS = {
+    'register_patient': _register_patient,
+    'book_appointment': lambda data, patients: {
+        'appointment_code': book_appointment(data, patients).appointment_code},
+    'upload_file': lambda data, patients: {'file_id': str(upload_file(data, patients).id)},
+}
+
+
+class _RollBack(Exception):
+    pass
+
+
+def _apply(op, data, patients):
+    handler = OPERATIONS.get(op)
+    if handler is None:
+        return {'success': False, 'error': f'Unknown operation {op!r}'}
+    try:
+        # A savepoint, so a failed operation leaves the others intact
+        with transaction.atomic():
+            return {'success': True, **handler(data if isinstance(data, dict) else {}, patients)}
+    except ValidationError as e:
+        return {'success': False, 'error': e.messages[0]}
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+
+def apply_operations(items, all_or_nothing=False):
+    """
+    Apply (operation name, data) pairs in order; return (results, committed).
+
+    Everything runs in one transaction, and the patients the operations
+    refer to are looked up together first. A failed operation is reported
+    in its result and the others still commit, unless ``all_or_nothing``:
+    then the first failure rolls back the batch and the later operations
+    are skipped.
+    """
+    aadhars = {str(data.get('patient_aadhar') or '').strip() for _, data in items if isinstance(data, dict)}
+    aadhars.discard('')
+    results = []
+    token = _stored_blobs.set([])
+    try:
+        with transaction.atomic():
+            # Patients registered within the batch are added as it goes
+            patients = get_patient_cache().get_many(aadhars) if aadhars else {}
+            for op, data in items:
+                results.append(_apply(op, data, patients))
+                if all_or_nothing and not results[-1]['success']:
+                    raise _RollBack
+    except _RollBack:
+        failed = len(results) - 1
+        for result in results[:failed]:
+            result.clear()
+            result.update(success=False, error=f'Rolled back, operation {failed + 1} failed')
+        results += [{'success': False, 'error': 'Skipped'} for _ in items[len(results):]]
+        return results, False
+    finally:
+        # Rows of content whose upload was rolled back are gone with it, and
+        # without one gc_blobs would never find the bytes
+        for digest, size in _stored_blobs.get():
+            Blob.touch(digest, size)
+        _stored_blobs.reset(token)
+    return results, True
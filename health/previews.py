@@ -0,0 +1,92 @@
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .blobstore import get_blob_store
+from .models import Blob
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Pillow is optional; without it no previews are made
+    Image = None
+
+try:
+    import fitz  # PyMuPDF, optional, renders the first page of PDFs
+except ImportError:
+    fitz = None
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_SIZE = (256, 256)
+PDF_ZOOM = 0.5
+
+_executor = None
+
+
+def can_preview(mime_type):
+    if Image is None:
+        return False
+    return mime_type.startswith('image/') or (mime_type == 'application/pdf' and fitz is not None)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'HEALTH_PREVIEW_WORKERS', 2),
+            thread_name_prefix='health-preview',
+        )
+    return _executor
+
+
+def schedule_preview(digest, mime_type):
+    """Queue preview generation for a blob once the current transaction commits"""
+    if can_preview(mime_type):
+        transaction.on_commit(lambda: get_executor().submit(_generate_in_worker, digest, mime_type))
+
+
+def render_preview(fileobj, mime_type):
+    """Return (preview bytes, preview MIME type) for an image or PDF"""
+    if mime_type == 'application/pdf':
+        with fitz.open(stream=fileobj.read(), filetype='pdf') as doc:
+            pixmap = doc[0].get_pixmap(matrix=fitz.Matrix(PDF_ZOOM, PDF_ZOOM))
+            image = Image.open(io.BytesIO(pixmap.tobytes('png')))
+    else:
+        image = Image.open(fileobj)
+        image.draft('RGB', PREVIEW_SIZE)  # Lets JPEGs decode at a reduced scale
+        image = ImageOps.exif_transpose(image)
+
+    image = image.convert('RGB')
+    image.thumbnail(PREVIEW_SIZE)
+
+    out = io.BytesIO()
+    if features.check('webp'):
+        image.save(out, 'WEBP', quality=70)
+        return out.getvalue(), 'image/webp'
+    image.save(out, 'JPEG', quality=70, optimize=True)
+    return out.getvalue(), 'image/jpeg'
+
+
+def _generate_in_worker(digest, mime_type):
+    try:
+        generate_preview(digest, mime_type)
+    finally:
+        # Worker threads hold their own DB connection; don't leak it
+        connection.close()
+
+
+def generate_preview(digest, mime_type):
+    """Build and cache the preview of one blob"""
+    try:
+        if Blob.objects.filter(sha256=digest).exclude(preview_hash='').exists():
+            return
+        store = get_blob_store()
+        with store.open(digest) as fileobj:
+            data, preview_type = render_preview(fileobj, mime_type)
+        preview_hash, _ = store.put_bytes(data)
+        Blob.objects.filter(sha256=digest).update(preview_hash=preview_hash, preview_type=preview_type)
+    except Exception:
+        logger.exception('Preview generation failed for %s', digest)
@@ -0,0 +1,45 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core import signing
+
+SALT = 'health.qr'
+
+
+class TokenExpired(signing.BadSignature):
+    pass
+
+
+def profile_version(profile):
+    """Short fingerprint of the displayed fields, used to tell if a token is stale"""
+    fields = '|'.join(str(profile.get(key) or '') for key in ('name', 'phone', 'email'))
+    return hashlib.sha256(fields.encode()).hexdigest()[:8]
+
+
+def issue_token(profile):
+    """
+    Sign a compact QR payload carrying the patient's display fields.
+
+    The payload is plain base64 JSON so a scanner can show the patient
+    straight away, even offline; only the server can check the signature.
+    """
+    max_age = getattr(settings, 'HEALTH_QR_TOKEN_MAX_AGE', 365 * 24 * 60 * 60)
+    payload = {
+        'a': profile['aadhar'],
+        'n': profile['name'],
+        'p': profile['phone'],
+        'v': profile_version(profile),
+        'x': int(time.time()) + max_age,
+    }
+    return signing.dumps(payload, salt=SALT)
+
+
+def read_token(token):
+    """Return the payload of a valid token, or raise BadSignature / TokenExpired"""
+    payload = signing.loads(token, salt=SALT)
+    if not isinstance(payload, dict) or 'a' not in payload:
+        raise signing.BadSignature('Malformed token')
+    if payload.get('x', 0) < time.time():
+        raise TokenExpired('Token expired')
+    return payload
@@ -0,0 +1,189 @@
+"""
+Daily rollups behind the analytics API.
+
+refresh() finds the days touched since each rollup's watermark and
+rebuilds only those days' rows from the source tables, so a refresh costs
+a few indexed range queries however much history there is. Rows removed
+from a source, or moved to another day, cannot be seen through a
+watermark, so deletions and moves mark their days dirty through signals
+instead. Rebuilding a day is idempotent, which
+lets every scan start SAFETY_LAG before the watermark to catch rows from
+transactions that committed late.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import (Appointment, DailyAppointmentStats, DailyRegistrationStats, DailyUploadStats, Doctor,
+                     HealthWorker, MedicalFile, Patient, RollupDirtyDay, RollupState)
+
+SAFETY_LAG = timedelta(minutes=5)
+DAYS_PER_QUERY = 100
+
+
+def day_range(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+class Source:
+    """
+    One source table of a rollup.
+
+    ``day_field`` is a DateField, or a DateTimeField bucketed by local date;
+    ``changed_field`` is the timestamp the watermark is compared with. Rows
+    are grouped by ``dimensions``, fields shared with the stats model, and
+    ``constants`` fill in stats fields the source does not have.
+    """
+
+    def __init__(self, model, day_field, changed_field, dimensions=(), constants=None, metrics=None):
+        self.model = model
+        self.day_field = day_field
+        self.changed_field = changed_field
+        self.dimensions = list(dimensions)
+        self.constants = constants or {}
+        self.metrics = metrics or {'count': Count('pk')}
+
+    @property
+    def is_datetime(self):
+        return self.model._meta.get_field(self.day_field).get_internal_type() == 'DateTimeField'
+
+    def day_expression(self):
+        return TruncDate(self.day_field) if self.is_datetime else F(self.day_field)
+
+    def day_of(self, instance):
+        value = self.model._meta.get_field(self.day_field).to_python(getattr(instance, self.day_field))
+        return timezone.localdate(value) if self.is_datetime else value
+
+    def stored_day(self, instance):
+        """The day of ``instance`` as last saved, if its day can be edited; else None"""
+        if instance._state.adding or not self.model._meta.get_field(self.day_field).editable:
+            return None
+        stored = self.model.objects.filter(pk=instance.pk).only(self.day_field).first()
+        return None if stored is None else self.day_of(stored)
+
+    def changed_days(self, since):
+        rows = self.model.objects.filter(**{f'{self.changed_field}__gte': since})
+        return set(rows.annotate(rollup_day=self.day_expression())
+                   .values_list('rollup_day', flat=True).distinct())
+
+    def aggregate(self, days=None):
+        rows = self.model.objects.all()
+        if days is not None:
+            if self.is_datetime:
+                condition = Q()
+                for day in days:
+                    start, end = day_range(day)
+                    condition |= Q(**{f'{self.day_field}__gte': start, f'{self.day_field}__lt': end})
+                rows = rows.filter(condition)
+            else:
+                rows = rows.filter(**{f'{self.day_field}__in': days})
+        groups = (rows.annotate(rollup_day=self.day_expression())
+                  .values('rollup_day', *self.dimensions)
+                  .annotate(**self.metrics)
+                  .order_by())
+        for values in groups:
+            values.update(self.constants)
+            yield values
+
+
+class Rollup:
+    """A daily stats table, the sources it is built from, and what it can be queried by"""
+
+    def __init__(self, name, stats_model, sources, dimensions, metrics):
+        self.name = name
+        self.stats_model = stats_model
+        self.sources = sources
+        self.dimensions = dimensions
+        self.metrics = metrics
+
+    def query(self, start, end, group_by=(), filters=None):
+        """Sum the metrics of the days from ``start`` to ``end`` inclusive, grouped by ``group_by``"""
+        rows = self.stats_model.objects.filter(date__gte=start, date__lte=end, **(filters or {}))
+        totals = {metric: Sum(metric) for metric in self.metrics}
+        if not group_by:
+            return [{metric: value or 0 for metric, value in rows.aggregate(**totals).items()}]
+        return list(rows.values(*group_by).annotate(**totals).order_by(*group_by))
+
+    def rebuild(self, days=None):
+        """Recompute the rows of the given days, or of all days"""
+        with transaction.atomic():
+            if days is None:
+                self.stats_model.objects.all().delete()
+                self._insert(None)
+                return
+            days = sorted(days)
+            for offset in range(0, len(days), DAYS_PER_QUERY):
+                chunk = days[offset:offset + DAYS_PER_QUERY]
+                self.stats_model.objects.filter(date__in=chunk).delete()
+                self._insert(chunk)
+
+    def _insert(self, days):
+        rows = []
+        for source in self.sources:
+            for values in source.aggregate(days):
+                values['date'] = values.pop('rollup_day')
+                rows.append(self.stats_model(**values))
+        self.stats_model.objects.bulk_create(rows, batch_size=1000)
+
+    def refresh(self, full=False):
+        """
+        Bring the rollup up to date; returns the number of days rebuilt, None for all.
+
+        Run one refresh at a time, e.g. from cron through refresh_rollups.
+        """
+        started = timezone.now()
+        state, _ = RollupState.objects.get_or_create(name=self.name)
+        dirty = RollupDirtyDay.objects.filter(rollup=self.name)
+        if full or state.watermark is None:
+            days = None
+            dirty_ids = list(dirty.values_list('id', flat=True))
+        else:
+            since = state.watermark - SAFETY_LAG
+            days = set()
+            for source in self.sources:
+                days |= source.changed_days(since)
+            dirty_rows = list(dirty.values_list('id', 'date'))
+            dirty_ids = [pk for pk, _ in dirty_rows]
+            days |= {day for _, day in dirty_rows}
+        with transaction.atomic():
+            self.rebuild(days)
+            RollupDirtyDay.objects.filter(id__in=dirty_ids).delete()
+            RollupState.objects.filter(name=self.name).update(watermark=started)
+        return None if days is None else len(days)
+
+    def mark_dirty(self, instance):
+        for source in self.sources:
+            if isinstance(instance, source.model):
+                RollupDirtyDay.objects.bulk_create(
+                    [RollupDirtyDay(rollup=self.name, date=source.day_of(instance))], ignore_conflicts=True)
+
+    def mark_moved(self, instance):
+        """Before ``instance`` is saved, mark its old and new day dirty if it moves to another day"""
+        for source in self.sources:
+            if isinstance(instance, source.model):
+                old_day = source.stored_day(instance)
+                new_day = source.day_of(instance)
+                if old_day is not None and old_day != new_day:
+                    RollupDirtyDay.objects.bulk_create(
+                        [RollupDirtyDay(rollup=self.name, date=day) for day in (old_day, new_day)],
+                        ignore_conflicts=True)
+
+
+ROLLUPS = {
+    'appointments': Rollup('appointments', DailyAppointmentStats, [
+        Source(Appointment, 'appointment_date', 'updated_at', dimensions=['hospital', 'doctor_name', 'status']),
+    ], dimensions=['date', 'hospital', 'doctor_name', 'status'], metrics=['count']),
+    'uploads': Rollup('uploads', DailyUploadStats, [
+        Source(MedicalFile, 'uploaded_at', 'uploaded_at', dimensions=['uploader_type', 'file_type'],
+               metrics={'count': Count('pk'), 'bytes': Sum('file_size')}),
+    ], dimensions=['date', 'uploader_type', 'file_type'], metrics=['count', 'bytes']),
+    'registrations': Rollup('registrations', DailyRegistrationStats, [
+        Source(Patient, 'created_at', 'created_at', constants={'kind': 'patient'}),
+        Source(Doctor, 'created_at', 'created_at', constants={'kind': 'doctor'}),
+        Source(HealthWorker, 'created_at', 'created_at', constants={'kind': 'worker'}),
+    ], dimensions=['date', 'kind'], metrics=['count']),
+}
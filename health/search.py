@@ -0,0 +1,314 @@
+import html
+import re
+import unicodedata
+import uuid
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Doctor
+
+DOCTOR_INDEX = 'health_doctor_fts'
+DOCTOR_WORDS = 'health_doctor_word'
+RECORD_INDEX = 'health_record_fts'
+CANDIDATE_LIMIT = 200
+# bm25() column weights: a word in the name counts for more than one in the hospital
+NAME_WEIGHT = 3.0
+HOSPITAL_WEIGHT = 1.0
+MIN_TERM_LENGTH = 2
+MIN_FUZZY_LENGTH = 4  # Shorter words are only matched as prefixes
+MAX_CORRECTIONS = 3
+MIN_SIMILARITY = 0.3
+
+_WORD_RE = re.compile(r'[^\W_]+')
+
+
+def fts_available():
+    return connection.vendor == 'sqlite'
+
+
+def words(text):
+    """Lowercase words of ``text`` with accents removed, as FTS5's unicode61 tokenizer sees them"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _WORD_RE.findall(text)
+
+
+def trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a, b):
+    """Trigram (Jaccard) similarity of two words, from 0 to 1"""
+    a, b = trigrams(a), trigrams(b)
+    return len(a & b) / len(a | b)
+
+
+# Doctors are looked up in the index by doctor_id, an indexed column that
+# searches leave out. The table's own rowid is not stable: SQLite renumbers
+# it when a migration rebuilds health_doctor.
+DOCTOR_ROWS = f'SELECT rowid FROM {DOCTOR_INDEX} WHERE {DOCTOR_INDEX} MATCH %s AND doctor_id = %s'
+
+
+def _doctor_key(doctor_id):
+    return [f'doctor_id : {_quote(doctor_id)}', doctor_id]
+
+
+def index_doctor(doctor, created=False):
+    """Insert or refresh a doctor's row in the search index; a new doctor has no row to replace"""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        if not created:
+            cursor.execute(f'DELETE FROM {DOCTOR_INDEX} WHERE rowid IN ({DOCTOR_ROWS})',
+                           _doctor_key(doctor.doctor_id))
+        cursor.execute(f'INSERT INTO {DOCTOR_INDEX} (doctor_id, name, hospital) VALUES (%s, %s, %s)',
+                       [doctor.doctor_id, doctor.name, doctor.hospital])
+        vocabulary = sorted(set(words(f'{doctor.name} {doctor.hospital}')))
+        if vocabulary:
+            cursor.execute(f'INSERT OR IGNORE INTO {DOCTOR_WORDS} (word) VALUES '
+                           + ', '.join(['(%s)'] * len(vocabulary)), vocabulary)
+
+
+def unindex_doctor(doctor):
+    """Remove a doctor from the search index; call before the row is deleted"""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {DOCTOR_INDEX} WHERE rowid IN ({DOCTOR_ROWS})', _doctor_key(doctor.doctor_id))
+
+
+def rebuild_doctor_index():
+    """Repopulate the doctor index, e.g. after doctors were bulk-loaded without signals"""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {DOCTOR_INDEX}')
+        cursor.execute(f'DELETE FROM {DOCTOR_WORDS}')
+        cursor.execute(f'INSERT INTO {DOCTOR_INDEX} (doctor_id, name, hospital) '
+                       'SELECT doctor_id, name, hospital FROM health_doctor')
+        vocabulary = set()
+        for name, hospital in Doctor.objects.values_list('name', 'hospital').iterator():
+            vocabulary.update(words(f'{name} {hospital}'))
+        cursor.executemany(f'INSERT INTO {DOCTOR_WORDS} (word) VALUES (%s)',
+                           [(word,) for word in vocabulary])
+
+
+def _known_prefix(cursor, term):
+    cursor.execute(f'SELECT 1 FROM {DOCTOR_WORDS} WHERE word >= %s AND word < %s LIMIT 1',
+                   [term, term + '\U0010ffff'])
+    return cursor.fetchone() is not None
+
+
+def _corrections(cursor, term):
+    # Assume the first letter is right, which keeps the scan to one slice of the vocabulary
+    cursor.execute(f'SELECT word FROM {DOCTOR_WORDS} WHERE word >= %s AND word < %s',
+                   [term[0], term[0] + '\U0010ffff'])
+    scored = []
+    for word, in cursor.fetchall():
+        if abs(len(word) - len(term)) <= 2:
+            score = similarity(term, word)
+            if score >= MIN_SIMILARITY:
+                scored.append((score, word))
+    scored.sort(reverse=True)
+    return [word for _, word in scored[:MAX_CORRECTIONS]]
+
+
+def _quote(word):
+    return '"%s"' % word.replace('"', '""')
+
+
+def _match_expression(cursor, terms):
+    """FTS5 query ANDing every term, as a prefix or, if unknown, as its closest words, in name or hospital"""
+    clauses = []
+    for term in terms:
+        if _known_prefix(cursor, term):
+            clauses.append(_quote(term) + '*')
+            continue
+        corrections = _corrections(cursor, term) if len(term) >= MIN_FUZZY_LENGTH else []
+        if not corrections:
+            return None
+        clauses.append('(' + ' OR '.join(_quote(word) for word in corrections) + ')')
+    return '{name hospital} : (%s)' % ' AND '.join(clauses)
+
+
+def _fallback_search(terms, specialization, limit, offset):
+    doctors = Doctor.objects.all()
+    for term in terms:
+        doctors = doctors.filter(Q(name__icontains=term) | Q(hospital__icontains=term))
+    if specialization:
+        doctors = doctors.filter(specialization=specialization)
+    return list(doctors.order_by('name', 'doctor_id')[offset:offset + limit])
+
+
+def search_doctors(query, specialization=None, limit=CANDIDATE_LIMIT, offset=0):
+    """
+    Return doctors whose name or hospital match every word of ``query``.
+
+    Words match as prefixes of indexed words; a word that prefixes nothing
+    in the index is replaced by its closest indexed spellings. Doctors are
+    ranked in SQL, matches in the name before matches in the hospital, so
+    ``limit`` and ``offset`` page through the whole ranking.
+    """
+    terms = [term for term in words(query) if len(term) >= MIN_TERM_LENGTH]
+    if not terms:
+        return []
+    if not fts_available():
+        return _fallback_search(terms, specialization, limit, offset)
+
+    with connection.cursor() as cursor:
+        expression = _match_expression(cursor, terms)
+        if expression is None:
+            return []
+        sql = ('SELECT d.doctor_id, d.name, d.specialization, d.hospital '
+               f'FROM {DOCTOR_INDEX} f JOIN health_doctor d ON d.doctor_id = f.doctor_id '
+               f'WHERE {DOCTOR_INDEX} MATCH %s')
+        params = [expression]
+        if specialization:
+            sql += ' AND d.specialization = %s'
+            params.append(specialization)
+        sql += f' ORDER BY bm25({DOCTOR_INDEX}, 0, {NAME_WEIGHT}, {HOSPITAL_WEIGHT}), d.name, d.doctor_id LIMIT %s OFFSET %s'
+        params += [limit, offset]
+        cursor.execute(sql, params)
+        return [Doctor(doctor_id=doctor_id, name=name, specialization=spec, hospital=hospital)
+                for doctor_id, name, spec, hospital in cursor.fetchall()]
+
+
+# Patient records: medical files and appointments share one index, always
+# queried together with the patient's Aadhar number. Rows are looked up by
+# kind and ref (file ID or appointment code), never by the source table's
+# rowid, which SQLite renumbers when a migration rebuilds the table.
+
+RECORD_ROWS = f'SELECT rowid FROM {RECORD_INDEX} WHERE {RECORD_INDEX} MATCH %s AND kind = %s AND ref = %s'
+RECORD_COLUMNS = 'patient, kind, ref, title, details'
+FILE_RECORD_SQL = (
+    "SELECT f.patient_id, 'file', f.id, f.file_name, "
+    "f.file_type || ' ' || f.uploader_type || ' ' || f.uploader_id "
+    'FROM health_medicalfile f'
+)
+APPOINTMENT_RECORD_SQL = (
+    "SELECT a.patient_id, 'appointment', a.appointment_code, a.doctor_name, "
+    "a.hospital || ' ' || a.status || ' ' || a.appointment_date "
+    'FROM health_appointment a'
+)
+SNIPPET_START, SNIPPET_END = '\x02', '\x03'
+
+
+def _record_key(kind, ref):
+    return [f'ref : {_quote(ref)}', kind, ref]
+
+
+def _index_record(cursor, kind, ref, source_sql, params, created):
+    """Refresh a record's metadata, keeping its extracted text, or insert it"""
+    if not created:
+        cursor.execute(f'UPDATE {RECORD_INDEX} SET ({RECORD_COLUMNS}) = ({source_sql}) '
+                       f'WHERE rowid IN ({RECORD_ROWS})', params + _record_key(kind, ref))
+        if cursor.rowcount:
+            return
+    cursor.execute(f"INSERT INTO {RECORD_INDEX} ({RECORD_COLUMNS}, content) "
+                   f"SELECT *, '' FROM ({source_sql})", params)
+
+
+def index_medical_file(medical_file, created=False):
+    """Insert or refresh a file's metadata in the record index, keeping any extracted text"""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        _index_record(cursor, 'file', medical_file.pk.hex, FILE_RECORD_SQL + ' WHERE f.id = %s',
+                      [medical_file.pk.hex], created)
+
+
+def set_medical_file_text(file_id, text):
+    """Store text extracted from a file's content in the record index"""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'UPDATE {RECORD_INDEX} SET content = %s WHERE rowid IN ({RECORD_ROWS})',
+                       [text] + _record_key('file', uuid.UUID(str(file_id)).hex))
+
+
+def unindex_medical_file(medical_file):
+    """Remove a file from the record index"""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {RECORD_INDEX} WHERE rowid IN ({RECORD_ROWS})',
+                       _record_key('file', medical_file.pk.hex))
+
+
+def index_appointment(appointment, created=False):
+    """Insert or refresh an appointment in the record index"""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        _index_record(cursor, 'appointment', appointment.appointment_code,
+                      APPOINTMENT_RECORD_SQL + ' WHERE a.id = %s', [appointment.pk], created)
+
+
+def unindex_appointment(appointment):
+    """Remove an appointment from the record index"""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {RECORD_INDEX} WHERE rowid IN ({RECORD_ROWS})',
+                       _record_key('appointment', appointment.appointment_code))
+
+
+def rebuild_record_index():
+    """Repopulate file and appointment metadata; extracted text of files is kept"""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {RECORD_INDEX} WHERE kind != 'file' "
+                       'OR ref NOT IN (SELECT id FROM health_medicalfile)')
+        cursor.execute(f'DELETE FROM {RECORD_INDEX} WHERE rowid NOT IN '
+                       f'(SELECT MIN(rowid) FROM {RECORD_INDEX} GROUP BY ref)')
+        cursor.execute(f'UPDATE {RECORD_INDEX} SET ({RECORD_COLUMNS}) = '
+                       f'({FILE_RECORD_SQL} WHERE f.id = {RECORD_INDEX}.ref)')
+        cursor.execute(f"INSERT INTO {RECORD_INDEX} ({RECORD_COLUMNS}, content) SELECT *, '' FROM "
+                       f'({FILE_RECORD_SQL} WHERE f.id NOT IN (SELECT ref FROM {RECORD_INDEX}))')
+        cursor.execute(f"INSERT INTO {RECORD_INDEX} ({RECORD_COLUMNS}, content) "
+                       f"SELECT *, '' FROM ({APPOINTMENT_RECORD_SQL})")
+
+
+def _highlight(snippet):
+    return (html.escape(snippet)
+            .replace(SNIPPET_START, '<mark>')
+            .replace(SNIPPET_END, '</mark>'))
+
+
+def search_patient_records(aadhar, query, limit, offset=0):
+    """
+    Full-text search of one patient's files and appointments, best match first.
+
+    Every query word must match, as a prefix, the file name, type, uploader,
+    extracted text, or the appointment's doctor, hospital, status or date.
+    Returns dicts with ``kind`` ('file' or 'appointment'), ``ref`` (file ID or
+    appointment code), ``title`` and an HTML ``snippet`` with <mark> around hits.
+    """
+    terms = words(query)
+    if not terms or not fts_available():
+        return []
+    expression = ('patient : %s AND {title details content} : (%s)'
+                  % (_quote(aadhar), ' AND '.join(_quote(term) + '*' for term in terms)))
+    # One snippet per searchable column (content, details, title), since the
+    # always-matching patient column would win snippet()'s own column choice
+    snippet = f'snippet({RECORD_INDEX}, %s, %s, %s, %s, 12)'
+    params = []
+    for column in (5, 4, 3):
+        params += [column, SNIPPET_START, SNIPPET_END, '\u2026']
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT kind, ref, title, {snippet}, {snippet}, {snippet} '
+            f'FROM {RECORD_INDEX} WHERE {RECORD_INDEX} MATCH %s '
+            f'ORDER BY bm25({RECORD_INDEX}, 0, 0, 0, 4.0, 2.0, 1.0) LIMIT %s OFFSET %s',
+            params + [expression, limit, offset],
+        )
+        rows = cursor.fetchall()
+    return [{
+        'kind': kind,
+        'ref': str(uuid.UUID(ref)) if kind == 'file' else ref,
+        'title': title,
+        'snippet': _highlight(next((s for s in snippets if SNIPPET_START in s), title)),
+    } for kind, ref, title, *snippets in rows]
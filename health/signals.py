@@ -0,0 +1,114 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .cache import get_patient_cache
+from .compression import schedule_compression
+from .extraction import schedule_extraction
+from .models import Appointment, Blob, Doctor, HealthWorker, MedicalFile, Patient, SyncChange
+from .previews import schedule_preview
+from .rollups import ROLLUPS
+from .search import (index_appointment, index_doctor, index_medical_file, unindex_appointment,
+                     unindex_doctor, unindex_medical_file)
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def invalidate_cached_patient(sender, instance, **kwargs):
+    cache = get_patient_cache()
+    cache.invalidate(instance.aadhar)
+    # A lookup made before the commit may have cached the old row again
+    transaction.on_commit(lambda: cache.invalidate(instance.aadhar))
+
+
+@receiver(post_save, sender=MedicalFile)
+def acquire_medical_file_blob(sender, instance, created, raw=False, **kwargs):
+    if created and instance.content_hash and not raw:
+        Blob.acquire(instance.content_hash, instance.file_size)
+        schedule_preview(instance.content_hash, instance.file_type)
+        schedule_compression(instance.content_hash, instance.file_type)
+
+
+@receiver(post_save, sender=MedicalFile)
+def index_saved_medical_file(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        index_medical_file(instance, created)
+        if created:
+            schedule_extraction(instance)
+
+
+@receiver(pre_delete, sender=MedicalFile)
+def unindex_deleted_medical_file(sender, instance, **kwargs):
+    unindex_medical_file(instance)
+
+
+@receiver(post_delete, sender=MedicalFile)
+def release_medical_file_blob(sender, instance, **kwargs):
+    if instance.content_hash:
+        Blob.release(instance.content_hash)
+
+
+@receiver(post_save, sender=Doctor)
+def index_saved_doctor(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        index_doctor(instance, created)
+
+
+@receiver(pre_delete, sender=Doctor)
+def unindex_deleted_doctor(sender, instance, **kwargs):
+    unindex_doctor(instance)
+
+
+@receiver(post_save, sender=Appointment)
+def index_saved_appointment(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        index_appointment(instance, created)
+
+
+@receiver(pre_delete, sender=Appointment)
+def unindex_deleted_appointment(sender, instance, **kwargs):
+    unindex_appointment(instance)
+
+
+@receiver(post_delete, sender=Patient)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_delete, sender=HealthWorker)
+@receiver(post_delete, sender=MedicalFile)
+@receiver(post_delete, sender=Appointment)
+def mark_rollup_day_dirty(sender, instance, **kwargs):
+    # The refresher's watermark cannot see rows that are gone
+    for rollup in ROLLUPS.values():
+        rollup.mark_dirty(instance)
+
+
+@receiver(pre_save, sender=Appointment)
+def mark_moved_rollup_day_dirty(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Nor the day a row was moved away from
+    if raw or (update_fields is not None and 'appointment_date' not in update_fields):
+        return
+    for rollup in ROLLUPS.values():
+        rollup.mark_moved(instance)
+
+
+SYNC_KINDS = {
+    Patient: ('patient', 'aadhar'),
+    Appointment: ('appointment', 'appointment_code'),
+    MedicalFile: ('file', 'id'),
+}
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_save, sender=Appointment)
+@receiver(post_save, sender=MedicalFile)
+def record_sync_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        kind, field = SYNC_KINDS[sender]
+        SyncChange.record(kind, getattr(instance, field))
+
+
+@receiver(post_delete, sender=Patient)
+@receiver(post_delete, sender=Appointment)
+@receiver(post_delete, sender=MedicalFile)
+def record_sync_deletion(sender, instance, **kwargs):
+    kind, field = SYNC_KINDS[sender]
+    SyncChange.record(kind, getattr(instance, field), deleted=True)
@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Appointment, AppointmentSlot, DoctorSchedule, SyncChange
+from .search import index_appointment
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+def slot_times(schedule):
+    """Start times of the slots in one session of a schedule"""
+    step = timedelta(minutes=schedule.slot_minutes)
+    current = datetime.combine(datetime.min, schedule.start_time)
+    end = datetime.combine(datetime.min, schedule.end_time)
+    while current + step <= end:
+        yield current.time()
+        current += step
+
+
+def generate_slots(start_date, end_date, schedules=None):
+    """
+    Create the AppointmentSlot rows for every schedule between two dates.
+
+    Existing slots are left untouched (and keep their bookings), so this is
+    safe to run repeatedly, e.g. nightly for a rolling window.
+    Returns the number of slots considered.
+    """
+    if schedules is None:
+        schedules = DoctorSchedule.objects.all()
+    by_weekday = {}
+    for schedule in schedules:
+        by_weekday.setdefault(schedule.weekday, []).append(schedule)
+
+    slots = []
+    day = start_date
+    while day <= end_date:
+        for schedule in by_weekday.get(day.weekday(), []):
+            for start_time in slot_times(schedule):
+                slots.append(AppointmentSlot(
+                    doctor_id=schedule.doctor_id,
+                    hospital=schedule.hospital,
+                    date=day,
+                    start_time=start_time,
+                    capacity=schedule.capacity,
+                ))
+        day += timedelta(days=1)
+
+    AppointmentSlot.objects.bulk_create(slots, batch_size=500, ignore_conflicts=True)
+    return len(slots)
+
+
+def available_slots(start_date, end_date, hospital=None, doctor_id=None, specialization=None):
+    """Open slots in a date range, soonest first"""
+    slots = (AppointmentSlot.objects
+             .filter(date__gte=start_date, date__lte=end_date, booked__lt=F('capacity'))
+             .select_related('doctor')
+             .order_by('date', 'start_time'))
+    if hospital:
+        slots = slots.filter(hospital=hospital)
+    if doctor_id:
+        slots = slots.filter(doctor_id=doctor_id)
+    if specialization:
+        slots = slots.filter(doctor__specialization=specialization)
+    return slots
+
+
+def book_slot(patient_aadhar, slot_id):
+    """
+    Book a patient into a slot and return the Appointment.
+
+    Capacity is claimed with a single conditional UPDATE (``booked < capacity``),
+    so concurrent bookings can never overfill a slot and no table lock is
+    taken. Raises SlotUnavailable if the slot is full, missing, or already
+    booked by this patient.
+    """
+    try:
+        with transaction.atomic():
+            claimed = (AppointmentSlot.objects
+                       .filter(pk=slot_id, booked__lt=F('capacity'))
+                       .update(booked=F('booked') + 1))
+            if not claimed:
+                if AppointmentSlot.objects.filter(pk=slot_id).exists():
+                    raise SlotUnavailable('Slot is fully booked')
+                raise SlotUnavailable('Slot not found')
+            slot = AppointmentSlot.objects.select_related('doctor').get(pk=slot_id)
+            return Appointment.objects.create(
+                patient_id=patient_aadhar,
+                slot=slot,
+                hospital=slot.hospital,
+                doctor_name=slot.doctor.name,
+                appointment_date=slot.date,
+                appointment_time=slot.start_time.strftime('%H:%M'),
+            )
+    except IntegrityError:
+        # The partial unique constraint fired; the claim above was rolled back
+        raise SlotUnavailable('Patient already has this slot booked')
+
+
+def cancel_appointment(appointment_code):
+    """Cancel a scheduled appointment and give its place back to the slot"""
+    with transaction.atomic():
+        appointment = Appointment.objects.get(appointment_code=appointment_code)
+        cancelled = (Appointment.objects
+                     .filter(pk=appointment.pk, status='scheduled')
+                     .update(status='cancelled', updated_at=timezone.now()))
+        if cancelled:
+            # update() skips the post_save signal
+            index_appointment(appointment)
+            SyncChange.record('appointment', appointment.appointment_code)
+        if cancelled and appointment.slot_id:
+            (AppointmentSlot.objects
+             .filter(pk=appointment.slot_id, booked__gt=0)
+             .update(booked=F('booked') - 1))
+    return bool(cancelled)
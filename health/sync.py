@@ -0,0 +1,154 @@
+"""
+Delta sync for health workers who lose connectivity in camps.
+
+Every write to a patient, appointment or medical file appends a SyncChange
+(through signals, or SyncChange.record() where signals are bypassed).
+Its id only grows, and SQLite commits one write at a time, so a client can
+keep the cursor of the last change it has seen and pull the rest with
+changes_since(). Registrations and bookings made offline come back in one
+push, applied in a single transaction. Each operation carries an
+idempotency key chosen by the client, and a retried push returns the
+stored results instead of applying the operations again.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from . import operations
+from .cache import profile_of
+from .models import Appointment, MedicalFile, Patient, SyncChange, SyncOperation
+from .pagination import decode_cursor, encode_cursor
+
+DEFAULT_CHANGES = 500
+MAX_CHANGES = 2000
+MAX_OPERATIONS = 1000
+MAX_PUSH_BYTES = 20 * 1024 * 1024  # After inflating a gzip body
+
+
+def appointment_data(appointment):
+    return {
+        'code': appointment.appointment_code,
+        'patient_aadhar': appointment.patient_id,
+        'hospital': appointment.hospital,
+        'doctor_name': appointment.doctor_name,
+        'date': appointment.appointment_date.isoformat(),
+        'time': appointment.appointment_time,
+        'status': appointment.status,
+    }
+
+
+def file_data(medical_file):
+    return {
+        'id': str(medical_file.id),
+        'patient_aadhar': medical_file.patient_id,
+        'name': medical_file.file_name,
+        'type': medical_file.file_type,
+        'size': medical_file.file_size,
+        'uploader_type': medical_file.uploader_type,
+        'uploader_id': medical_file.uploader_id,
+        'uploaded_at': timezone.localtime(medical_file.uploaded_at).isoformat(),
+        'url': reverse('health:download_file', args=[medical_file.id]),
+    }
+
+
+# kind -> (queryset, key field, serializer); files are sent as metadata only
+SOURCES = {
+    'patient': (Patient.objects.only('aadhar', 'name', 'phone', 'email'), 'aadhar', profile_of),
+    'appointment': (Appointment.objects.all(), 'appointment_code', appointment_data),
+    'file': (MedicalFile.objects.defer('file_data', 'content_hash'), 'id', file_data),
+}
+
+
+def changes_since(cursor, limit):
+    """
+    Return (changes, next_cursor, more) for the changes after ``cursor``.
+
+    A record written several times within the page is sent once, at its
+    latest position, with its current state; ``data`` is None once it has
+    been deleted. Raises ValueError for a malformed cursor.
+    """
+    since = 0
+    if cursor:
+        try:
+            since, = decode_cursor(cursor)
+            since = int(since)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid cursor')
+
+    entries = list(SyncChange.objects.filter(id__gt=since).order_by('id')[:limit + 1])
+    more = len(entries) > limit
+    entries = entries[:limit]
+
+    latest = {}
+    for entry in entries:
+        latest.pop((entry.kind, entry.key), None)  # Move it to its latest position
+        latest[entry.kind, entry.key] = entry.id
+
+    current = {}
+    for kind, (queryset, field, serialize) in SOURCES.items():
+        keys = [key for entry_kind, key in latest if entry_kind == kind]
+        if keys:
+            for row in queryset.filter(**{f'{field}__in': keys}):
+                current[kind, str(getattr(row, field))] = serialize(row)
+
+    changes = [
+        {'seq': seq, 'kind': kind, 'key': key, 'data': current.get((kind, key))}
+        for (kind, key), seq in latest.items()
+    ]
+    next_cursor = encode_cursor(entries[-1].id) if entries else (cursor or encode_cursor(since))
+    return changes, next_cursor, more
+
+
+# Operations a worker may queue offline
+OPERATIONS = ('register_patient', 'book_appointment')
+
+
+def _clean_operations(items):
+    if not isinstance(items, list):
+        raise ValidationError('operations must be a list')
+    if len(items) > MAX_OPERATIONS:
+        raise ValidationError(f'At most {MAX_OPERATIONS} operations per push')
+    for item in items:
+        if not isinstance(item, dict) or not str(item.get('key') or '').strip():
+            raise ValidationError('Every operation needs an idempotency key')
+        if len(str(item['key']).strip()) > 64:
+            raise ValidationError('Idempotency keys are at most 64 characters')
+        if item.get('op') not in OPERATIONS:
+            raise ValidationError(f"Unknown operation {item.get('op')!r}")
+    return [(str(item['key']).strip(), item) for item in items]
+
+
+def apply_push(worker, items):
+    """
+    Apply a worker's offline operations in order and return one result each.
+
+    Operations are applied in one transaction, each in its own savepoint,
+    so one that fails is reported without undoing the others. Keys already
+    applied, earlier or in this push, return their stored result with
+    ``replayed`` set. Only successes are stored: a failed operation may
+    have failed for a passing reason, and runs again when pushed again.
+    """
+    items = _clean_operations(items)
+    with transaction.atomic():
+        stored = dict(SyncOperation.objects.filter(worker=worker, key__in={key for key, _ in items})
+                      .values_list('key', 'result'))
+        pending = {}  # The first operation of each new key
+        for key, item in items:
+            if key not in stored:
+                pending.setdefault(key, item)
+        results, _ = operations.apply_operations([(item['op'], item.get('data')) for item in pending.values()])
+        SyncOperation.objects.bulk_create([
+            SyncOperation(worker=worker, key=key, operation=item['op'], result=result)
+            for (key, item), result in zip(pending.items(), results) if result['success']
+        ])
+    stored.update(zip(pending, results))
+    fresh = set(pending)
+    replies = []
+    for key, _ in items:
+        if key in fresh:
+            fresh.discard(key)
+            replies.append({'key': key, **stored[key]})
+        else:
+            replies.append({'key': key, **stored[key], 'replayed': True})
+    return replies
@@ -1,3 +1,1353 @@
-from django.test import TestCase
+import base64
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+import zlib
+from datetime import date, time, timedelta
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import benchmark, export, logs, metrics, previews
+from .archive import archive_blob
+from .blobstore import ARCHIVE_CHUNK_SIZE, LocalBlobStore, StorageBlobStore, get_blob_store
+from .cache import get_patient_cache, profile_of
+from .compression import compress_blob
+from .db import ReadOnlyRouter, configure_sqlite, read_only
+from .extraction import extract_text
+from .ids import DOCTOR_IDS, IdAllocator
+from .importer import import_patients
+from .models import (Appointment, AppointmentSlot, Blob, DailyAppointmentStats, Doctor, DoctorSchedule, HealthWorker,
+                     IdSequence, MedicalFile, Patient, RollupDirtyDay, RollupState, SyncChange)
+from .qr import read_token
+from .rollups import ROLLUPS
+from .search import (rebuild_doctor_index, rebuild_record_index, search_doctors, search_patient_records,
+                     set_medical_file_text)
+from .slots import SlotUnavailable, book_slot, cancel_appointment, generate_slots
+
+# EXPLAIN checks run against this many seeded patients; set
+# HEALTH_PLAN_TEST_PATIENTS=1000000 to check plans at production scale.
+PLAN_TEST_PATIENTS = int(os.environ.get('HEALTH_PLAN_TEST_PATIENTS', 5000))
+
+
+class TempBlobStoreMixin:
+    @classmethod
+    def setUpClass(cls):
+        cls.blob_root = tempfile.mkdtemp()
+        cls.blob_settings = override_settings(
+            HEALTH_BLOB_STORE={'OPTIONS': {'root': cls.blob_root}},
+            HEALTH_UPLOAD_DIR=os.path.join(cls.blob_root, 'uploads'),
+            HEALTH_ARCHIVE={'PATH': os.path.join(cls.blob_root, 'archive.sqlite3')},
+        )
+        cls.blob_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.blob_settings.disable()
+        shutil.rmtree(cls.blob_root, ignore_errors=True)
+
+
+class EndpointQueryCountTests(TempBlobStoreMixin, TestCase):
+    """Upper bounds on the number of SQL queries each API endpoint may run"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = Patient.objects.create(aadhar='123456789012', name='Ravi Kumar', phone='9876543210')
+        cls.doctor = Doctor.objects.create(name='Asha', specialization='General', hospital='GH Kochi')
+        cls.worker = HealthWorker.objects.create(name='Manu', phone='9876500000')
+        Appointment.objects.create(patient=cls.patient, hospital='GH Kochi', doctor_name='Asha',
+                                   appointment_date='2026-01-01', appointment_time='09:00')
+        for i in range(3):
+            MedicalFile.objects.create(
+                patient=cls.patient, file_name=f'report{i}.pdf', file_data='data:application/pdf;base64,AAAA',
+                file_type='application/pdf', file_size=3, uploader_type='patient', uploader_id=cls.patient.aadhar,
+            )
+
+    def setUp(self):
+        get_patient_cache().clear()
+
+    def assertMaxQueries(self, limit, method, url, data=None, **extra):
+        with CaptureQueriesContext(connection) as ctx:
+            if method == 'get':
+                response = self.client.get(url, **extra)
+            else:
+                response = self.client.generic(method.upper(), url, json.dumps(data or {}),
+                                               content_type='application/json', **extra)
+        queries = [q['sql'] for q in ctx.captured_queries
+                   if not q['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))]
+        self.assertLessEqual(len(queries), limit,
+                             f'{method.upper()} {url} ran {len(queries)} queries:\n' + '\n'.join(queries))
+        return response
+
+    def test_register_patient(self):
+        # Writes also append to the sync change log
+        response = self.assertMaxQueries(3, 'post', reverse('health:register_patient'),
+                                         {'name': 'New', 'phone': '9000000001', 'aadhar': '222222222222'})
+        self.assertTrue(response.json()['success'])
+
+    def test_login_patient(self):
+        response = self.assertMaxQueries(1, 'post', reverse('health:login_patient'),
+                                         {'name': ' ravi  KUMAR ', 'phone': '9876543210'})
+        self.assertEqual(response.json()['patient_data']['aadhar'], self.patient.aadhar)
+
+    def test_register_and_login_doctor(self):
+        # Includes keeping the doctor search index up to date
+        self.assertMaxQueries(5, 'post', reverse('health:register_doctor'), {'name': 'B', 'hospital': 'H'})
+        response = self.assertMaxQueries(1, 'post', reverse('health:login_doctor'),
+                                         {'doctor_id': self.doctor.doctor_id.lower()})
+        self.assertTrue(response.json()['success'])
+
+    def test_register_and_login_worker(self):
+        self.assertMaxQueries(3, 'post', reverse('health:register_worker'), {'name': 'C', 'phone': '9000000002'})
+        response = self.assertMaxQueries(1, 'post', reverse('health:login_worker'),
+                                         {'worker_id': self.worker.worker_id})
+        self.assertTrue(response.json()['success'])
+
+    def test_upload_file(self):
+        data_url = 'data:text/plain;base64,' + base64.b64encode(b'lab result').decode()
+        response = self.assertMaxQueries(7, 'post', reverse('health:upload_file'), {
+            'patient_aadhar': self.patient.aadhar, 'file_name': 'lab.txt', 'file_data': data_url,
+            'file_type': 'text/plain', 'uploader_type': 'patient', 'uploader_id': self.patient.aadhar,
+        })
+        self.assertTrue(response.json()['success'])
+
+    def test_book_appointment(self):
+        response = self.assertMaxQueries(6, 'post', reverse('health:book_appointment'), {
+            'patient_aadhar': self.patient.aadhar, 'hospital': 'GH Kochi', 'doctor_name': 'Asha',
+            'appointment_date': '2026-01-05', 'appointment_time': '10:00',
+        })
+        self.assertTrue(response.json()['success'])
+
+    def test_get_patient_files(self):
+        url = reverse('health:get_patient_files', args=[self.patient.aadhar])
+        response = self.assertMaxQueries(3, 'get', url)
+        self.assertEqual(len(response.json()['files']), 3)
+
+    def test_verify_patient_qr(self):
+        url = reverse('health:verify_patient_qr', args=[self.patient.aadhar])
+        response = self.assertMaxQueries(1, 'get', url)
+        self.assertTrue(response.json()['success'])
+        # Repeat scans are served from the patient cache
+        self.assertMaxQueries(0, 'get', url)
+
+    def test_patient_cache_invalidated_on_save(self):
+        url = reverse('health:verify_patient_qr', args=[self.patient.aadhar])
+        self.client.get(url)
+        patient = Patient.objects.get(aadhar=self.patient.aadhar)
+        patient.name = 'Ravi K'
+        patient.save()
+        self.assertEqual(self.client.get(url).json()['patient_data']['name'], 'Ravi K')
+
+    def test_profile_cached_before_commit_is_dropped(self):
+        cache = get_patient_cache()
+        patient = Patient.objects.get(aadhar=self.patient.aadhar)
+        with self.captureOnCommitCallbacks(execute=True):
+            patient.name = 'Ravi K'
+            patient.save()
+            # A concurrent reader still sees the committed row and caches it
+            cache._store(cache.key(patient.aadhar), profile_of(self.patient))
+        self.assertEqual(cache.get(patient.aadhar)['name'], 'Ravi K')
+
+    def test_download_file(self):
+        medical_file = MedicalFile.objects.first()
+        response = self.assertMaxQueries(1, 'get', reverse('health:download_file', args=[medical_file.id]))
+        self.assertEqual(b''.join(response.streaming_content), b'\x00\x00\x00')
+
+
+class PatientLoginTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Patient.objects.create(aadhar='123456789012', name='Ravi  Kumar', phone='9876543210')
+        Patient.objects.create(aadhar='123456789013', name='Élodie Øster', phone='9876543211')
+        Patient.objects.bulk_create([Patient(aadhar='123456789014', name='ANJALI Nair', phone='9876543212')])
+
+    def login(self, name, phone):
+        response = self.client.post(reverse('health:login_patient'), {'name': name, 'phone': phone},
+                                    content_type='application/json')
+        return response.json().get('patient_data', {}).get('aadhar')
+
+    def test_names_match_ignoring_case_and_spacing(self):
+        for name, phone, aadhar in (
+            ('Ravi  Kumar', '9876543210', '123456789012'),  # Exactly as registered
+            ('ravi kumar', '9876543210', '123456789012'),
+            (' Ravi   KUMAR ', '9876543210', '123456789012'),
+            ('Élodie Øster', '9876543211', '123456789013'),
+            ('éLODIE øSTER', '9876543211', '123456789013'),
+            ('anjali nair', '9876543212', '123456789014'),  # Written by bulk_create
+        ):
+            self.assertEqual(self.login(name, phone), aadhar, name)
+        self.assertIsNone(self.login('Ravi Kumar', '9876543211'))
+
+    def test_renamed_patient_logs_in_with_new_name(self):
+        patient = Patient.objects.get(aadhar='123456789012')
+        patient.name = 'Ravi K'
+        patient.save(update_fields=['name'])
+        self.assertEqual(self.login('ravi k', '9876543210'), '123456789012')
+
+
+class DatabaseProfileTests(TestCase):
+    def test_pragmas_applied_to_new_connections(self):
+        with override_settings(HEALTH_SQLITE_PRAGMAS={'cache_size': -4096}):
+            configure_sqlite(sender=None, connection=connection)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -4096)
+
+    def test_router_only_redirects_reads_in_read_only_views(self):
+        router = ReadOnlyRouter()
+        self.assertIsNone(router.db_for_read(Patient))
+        # Without a separate 'readonly' database (or under the test runner's
+        # mirror of it) read-only views keep reading from 'default'
+        self.assertIsNone(read_only(lambda: router.db_for_read(Patient))())
+        self.assertEqual(router.db_for_write(Patient), 'default')
+
+
+class AsyncViewTests(TempBlobStoreMixin, TestCase):
+    """The I/O-heavy endpoints served through the ASGI handler"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = Patient.objects.create(aadhar='123456789012', name='Ravi Kumar', phone='9876543210')
+
+    async def test_upload_then_stream_range(self):
+        data = bytes(range(256)) * 1024
+        response = await self.async_client.post(reverse('health:upload_file'), {
+            'patient_aadhar': self.patient.aadhar, 'file_name': 'scan.bin', 'uploader_type': 'patient',
+            'file_data': 'data:application/octet-stream;base64,' + base64.b64encode(data).decode(),
+        }, content_type='application/json')
+        file_id = response.json()['file_id']
+
+        response = await self.async_client.get(reverse('health:download_file', args=[file_id]),
+                                               headers={'Range': 'bytes=1000-99999'})
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response.is_async)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), data[1000:100000])
+
+        response = await self.async_client.get(reverse('health:get_patient_files', args=[self.patient.aadhar]))
+        self.assertEqual([f['id'] for f in response.json()['files']], [file_id])
+
+
+class BlobStoreTests(TempBlobStoreMixin, TestCase):
+    def check_store(self, store):
+        digest, size = store.put_bytes(b'scan data')
+        self.assertEqual(digest, hashlib.sha256(b'scan data').hexdigest())
+        self.assertEqual(size, 9)
+        self.assertEqual(store.put_bytes(b'scan data'), (digest, size))  # Stored once
+        with store.open(digest) as f:
+            self.assertEqual(f.read(), b'scan data')
+        self.assertEqual(store.size(digest), 9)
+        store.delete(digest)
+        self.assertFalse(store.exists(digest))
+
+    def test_local_store(self):
+        store = LocalBlobStore(self.blob_root)
+        self.check_store(store)
+        self.assertEqual(os.listdir(store.tmp_dir), [])
+
+    def test_storage_store(self):
+        self.check_store(StorageBlobStore(FileSystemStorage(location=self.blob_root)))
+
+    def test_data_urls_move_to_blob_store(self):
+        Patient.objects.create(aadhar='123456789012', name='Asha', phone='9000000001')
+        medical_file = MedicalFile.objects.create(
+            patient_id='123456789012', file_name='old.pdf', file_type='', file_size=0,
+            file_data='data:application/pdf;base64,' + base64.b64encode(b'%PDF report').decode(),
+            uploader_type='patient', uploader_id='123456789012')
+        call_command('migrate_file_blobs', no_vacuum=True, stdout=io.StringIO())
+
+        medical_file.refresh_from_db()
+        self.assertEqual(medical_file.file_data, '')
+        self.assertEqual(medical_file.file_type, 'application/pdf')
+        self.assertEqual(medical_file.file_size, 11)
+        self.assertEqual(Blob.objects.get(sha256=medical_file.content_hash).ref_count, 1)
+        with medical_file.open() as f:
+            self.assertEqual(f.read(), b'%PDF report')
+
+
+class BlobRefCountTests(TempBlobStoreMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Patient.objects.create(aadhar='123456789012', name='Asha', phone='9000000001')
+        Patient.objects.create(aadhar='123456789013', name='Ravi', phone='9000000002')
+
+    def upload(self, aadhar, data=b'same report'):
+        medical_file = MedicalFile(patient_id=aadhar, file_name='report.pdf', file_type='application/pdf',
+                                   file_size=0, uploader_type='patient', uploader_id=aadhar)
+        medical_file.store_content(io.BytesIO(data))
+        medical_file.save()
+        return medical_file
+
+    def collect(self, age=timedelta(hours=2)):
+        Blob.objects.update(updated_at=timezone.now() - age)
+        call_command('gc_blobs', stdout=io.StringIO())
+
+    def test_shared_blob_survives_one_delete(self):
+        first = self.upload('123456789012')
+        self.upload('123456789013')
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+        first.delete()
+        self.collect()
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        self.assertTrue(get_blob_store().exists(first.content_hash))
+
+    def test_grace_period(self):
+        digest = self.upload('123456789012').content_hash
+        MedicalFile.objects.get().delete()
+        call_command('gc_blobs', stdout=io.StringIO())
+        self.assertTrue(get_blob_store().exists(digest))  # Released just now
+        self.collect()
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(get_blob_store().exists(digest))
+
+    def test_reacquired_blob_is_kept(self):
+        digest = self.upload('123456789012').content_hash
+        MedicalFile.objects.get().delete()
+        self.upload('123456789013')
+        self.collect()
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        self.assertTrue(get_blob_store().exists(digest))
+
+    def test_collected_between_put_and_touch(self):
+        MedicalFile.objects.filter(id=self.upload('123456789012').id).delete()
+        real_put = LocalBlobStore.put
+
+        collected = []
+
+        def put_then_collect(store, stream):
+            result = real_put(store, stream)  # Finds the bytes already stored
+            if not collected:
+                self.collect()
+                collected.append(True)
+            return result
+
+        with mock.patch.object(LocalBlobStore, 'put', put_then_collect):
+            medical_file = self.upload('123456789013')
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        with medical_file.open() as f:
+            self.assertEqual(f.read(), b'same report')
+
+    def test_derived_copies_equal_to_a_file_are_kept(self):
+        original = self.upload('123456789012', b'original scan')
+        thumbnail = self.upload('123456789013', b'its thumbnail')
+        Blob.objects.filter(sha256=original.content_hash).update(preview_hash=thumbnail.content_hash,
+                                                                 gzip_hash=thumbnail.content_hash)
+        original.delete()
+        self.collect()
+        self.assertTrue(get_blob_store().exists(thumbnail.content_hash))
+
+        # The other way round: the file goes, another blob's thumbnail stays
+        original = self.upload('123456789012', b'original scan')
+        Blob.objects.filter(sha256=original.content_hash).update(preview_hash=thumbnail.content_hash)
+        thumbnail.delete()
+        self.collect()
+        self.assertTrue(get_blob_store().exists(thumbnail.content_hash))
+
+        # Nor does archiving a blob delete a gzip copy that is also a file's content
+        other = self.upload('123456789013', b'gzip copy')
+        Blob.objects.filter(sha256=original.content_hash).update(gzip_hash=other.content_hash)
+        archive_blob(original.content_hash)
+        self.assertFalse(get_blob_store().exists(original.content_hash))
+        self.assertTrue(get_blob_store().exists(other.content_hash))
+
+
+@override_settings(HEALTH_UPLOAD_CHUNK_SIZE=4)
+class ChunkedUploadTests(TempBlobStoreMixin, TestCase):
+    data = b'0123456789'  # Three chunks: 4, 4 and 2 bytes
+
+    @classmethod
+    def setUpTestData(cls):
+        Patient.objects.create(aadhar='123456789012', name='Asha', phone='9000000001')
+
+    def init(self, **fields):
+        return self.client.post(reverse('health:init_upload'), {
+            'patient_aadhar': '123456789012', 'file_name': 'scan.bin', 'file_size': len(self.data),
+            'uploader_type': 'patient', **fields,
+        }, content_type='application/json').json()
+
+    def put_chunk(self, upload_id, index):
+        chunk = self.data[index * 4:(index + 1) * 4]
+        return self.client.put(reverse('health:upload_chunk', args=[upload_id, index]), chunk,
+                               content_type='application/octet-stream').json()
+
+    def commit(self, upload_id):
+        return self.client.post(reverse('health:commit_upload', args=[upload_id])).json()
+
+    def assert_file(self, file_id):
+        with MedicalFile.objects.get(id=file_id).open() as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_chunks_in_any_order(self):
+        upload = self.init()
+        self.assertEqual(upload['chunk_count'], 3)
+        for index in (2, 0, 1):
+            self.assertTrue(self.put_chunk(upload['upload_id'], index)['success'])
+        result = self.commit(upload['upload_id'])
+        self.assert_file(result['file_id'])
+        self.assertEqual(self.commit(upload['upload_id'])['file_id'], result['file_id'])  # Retried commit
+
+    def test_resume_after_partial_upload(self):
+        upload_id = self.init()['upload_id']
+        self.put_chunk(upload_id, 0)
+        self.assertIn('Missing chunks: [1, 2]', self.commit(upload_id)['error'])
+        status = self.client.get(reverse('health:upload_status', args=[upload_id])).json()
+        self.assertEqual(status['received'], [0])
+        for index in (1, 2):
+            self.put_chunk(upload_id, index)
+        self.assert_file(self.commit(upload_id)['file_id'])
+
+    def test_checksum_mismatch_is_rejected(self):
+        upload_id = self.init(sha256=hashlib.sha256(b'something else').hexdigest())['upload_id']
+        for index in range(3):
+            self.put_chunk(upload_id, index)
+        result = self.commit(upload_id)
+        self.assertFalse(result['success'])
+        self.assertIn('checksum', result['error'])
+        self.assertFalse(MedicalFile.objects.exists())
+        # The stored bytes have no file, and gc_blobs collects them
+        digest = hashlib.sha256(self.data).hexdigest()
+        self.assertEqual(Blob.objects.get(sha256=digest).ref_count, 0)
+        Blob.objects.update(updated_at=timezone.now() - timedelta(hours=2))
+        call_command('gc_blobs', stdout=io.StringIO())
+        self.assertFalse(get_blob_store().exists(digest))
+
+    def test_known_content_is_not_sent_again(self):
+        upload_id = self.init()['upload_id']
+        for index in range(3):
+            self.put_chunk(upload_id, index)
+        first = self.commit(upload_id)['file_id']
+        upload = self.init(sha256=hashlib.sha256(self.data).hexdigest())
+        self.assertTrue(upload['deduplicated'])
+        self.assert_file(upload['file_id'])
+        self.assertNotEqual(upload['file_id'], first)
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+
+    def test_known_content_of_another_patient_must_be_sent(self):
+        upload_id = self.init()['upload_id']
+        for index in range(3):
+            self.put_chunk(upload_id, index)
+        self.commit(upload_id)
+        Patient.objects.create(aadhar='123456789013', name='Ravi', phone='9000000002')
+        upload = self.init(patient_aadhar='123456789013', sha256=hashlib.sha256(self.data).hexdigest())
+        self.assertFalse(upload['deduplicated'])
+        self.assertFalse(MedicalFile.objects.filter(patient_id='123456789013').exists())
+
+    def test_size_limit(self):
+        upload_id = self.init()['upload_id']
+        for index in range(3):
+            self.put_chunk(upload_id, index)
+        with self.settings(HEALTH_UPLOAD_MAX_SIZE=8):
+            upload = self.init()
+            self.assertFalse(upload['success'])
+            self.assertIn('limit', upload['error'])
+            # Sessions opened before the limit was lowered are held to it too
+            self.assertIn('limit', self.commit(upload_id)['error'])
+
+
+@skipIf(previews.Image is None, 'Pillow is not installed')
+class PreviewTests(TempBlobStoreMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Patient.objects.create(aadhar='123456789012', name='Asha', phone='9000000001')
+
+    def test_uploaded_image_gets_a_thumbnail(self):
+        image = io.BytesIO()
+        previews.Image.new('RGB', (1200, 800), 'red').save(image, 'PNG')
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('health:upload_file'), {
+                'patient_aadhar': '123456789012', 'file_name': 'xray.png', 'uploader_type': 'patient',
+                'file_data': 'data:image/png;base64,' + base64.b64encode(image.getvalue()).decode(),
+            }, content_type='application/json')
+        self.assertTrue(callbacks)  # Generation is queued for after the commit
+        url = reverse('health:file_preview', args=[response.json()['file_id']])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        medical_file = MedicalFile.objects.get()
+        previews.generate_preview(medical_file.content_hash, 'image/png')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(response['Content-Type'], ('image/webp', 'image/jpeg'))
+        thumbnail = previews.Image.open(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(thumbnail.size, (256, 171))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+
+class HttpCachingTests(TempBlobStoreMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Patient.objects.create(aadhar='123456789012', name='Ravi Kumar', phone='9876543210')
+        cls.text = b'blood pressure 120/80, normal\n' * 200
+        cls.files = {}
+        for name, mime_type, data in (('notes.txt', 'text/plain', cls.text),
+                                      ('scan.jpg', 'image/jpeg', bytes(range(256)) * 40)):
+            medical_file = MedicalFile(patient_id='123456789012', file_name=name, file_type=mime_type, file_size=0,
+                                       uploader_type='patient', uploader_id='123456789012')
+            medical_file.store_content(io.BytesIO(data))
+            medical_file.save()
+            cls.files[name] = medical_file
+
+    def test_json_is_compressed_and_revalidated(self):
+        for i in range(20):
+            Appointment.objects.create(patient_id='123456789012', hospital='City Hospital', doctor_name='Dr. Rao',
+                                       appointment_date=date(2026, 1, 1), appointment_time=f'{i:02d}:00')
+        url = reverse('health:patient_timeline', args=['123456789012'])
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertTrue(response['ETag'].startswith('W/'))
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))['events']), 22)
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_files_have_strong_etags_and_stored_gzip_copies(self):
+        image = self.files['scan.jpg']
+        url = reverse('health:download_file', args=[image.id])
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['ETag'], f'"{image.content_hash}"')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        # A stale If-Range gets the whole file instead of the part asked for
+        response = self.client.get(url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+        text = self.files['notes.txt']
+        compress_blob(text.content_hash)
+        url = reverse('health:download_file', args=[text.id])
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], f'"{text.content_hash}-gzip"')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.text)
+        response = self.client.get(url)
+        self.assertEqual(b''.join(response.streaming_content), self.text)
+
+
+class PatientImportTests(TestCase):
+    csv = ('name,phone,aadhar,email\n'
+           'Asha,9000000001,123456789012,asha@example.com\n'
+           'Ravi,90000,123456789013,\n'
+           'Asha again,9000000001,123456789012,\n'
+           'Manu,9000000003,123456789014,\n')
+
+    def test_import_reports_rejected_rows(self):
+        Patient.objects.create(aadhar='123456789014', name='Manu', phone='9000000003')
+        response = self.client.post(reverse('health:import_patients'), self.csv, content_type='text/csv')
+        result = response.json()
+        self.assertEqual((result['created'], result['duplicates'], result['rows']), (1, 2, 4))
+        self.assertEqual(result['errors'], [
+            {'row': 2, 'aadhar': '123456789013', 'error': 'Phone must be 10 digits'},
+            {'row': 3, 'aadhar': '123456789012', 'error': 'Duplicate Aadhar in import'},
+            {'row': 4, 'aadhar': '123456789014', 'error': 'Patient with this Aadhar already exists'},
+        ])
+        self.assertEqual(Patient.objects.get(aadhar='123456789012').email, 'asha@example.com')
+
+    def test_patient_registered_during_import_is_a_duplicate(self):
+        Patient.objects.create(aadhar='123456789014', name='Manu', phone='9000000003')
+        records = [{'name': 'Asha', 'phone': '9000000001', 'aadhar': '123456789012'},
+                   {'name': 'Manu', 'phone': '9000000003', 'aadhar': '123456789014'}]
+        # The existence check misses the patient, as if it were registered just after
+        with mock.patch.object(Patient.objects, 'filter', return_value=Patient.objects.none()):
+            result = import_patients(records)
+
+        self.assertEqual((result.created, result.duplicates, result.rows), (1, 1, 2))
+        self.assertEqual(result.errors, [(2, '123456789014', 'Patient with this Aadhar already exists')])
+        self.assertEqual(Patient.objects.get(aadhar='123456789014').name, 'Manu')
+        self.assertEqual(list(SyncChange.objects.filter(kind='patient').values_list('key', flat=True)),
+                         ['123456789014', '123456789012'])
+
+    def test_command_resumes_from_saved_progress(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'camp.jsonl')
+        with open(path, 'w') as f:
+            for i in range(5):
+                f.write(json.dumps({'name': f'P{i}', 'phone': '9000000000', 'aadhar': f'40000000000{i}'}) + '\n')
+        with open(f'{path}.progress', 'w') as f:
+            json.dump({'rows': 3}, f)  # An earlier run stopped after row 3
+
+        out = io.StringIO()
+        call_command('import_patients', path, batch_size=1, stdout=out)
+        self.assertIn('Imported 2 patients from 2 rows', out.getvalue())
+        self.assertEqual(sorted(Patient.objects.values_list('aadhar', flat=True)), ['400000000003', '400000000004'])
+        self.assertFalse(os.path.exists(f'{path}.progress'))
+
+
+class QrTokenTests(TestCase):
+    def setUp(self):
+        response = self.client.post(reverse('health:register_patient'), {
+            'name': 'Asha', 'phone': '9000000001', 'aadhar': '123456789012',
+        }, content_type='application/json')
+        self.token = response.json()['qr_token']
+
+    def verify(self, *tokens):
+        return self.client.post(reverse('health:verify_qr_tokens'), {'tokens': list(tokens)},
+                                content_type='application/json').json()['results']
+
+    def test_token_carries_profile_for_offline_display(self):
+        payload = read_token(self.token)
+        self.assertEqual((payload['a'], payload['n'], payload['p']), ('123456789012', 'Asha', '9000000001'))
+        self.assertEqual(self.verify(self.token), [{'valid': True, 'aadhar': '123456789012', 'current': True}])
+
+    def test_stale_tampered_and_expired_tokens(self):
+        patient = Patient.objects.get()
+        patient.name = 'Asha K'
+        with self.captureOnCommitCallbacks(execute=True):
+            patient.save()
+        with self.settings(HEALTH_QR_TOKEN_MAX_AGE=-1):
+            expired = self.client.get(reverse('health:verify_patient_qr', args=['123456789012'])).json()['qr_token']
+
+        stale, tampered, expired = self.verify(self.token, self.token[:-2] + 'xx', expired)
+        self.assertFalse(stale['current'])
+        self.assertEqual(read_token(stale['qr_token'])['n'], 'Asha K')
+        self.assertEqual(tampered, {'valid': False, 'error': 'Invalid token'})
+        self.assertEqual(expired, {'valid': False, 'error': 'Token expired'})
+
+
+class IdAllocatorTests(TransactionTestCase):
+    def test_parse(self):
+        for typed, code in (('DOC000042', 'DOC000042'), (' doc42 ', 'DOC000042'), ('DOC12345', 'DOC012345'),
+                            ('doc1234', 'DOC1234'), ('DOC001234', 'DOC001234'), ('Dr Rao', 'DR RAO')):
+            self.assertEqual(DOCTOR_IDS.parse(typed), code)
+
+    def test_legacy_codes_still_log_in(self):
+        self.addCleanup(DOCTOR_IDS.reset)  # The block it reserves is flushed with the database
+        Doctor.objects.create(doctor_id='DOC1234', name='Asha', specialization='General', hospital='GH Kochi')
+        doctor = Doctor.objects.create(name='Ravi', specialization='General', hospital='GH Kochi')
+        self.assertRegex(doctor.doctor_id, r'^DOC\d{6}$')
+        for typed, name in (('doc1234', 'Asha'), (doctor.doctor_id.lower(), 'Ravi'),
+                            ('DOC' + doctor.doctor_id[3:].lstrip('0'), 'Ravi')):
+            response = self.client.post(reverse('health:login_doctor'), {'doctor_id': typed},
+                                        content_type='application/json')
+            self.assertEqual(response.json()['doctor_data']['name'], name)
+
+    @override_settings(HEALTH_ID_BLOCK_SIZE=3)
+    def test_processes_get_separate_blocks(self):
+        # Two allocators for one sequence stand in for two worker processes
+        first, second = IdAllocator('test', 'TST', 6), IdAllocator('test', 'TST', 6)
+        codes = [first.next(), second.next(), first.next(), first.next(), second.next()]
+        self.assertEqual(codes, ['TST000001', 'TST000004', 'TST000002', 'TST000003', 'TST000005'])
+        self.assertEqual(first.next(), 'TST000007')  # Its block ran out; the next one starts after second's
+        self.assertEqual(IdSequence.objects.get(name='test').next_value, 10)
+        self.assertEqual(second.next(), 'TST000006')
+
+
+class SlotBookingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = Doctor.objects.create(name='Asha', specialization='General', hospital='GH Kochi')
+        cls.patients = [Patient.objects.create(aadhar=f'30000000000{i}', name=f'P{i}', phone='9000000000')
+                        for i in range(3)]
+        cls.slot = AppointmentSlot.objects.create(doctor=cls.doctor, hospital='GH Kochi', date=date(2026, 1, 5),
+                                                  start_time=time(9, 0), capacity=2)
+
+    def test_generate_slots_is_idempotent(self):
+        DoctorSchedule.objects.create(doctor=self.doctor, hospital='GH Kochi', weekday=0,
+                                      start_time=time(9, 0), end_time=time(10, 0), slot_minutes=20)
+        generate_slots(date(2026, 1, 5), date(2026, 1, 11))
+        generate_slots(date(2026, 1, 5), date(2026, 1, 11))
+        times = AppointmentSlot.objects.filter(doctor=self.doctor).values_list('start_time', flat=True)
+        self.assertEqual(sorted(times), [time(9, 0), time(9, 20), time(9, 40)])
+
+    def test_capacity_and_double_booking(self):
+        appointment = book_slot(self.patients[0].aadhar, self.slot.id)
+        with self.assertRaisesMessage(SlotUnavailable, 'already'):
+            book_slot(self.patients[0].aadhar, self.slot.id)
+        book_slot(self.patients[1].aadhar, self.slot.id)
+        with self.assertRaisesMessage(SlotUnavailable, 'fully booked'):
+            book_slot(self.patients[2].aadhar, self.slot.id)
+
+        self.assertTrue(cancel_appointment(appointment.appointment_code))
+        self.assertFalse(cancel_appointment(appointment.appointment_code))
+        book_slot(self.patients[2].aadhar, self.slot.id)
+        self.slot.refresh_from_db()
+        self.assertEqual(self.slot.booked, 2)
+
+
+class DoctorSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.asha = Doctor.objects.create(name='Asha Menon', specialization='Cardiology', hospital='Medical College Kochi')
+        Doctor.objects.create(name='Ravi Kumar', specialization='General', hospital='General Hospital Thrissur')
+        Doctor.objects.create(name='Meera Nair', specialization='Cardiology', hospital='Ashoka Clinic Kochi')
+
+    def names(self, query, specialization=None):
+        return [doctor.name for doctor in search_doctors(query, specialization)]
+
+    def test_prefix_match_ranks_name_before_hospital(self):
+        self.assertEqual(self.names('ash'), ['Asha Menon', 'Meera Nair'])
+        self.assertEqual(self.names('kochi me'), ['Asha Menon', 'Meera Nair'])
+
+    def test_typos_and_specialization_filter(self):
+        self.assertEqual(self.names('ravi kumr'), ['Ravi Kumar'])
+        self.assertEqual(self.names('medcal colege'), ['Asha Menon'])
+        self.assertEqual(self.names('kochi', 'General'), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.asha.hospital = 'District Hospital Kannur'
+        self.asha.save()
+        self.assertEqual(self.names('kannur'), ['Asha Menon'])
+        self.asha.delete()
+        self.assertEqual(self.names('asha menon'), [])
+        response = self.client.get(reverse('health:doctor_search'), {'q': 'thris', 'limit': 1})
+        self.assertEqual([d['name'] for d in response.json()['doctors']], ['Ravi Kumar'])
+
+    def test_broad_prefix_is_ranked_and_paged_in_sql(self):
+        Doctor.objects.bulk_create(Doctor(doctor_id=f'DOC9{i:05d}', name=f'Ravi {i:03d}', hospital='Ashoka Hospital')
+                                   for i in range(250))
+        rebuild_doctor_index()
+        # More hospital matches than one page can hold must not push out the name match
+        self.assertEqual(self.names('as')[:1], ['Asha Menon'])
+        self.assertEqual([d.name for d in search_doctors('as', limit=1)], ['Asha Menon'])
+        self.assertEqual(len(search_doctors('as', limit=100, offset=200)), 52)
+
+    def test_search_survives_doctor_table_rebuild(self):
+        # A migration that rebuilds health_doctor renumbers its rowids
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM health_doctor WHERE doctor_id = %s', [self.asha.doctor_id])
+            cursor.execute('UPDATE health_doctor SET rowid = rowid - 1')
+        self.assertEqual(self.names('ravi'), ['Ravi Kumar'])
+        self.assertEqual(self.names('meera'), ['Meera Nair'])
+        self.assertEqual(self.names('asha menon'), [])
+
+
+class RecordSearchTests(TempBlobStoreMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = Patient.objects.create(aadhar='123456789012', name='Ravi Kumar', phone='9876543210')
+        cls.other = other = Patient.objects.create(aadhar='210987654321', name='Anu', phone='9876500001')
+        cls.report = MedicalFile(patient=cls.patient, file_name='Blood test March.txt', file_type='text/plain',
+                                 uploader_type='doctor', uploader_id='DOC000001')
+        cls.report.store_content(io.BytesIO(b'Haemoglobin 13.2 g/dL, platelets normal'))
+        cls.report.save()
+        cls.other_file = MedicalFile.objects.create(patient=other, file_name='Blood test.pdf',
+                                                    file_type='application/pdf', file_size=1, uploader_type='patient', uploader_id=other.aadhar)
+        cls.appointment = Appointment.objects.create(
+            patient=cls.patient, hospital='GH Kochi', doctor_name='Asha Menon',
+            appointment_date='2026-01-05', appointment_time='10:00',
+        )
+
+    def refs(self, query, patient=None):
+        aadhar = (patient or self.patient).aadhar
+        return [result['ref'] for result in search_patient_records(aadhar, query, 10)]
+
+    def test_metadata_is_searchable_per_patient(self):
+        self.assertEqual(self.refs('blood'), [str(self.report.id)])
+        self.assertEqual(self.refs('asha koch'), [self.appointment.appointment_code])
+        self.appointment.status = 'completed'
+        self.appointment.save()
+        self.assertEqual(self.refs('completed'), [self.appointment.appointment_code])
+
+    def test_extracted_text_with_snippet(self):
+        extract_text(self.report.id, self.report.content_hash, self.report.file_type)
+        response = self.client.get(reverse('health:search_patient_records', args=[self.patient.aadhar]),
+                                   {'q': 'platelet'})
+        result, = response.json()['results']
+        self.assertEqual(result['ref'], str(self.report.id))
+        self.assertIn('<mark>platelets</mark>', result['snippet'])
+
+        self.report.delete()
+        self.assertEqual(self.refs('platelet'), [])
+
+    def test_index_survives_table_rebuilds(self):
+        extract_text(self.report.id, self.report.content_hash, self.report.file_type)
+        # A migration that rebuilds health_medicalfile renumbers its rowids
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE health_medicalfile SET rowid = rowid + 1000')
+
+        self.other_file.save()
+        self.report.file_name = 'Blood test April.txt'
+        self.report.save()
+        set_medical_file_text(self.other_file.id, 'insulin dose')
+        self.assertEqual(self.refs('april platelet'), [str(self.report.id)])
+        self.assertEqual(self.refs('platelet', self.other), [])
+        self.assertEqual(self.refs('insulin'), [])
+        self.assertEqual(self.refs('insulin', self.other), [str(self.other_file.id)])
+
+        self.appointment.status = 'completed'
+        self.appointment.save()
+        self.assertEqual(self.refs('completed'), [self.appointment.appointment_code])
+        self.other_file.delete()
+        self.assertEqual(self.refs('blood'), [str(self.report.id)])
+
+        rebuild_record_index()
+        self.assertEqual(self.refs('platelet'), [str(self.report.id)])
+        self.assertEqual(self.refs('asha'), [self.appointment.appointment_code])
+        self.appointment.delete()
+        self.assertEqual(self.refs('asha'), [])
+
+
+class BenchmarkTests(TempBlobStoreMixin, TestCase):
+    def test_seed_and_route_coverage(self):
+        counts = benchmark.seed(patients=50, doctors=10, workers=5, files=5, appointments=100)
+        self.assertEqual((counts.patients, counts.files, counts.appointments), (50, 5, 100))
+        doctor = Doctor.objects.filter(hospital__endswith=benchmark.HOSPITAL_SUFFIX).first()
+        self.assertIn(doctor, search_doctors(doctor.name.split()[0]))
+        self.assertEqual(benchmark.url_names() - set(benchmark.ROUTES), set())
+
+    def test_compare_flags_p95_and_error_regressions(self):
+        def run(p95, errors=0):
+            return {'routes': {'index': {'requests': 100, 'errors': errors, 'p95_ms': p95}}}
+        self.assertEqual(benchmark.compare(run(11), run(10)), [])  # Within min_delta_ms
+        self.assertEqual(len(benchmark.compare(run(130), run(100))), 1)
+        self.assertEqual(len(benchmark.compare(run(100, errors=5), run(100))), 1)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+
+    def test_requests_are_recorded_by_url_name(self):
+        Patient.objects.create(aadhar='123456789012', name='Asha', phone='9000000001')
+        self.client.get(reverse('health:get_patient_files', args=['123456789012']))
+        self.client.get(reverse('health:get_patient_files', args=['000000000000']))
+        self.client.get('/no-such-page/')
+        body = self.client.get(reverse('health:metrics')).content.decode()
+
+        self.assertIn('health_http_requests_total{view="health:get_patient_files",status="2xx"} 2', body)
+        self.assertIn('health_http_requests_total{view="<unmatched>",status="4xx"} 1', body)
+        self.assertIn('health_http_request_duration_seconds_count{view="health:get_patient_files"} 2', body)
+        queries = next(line for line in body.splitlines()
+                       if line.startswith('health_db_queries_total{view="health:get_patient_files"}'))
+        self.assertGreater(int(queries.split()[-1]), 0)
+
+    def test_success_false_responses_are_failures(self):
+        Patient.objects.create(aadhar='123456789012', name='Asha', phone='9000000001')
+        self.client.get(reverse('health:get_patient_files', args=['123456789012']))
+        response = self.client.get(reverse('health:get_patient_files', args=['000000000000']))
+        self.assertEqual((response.status_code, response.json()['success']), (200, False))
+        self.client.get('/no-such-page/')
+        body = self.client.get(reverse('health:metrics')).content.decode()
+
+        self.assertIn('health_http_request_failures_total{view="health:get_patient_files"} 1', body)
+        self.assertIn('health_http_request_failures_total{view="<unmatched>"} 1', body)
+
+    def test_query_counter_is_safe_across_threads(self):
+        counter = metrics.QueryCounter()
+        threads = [threading.Thread(target=lambda: [counter.add(0.5) for _ in range(10000)])
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((counter.count, counter.seconds), (40000, 20000.0))
+
+    def test_patient_cache_stats_are_exposed(self):
+        Patient.objects.create(aadhar='123456789012', name='Asha', phone='9000000001')
+        get_patient_cache().clear()
+        for _ in range(3):
+            self.client.get(reverse('health:verify_patient_qr', args=['123456789012']))
+        body = self.client.get(reverse('health:metrics')).content.decode()
+        self.assertIn('health_patient_cache_hits_total 2\n', body)
+        self.assertIn('health_patient_cache_misses_total 1\n', body)
+        self.assertIn('health_patient_cache_entries 1\n', body)
+
+    def test_multiprocess_totals_are_merged(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        other = metrics.Registry()
+        other.record('health:index', 200, 0.02, 1, 0.001, 100)
+        other.flush(directory)
+        os.rename(os.path.join(directory, f'{os.getpid()}.json'), os.path.join(directory, '1.json'))
+        metrics.registry.record('health:index', 500, 3.0, 0, 0.0, 10)
+
+        with override_settings(HEALTH_METRICS={'MULTIPROCESS_DIR': directory}):
+            body = metrics.render()
+        self.assertIn('health_http_requests_total{view="health:index",status="2xx"} 1', body)
+        self.assertIn('health_http_requests_total{view="health:index",status="5xx"} 1', body)
+        self.assertIn('health_http_request_duration_seconds_bucket{view="health:index",le="0.025"} 1', body)
+        self.assertIn('health_http_request_duration_seconds_bucket{view="health:index",le="+Inf"} 2', body)
+        self.assertIn('health_http_response_bytes_total{view="health:index"} 110', body)
+
+
+class LoggingTests(TestCase):
+    def test_access_log_line_is_redacted_json(self):
+        with self.assertLogs('health.access') as captured:
+            response = self.client.get('/api/patient-files/123456789012/', HTTP_X_REQUEST_ID='req-1')
+        self.assertEqual(response['X-Request-ID'], 'req-1')
+        entry = json.loads(logs.JsonFormatter().format(captured.records[0]))
+        self.assertEqual((entry['request_id'], entry['route'], entry['status']),
+                         ('req-1', 'health:get_patient_files', 200))
+        self.assertEqual(entry['path'], '/api/patient-files/XXXXXXXX9012/')
+        self.assertEqual(logs.redact('call 9876543210 or 1234 5678 9012'), 'call XXXXXX3210 or XXXXXXXX9012')
+
+    @override_settings(HEALTH_ACCESS_LOG={'SAMPLE_RATE': 0.0})
+    def test_sampling_drops_fast_successful_requests(self):
+        with self.assertNoLogs('health.access'):
+            self.client.get(reverse('health:index'))
+
+    def test_queued_handler_writes_and_rotates(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        handler = logs.QueuedFileHandler(os.path.join(directory, 'test.log'), max_bytes=1000, backup_count=2)
+        handler.setFormatter(logs.RedactingFormatter('%(message)s'))
+        logger = logging.getLogger('health.tests.queued')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        for i in range(100):
+            logger.warning('patient %s line %d', '123456789012', i)
+        handler.close()
+
+        self.assertEqual(sorted(os.listdir(directory)), ['test.log', 'test.log.1', 'test.log.2'])
+        with open(os.path.join(directory, 'test.log')) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[-1], 'patient XXXXXXXX9012 line 99')
+
+    def test_queued_handler_file_per_process(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        handler = logs.QueuedFileHandler(os.path.join(directory, 'test.{pid}.log'))
+        logger = logging.getLogger('health.tests.per_process')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        logger.warning('hello')
+        handler.close()
+        self.assertEqual(os.listdir(directory), [f'test.{os.getpid()}.log'])
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Patient.objects.create(aadhar='123456789012', name='Asha', phone='9000000001')
+        for day in range(1, 6):
+            medical_file = MedicalFile.objects.create(patient_id='123456789012', file_name=f'report-{day}.txt',
+                                                      file_type='text/plain', file_size=0,
+                                                      uploader_type='patient', uploader_id='123456789012')
+            MedicalFile.objects.filter(pk=medical_file.pk).update(
+                uploaded_at=timezone.make_aware(timezone.datetime(2026, 1, day * 2, 12, 0)))
+            Appointment.objects.create(patient_id='123456789012', hospital='City Hospital', doctor_name='Dr. Rao',
+                                       appointment_date=date(2026, 1, day * 2 + 1), appointment_time='09:00')
+
+    def setUp(self):
+        get_patient_cache().clear()
+
+    def test_pages_merge_both_tables_newest_first(self):
+        url = reverse('health:patient_timeline', args=['123456789012'])
+        events, cursor = [], None
+        while True:
+            with self.assertNumQueries(5 if cursor is None else 4):
+                data = self.client.get(url, {'limit': 3, **({'cursor': cursor} if cursor else {})}).json()
+            events += data['events']
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual([event['at'][:10] for event in events],
+                         [f'2026-01-{day:02d}' for day in range(11, 1, -1)])
+        self.assertEqual(events[0]['kind'], 'appointment')
+        self.assertEqual(events[1]['kind'], 'file')
+
+    def test_unchanged_timeline_returns_304(self):
+        url = reverse('health:patient_timeline', args=['123456789012'])
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(2):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        cancel_appointment(Appointment.objects.first().appointment_code)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+
+class RollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Patient.objects.create(aadhar='123456789012', name='Asha', phone='9000000001')
+        for hospital, status in [('City', 'scheduled'), ('City', 'completed'), ('Town', 'scheduled')]:
+            Appointment.objects.create(patient_id='123456789012', hospital=hospital, doctor_name='Dr. Rao',
+                                       appointment_date=date(2026, 3, 1), appointment_time='09:00', status=status)
+
+    def analytics(self, rollup, **params):
+        return self.client.get(reverse('health:analytics', args=[rollup]),
+                               {'from': '2026-03-01', 'to': '2026-03-31', **params}).json()
+
+    def test_refresh_rebuilds_only_changed_days(self):
+        ROLLUPS['appointments'].refresh()
+        self.assertEqual(self.analytics('appointments', group_by='hospital')['rows'],
+                         [{'hospital': 'City', 'count': 2}, {'hospital': 'Town', 'count': 1}])
+
+        cancel_appointment(Appointment.objects.get(hospital='Town').appointment_code)
+        Appointment.objects.create(patient_id='123456789012', hospital='Town', doctor_name='Dr. Rao',
+                                   appointment_date=date(2026, 3, 2), appointment_time='09:00')
+        self.assertEqual(ROLLUPS['appointments'].refresh(), 2)
+        data = self.analytics('appointments', group_by='date,status', hospital='Town')
+        self.assertEqual(data['rows'], [
+            {'date': '2026-03-01', 'status': 'cancelled', 'count': 1},
+            {'date': '2026-03-02', 'status': 'scheduled', 'count': 1},
+        ])
+        self.assertEqual(self.analytics('appointments')['rows'], [{'count': 4}])
+
+    def test_deletions_mark_their_day_dirty(self):
+        ROLLUPS['appointments'].refresh()
+        Appointment.objects.filter(hospital='City').delete()
+        self.assertEqual(RollupDirtyDay.objects.filter(rollup='appointments').count(), 1)
+        ROLLUPS['appointments'].refresh()
+        self.assertFalse(RollupDirtyDay.objects.exists())
+        self.assertEqual(list(DailyAppointmentStats.objects.values_list('hospital', 'count')), [('Town', 1)])
+
+    def test_moved_appointment_marks_both_days_dirty(self):
+        ROLLUPS['appointments'].refresh()
+        moved = Appointment.objects.get(hospital='Town')
+        moved.appointment_date = date(2026, 3, 5)
+        moved.save()
+        self.assertEqual(set(RollupDirtyDay.objects.values_list('date', flat=True)),
+                         {date(2026, 3, 1), date(2026, 3, 5)})
+        # Long after the watermark could have seen the move
+        RollupState.objects.update(watermark=timezone.now() + timedelta(hours=1))
+        ROLLUPS['appointments'].refresh()
+        data = self.analytics('appointments', group_by='date,hospital')
+        self.assertEqual(data['rows'], [
+            {'date': '2026-03-01', 'hospital': 'City', 'count': 2},
+            {'date': '2026-03-05', 'hospital': 'Town', 'count': 1},
+        ])
+
+    def test_registrations_and_bad_requests(self):
+        ROLLUPS['registrations'].refresh()
+        today = timezone.localdate()
+        data = self.analytics('registrations', group_by='kind', **{'from': today, 'to': today})
+        self.assertEqual(data['rows'], [{'kind': 'patient', 'count': 1}])
+
+        self.assertFalse(self.analytics('registrations', group_by='hospital')['success'])
+        self.assertFalse(self.analytics('registrations', **{'from': '2026-04-01'})['success'])
+        self.assertEqual(self.client.get(reverse('health:analytics', args=['nope'])).status_code, 404)
+
+
+
+class BatchTests(TempBlobStoreMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Patient.objects.create(aadhar='123456789012', name='Asha', phone='9000000001')
+
+    def setUp(self):
+        super().setUp()
+        get_patient_cache().clear()
+
+    def batch(self, operations, **options):
+        return self.client.post(reverse('health:batch'), {'operations': operations, **options},
+                                content_type='application/json').json()
+
+    def visit(self, aadhar, date='2026-03-01'):
+        data_url = 'data:text/plain;base64,' + base64.b64encode(b'lab result').decode()
+        return [
+            {'op': 'register_patient', 'data': {'aadhar': aadhar, 'name': 'Ravi', 'phone': '9000000002'}},
+            {'op': 'book_appointment', 'data': {'patient_aadhar': aadhar, 'hospital': 'City', 'doctor_name': 'Dr. Rao',
+                                                'appointment_date': date, 'appointment_time': '09:00'}},
+            {'op': 'upload_file', 'data': {'patient_aadhar': aadhar, 'file_name': 'lab.txt', 'file_data': data_url,
+                                           'uploader_type': 'worker', 'uploader_id': 'HW00000001'}},
+        ]
+
+    def test_visit_in_one_request(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.batch(self.visit('222222222222') + [
+                {'op': 'book_appointment', 'data': {'patient_aadhar': '123456789012', 'hospital': 'City',
+                                                    'doctor_name': 'Dr. Rao', 'appointment_date': '2026-03-01',
+                                                    'appointment_time': '10:00'}},
+            ])
+        self.assertTrue(data['success'])
+        self.assertTrue(all(result['success'] for result in data['results']))
+        self.assertEqual(MedicalFile.objects.get(id=data['results'][2]['file_id']).patient_id, '222222222222')
+        # Both patients are resolved by one lookup up front and the registration's existence check
+        lookups = [q for q in ctx.captured_queries
+                   if q['sql'].startswith('SELECT') and 'FROM "health_patient"' in q['sql']]
+        self.assertEqual(len(lookups), 2)
+
+    def test_failures_commit_the_rest_unless_atomic(self):
+        operations = self.visit('222222222222', date='not a date')
+        data = self.batch(operations, atomic=True)
+        self.assertFalse(data['success'])
+        self.assertEqual([result['error'] for result in data['results']],
+                         ['Rolled back, operation 2 failed', data['results'][1]['error'], 'Skipped'])
+        self.assertFalse(Patient.objects.filter(aadhar='222222222222').exists())
+
+        data = self.batch(operations)
+        self.assertTrue(data['success'])
+        self.assertEqual([result['success'] for result in data['results']], [True, False, True])
+        self.assertEqual(MedicalFile.objects.filter(patient_id='222222222222').count(), 1)
+
+    def test_rolled_back_upload_is_left_for_gc(self):
+        upload, *_ = self.visit('123456789012')[2:]
+        data = self.batch([upload, {'op': 'book_appointment', 'data': {}}], atomic=True)
+        self.assertFalse(data['success'])
+        self.assertFalse(MedicalFile.objects.exists())
+        # gc_blobs only finds bytes through their row
+        self.assertEqual(Blob.objects.get(sha256=hashlib.sha256(b'lab result').hexdigest()).ref_count, 0)
+
+
+class ExportTests(TempBlobStoreMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Patient.objects.create(aadhar='123456789012', name='Asha', phone='9000000001')
+        Appointment.objects.create(patient_id='123456789012', hospital='City', doctor_name='Dr. Rao',
+                                   appointment_date=date(2026, 3, 1), appointment_time='09:00')
+        cls.contents = {'scan.jpg': bytes(range(256)) * 400, 'notes/../x.txt': b'normal'}
+        for name, data in cls.contents.items():
+            medical_file = MedicalFile(patient_id='123456789012', file_name=name, file_type='text/plain',
+                                       file_size=0, uploader_type='patient', uploader_id='123456789012')
+            medical_file.store_content(io.BytesIO(data))
+            medical_file.save()
+        # Not yet moved to the blob store
+        MedicalFile.objects.create(patient_id='123456789012', file_name='old.pdf', file_type='application/pdf',
+                                   file_data='data:application/pdf;base64,AAAA', file_size=3,
+                                   uploader_type='patient', uploader_id='123456789012')
+        cls.url = reverse('health:export_patient_record', args=['123456789012'])
+
+    def test_bundle_has_manifest_and_original_files(self):
+        response = self.client.get(self.url)
+        content = b''.join(response.streaming_content)
+        self.assertEqual(int(response['Content-Length']), len(content))
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            self.assertIsNone(archive.testzip())
+            manifest = json.loads(archive.read('manifest.json'))
+            self.assertEqual(manifest['patient']['aadhar'], '123456789012')
+            self.assertEqual(len(manifest['appointments']), 1)
+            paths = [f['path'] for f in manifest['files']]
+            self.assertEqual(paths, ['files/0001-scan.jpg', 'files/0002-notes_.._x.txt', 'files/0003-old.pdf'])
+            self.assertEqual(archive.namelist(), ['manifest.json'] + paths)
+            self.assertEqual(archive.read(paths[0]), self.contents['scan.jpg'])
+            self.assertEqual(archive.read(paths[2]), b'\x00\x00\x00')
+
+    def test_interrupted_download_resumes(self):
+        response = self.client.get(self.url)
+        content = b''.join(response.streaming_content)
+        etag = response['ETag']
+        for start in (10, 500, len(content) - 30):
+            response = self.client.get(self.url, HTTP_RANGE=f'bytes={start}-', HTTP_IF_RANGE=etag)
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(b''.join(response.streaming_content), content[start:])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Appointment.objects.create(patient_id='123456789012', hospital='City', doctor_name='Dr. Rao',
+                                   appointment_date=date(2026, 3, 2), appointment_time='09:00')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_data_urls_are_read_one_member_at_a_time(self):
+        with CaptureQueriesContext(connection) as ctx:
+            stream, _ = export.patient_archive('123456789012')
+        listing, = [q['sql'] for q in ctx.captured_queries if 'ORDER BY "health_medicalfile"' in q['sql']]
+        self.assertNotIn('file_data', listing)
+        with zipfile.ZipFile(stream) as archive:
+            self.assertEqual(archive.read('files/0003-old.pdf'), b'\x00\x00\x00')
+
+    def test_resume_skips_files_with_known_crc(self):
+        content = b''.join(self.client.get(self.url).streaming_content)
+        for digest, crc in Blob.objects.values_list('sha256', 'crc32'):
+            with get_blob_store().open(digest) as blob:
+                self.assertEqual(crc, zlib.crc32(blob.read()))
+
+        # Starting inside a member seeks to the offset instead of reading up to it
+        start = zipfile.ZipFile(io.BytesIO(content)).getinfo('files/0001-scan.jpg').header_offset + 1000
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={start}-')
+        self.assertEqual(b''.join(response.streaming_content), content[start:])
+
+        start = len(content) - 30
+        for crcs_known, opened in ((True, 0), (False, 2)):
+            if not crcs_known:
+                Blob.objects.update(crc32=None)
+            with mock.patch.object(LocalBlobStore, 'open', autospec=True, side_effect=LocalBlobStore.open) as open_:
+                response = self.client.get(self.url, HTTP_RANGE=f'bytes={start}-')
+                self.assertEqual(b''.join(response.streaming_content), content[start:])
+            self.assertEqual(open_.call_count, opened)
+
+    def test_bulk_export_skips_done_patients(self):
+        output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output)
+        call_command('export_patients', '123456789012', output=output, workers=1, stdout=io.StringIO())
+        with zipfile.ZipFile(os.path.join(output, '123456789012.zip')) as archive:
+            self.assertEqual(len(archive.namelist()), 4)
+        out = io.StringIO()
+        call_command('export_patients', '123456789012', output=output, workers=1, stdout=out)
+        self.assertIn('Exported 0 patients', out.getvalue())
+
+
+class ArchiveTests(TempBlobStoreMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Patient.objects.create(aadhar='123456789012', name='Asha', phone='9000000001')
+        Patient.objects.create(aadhar='123456789013', name='Ravi', phone='9000000002')
+        cls.old_data = os.urandom(ARCHIVE_CHUNK_SIZE + 5000)  # Spans two archive chunks
+        cls.old = cls._upload('123456789012', 'scan.jpg', cls.old_data)
+        cls.recent = cls._upload('123456789013', 'report.pdf', b'recent report')
+        cls.legacy = MedicalFile.objects.create(
+            patient_id='123456789012', file_name='old.pdf', file_type='application/pdf',
+            file_data='data:application/pdf;base64,AAAA', file_size=3,
+            uploader_type='patient', uploader_id='123456789012')
+        three_years_ago = timezone.now() - timedelta(days=3 * 365)
+        MedicalFile.objects.filter(id__in=[cls.old.id, cls.legacy.id]).update(uploaded_at=three_years_ago)
+
+    @staticmethod
+    def _upload(aadhar, name, data):
+        medical_file = MedicalFile(patient_id=aadhar, file_name=name, file_type='application/octet-stream',
+                                   file_size=0, uploader_type='patient', uploader_id=aadhar)
+        medical_file.store_content(io.BytesIO(data))
+        medical_file.save()
+        return medical_file
+
+    def test_archived_files_still_download(self):
+        call_command('archive_files', stdout=io.StringIO())
+        store = get_blob_store()
+        self.assertFalse(store.exists(self.old.content_hash))
+        self.assertIsNotNone(Blob.objects.get(sha256=self.old.content_hash).archived_at)
+        self.assertTrue(store.exists(self.recent.content_hash))
+
+        url = reverse('health:download_file', args=[self.old.id])
+        self.assertEqual(b''.join(self.client.get(url).streaming_content), self.old_data)
+        start = ARCHIVE_CHUNK_SIZE - 10
+        response = self.client.get(url, HTTP_RANGE=f'bytes={start}-{start + 19}')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.old_data[start:start + 20])
+
+        legacy = MedicalFile.objects.get(id=self.legacy.id)
+        self.assertEqual(legacy.file_data, '')
+        with legacy.open() as f:
+            self.assertEqual(f.read(), b'\x00\x00\x00')
+
+    def test_content_shared_with_a_recent_file_stays(self):
+        self._upload('123456789013', 'copy.jpg', self.old_data)
+        out = io.StringIO()
+        call_command('archive_files', stdout=out)
+        self.assertIn('1 data URL files and 0 blobs', out.getvalue())
+        self.assertTrue(get_blob_store().exists(self.old.content_hash))
+
+    def test_inactive_patients_are_archived_whole(self):
+        Patient.objects.update(created_at=timezone.now() - timedelta(days=400))
+        call_command('archive_files', min_age_days=10000, inactive_days=365, stdout=io.StringIO())
+        self.assertFalse(get_blob_store().exists(self.old.content_hash))
+        self.assertTrue(get_blob_store().exists(self.recent.content_hash))
+
+
+class SyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.worker = HealthWorker.objects.create(name='Manu', phone='9876500000')
+
+    def setUp(self):
+        get_patient_cache().clear()
+
+    def changes(self, since=None, **params):
+        params = {'worker_id': self.worker.worker_id, **({'since': since} if since else {}), **params}
+        return self.client.get(reverse('health:sync_changes'), params).json()
+
+    def push(self, operations, compress=False):
+        body = json.dumps({'worker_id': self.worker.worker_id, 'operations': operations}).encode()
+        extra = {'HTTP_CONTENT_ENCODING': 'gzip'} if compress else {}
+        return self.client.post(reverse('health:sync_push'), gzip.compress(body) if compress else body,
+                                content_type='application/json', **extra).json()
+
+    def test_feed_sends_latest_state_of_each_change(self):
+        cursor = self.changes()['next_cursor']
+        patient = Patient.objects.create(aadhar='123456789012', name='Asha', phone='9000000001')
+        appointment = Appointment.objects.create(patient=patient, hospital='City', doctor_name='Dr. Rao',
+                                                 appointment_date=date(2026, 3, 1), appointment_time='09:00')
+        cancel_appointment(appointment.appointment_code)
+        medical_file = MedicalFile.objects.create(patient=patient, file_name='x.txt', file_type='text/plain',
+                                                  file_size=0, uploader_type='patient', uploader_id='123456789012')
+        file_id = str(medical_file.id)
+        medical_file.delete()
+
+        # The appointment's two writes fall in the first page, the file's in the second
+        data = self.changes(cursor, limit=3)
+        self.assertTrue(data['more'])
+        changes = data['changes']
+        data = self.changes(data['next_cursor'])
+        self.assertFalse(data['more'])
+        changes += data['changes']
+        self.assertEqual([(c['kind'], c['key']) for c in changes], [
+            ('patient', '123456789012'),
+            ('appointment', appointment.appointment_code),
+            ('file', file_id),
+        ])
+        self.assertEqual(changes[1]['data']['status'], 'cancelled')
+        self.assertIsNone(changes[2]['data'])
+        self.assertEqual(self.changes(data['next_cursor'])['changes'], [])
+
+    def test_push_applies_operations_once(self):
+        operations = [
+            {'key': 'r1', 'op': 'register_patient',
+             'data': {'aadhar': '123456789012', 'name': 'Asha', 'phone': '9000000001'}},
+            {'key': 'b1', 'op': 'book_appointment',
+             'data': {'patient_aadhar': '123456789012', 'hospital': 'City', 'doctor_name': 'Dr. Rao',
+                      'appointment_date': '2026-03-01', 'appointment_time': '09:00'}},
+            {'key': 'b2', 'op': 'book_appointment', 'data': {'patient_aadhar': '999999999999'}},
+        ]
+        data = self.push(operations, compress=True)
+        self.assertEqual(data['applied'], 2)
+        self.assertEqual([result['success'] for result in data['results']], [True, True, False])
+
+        retried = self.push(operations)
+        self.assertEqual(retried['applied'], 0)
+        self.assertEqual([result.get('replayed', False) for result in retried['results']], [True, True, False])
+        self.assertEqual(retried['results'][1]['appointment_code'], data['results'][1]['appointment_code'])
+        self.assertEqual(Appointment.objects.count(), 1)
+
+        # The failed operation runs again once whatever made it fail is fixed
+        Patient.objects.create(aadhar='999999999999', name='Ravi', phone='9000000002')
+        operations[2]['data'] = {**operations[1]['data'], 'patient_aadhar': '999999999999'}
+        retried = self.push(operations)
+        self.assertEqual(retried['applied'], 1)
+        self.assertTrue(retried['results'][2]['success'])
+        self.assertTrue(self.push(operations)['results'][2]['replayed'])
+        self.assertEqual(Appointment.objects.count(), 2)
+
+        self.assertFalse(self.push([{'op': 'register_patient'}])['success'])
+
+class QueryPlanTests(TestCase):
+    """The hot-path lookups must be answered from an index, not a table scan"""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        batch = 10000
+        for start in range(0, PLAN_TEST_PATIENTS, batch):
+            Patient.objects.bulk_create([
+                Patient(aadhar=f'{100000000000 + i}', name=f'Worker {i}', phone=f'9{i % 1000000000:09d}')
+                for i in range(start, min(start + batch, PLAN_TEST_PATIENTS))
+            ])
+        patients = list(Patient.objects.order_by('aadhar')[:200])
+        MedicalFile.objects.bulk_create([
+            MedicalFile(patient=p, file_name='x.pdf', file_type='application/pdf', file_size=1,
+                        uploader_type='patient', uploader_id=p.aadhar, uploaded_at=now - timedelta(days=i))
+            for p in patients for i in range(5)
+        ])
+        Appointment.objects.bulk_create([
+            Appointment(appointment_code=f'T{n:08d}', patient=p, hospital='GH', doctor_name='D',
+                        appointment_date=(now - timedelta(days=i)).date(), appointment_time='10:00')
+            for n, (p, i) in enumerate((p, i) for p in patients for i in range(5))
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+        self.assertNotIn('SCAN health_', plan.replace(f'USING INDEX {index_name}', ''), plan)
+        return plan
+
+    def test_login_uses_login_index(self):
+        self.assertUsesIndex(Patient.objects.matching_login('Worker 42', '9000000042'), 'patient_login_idx')
+
+    def test_file_listing_uses_recent_index(self):
+        qs = (MedicalFile.objects.filter(patient_id='100000000001')
+              .only('id', 'file_name', 'uploaded_at').order_by('-uploaded_at', '-id'))
+        plan = self.assertUsesIndex(qs, 'medicalfile_patient_recent_idx')
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_appointments_by_patient_and_date(self):
+        qs = Appointment.objects.filter(patient_id='100000000001', appointment_date__gte='2026-01-01')
+        self.assertUsesIndex(qs, 'appointment_patient_date_idx')
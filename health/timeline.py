@@ -0,0 +1,116 @@
+"""
+A patient's medical files and appointments as one newest-first timeline.
+
+Each table is read with its own keyset, and a page is the merge of the
+next ``limit`` rows of both. The cursor records how far each table has
+been consumed, so a page costs two indexed queries however deep it is.
+"""
+import hashlib
+import heapq
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max, Q
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Appointment, MedicalFile
+from .pagination import decode_cursor, encode_cursor
+
+
+def timeline_version(aadhar):
+    """
+    Fingerprint of everything on a patient's timeline.
+
+    Counts catch deletions, the latest upload and appointment change catch
+    additions and edits.
+    """
+    files = MedicalFile.objects.filter(patient_id=aadhar).aggregate(count=Count('id'), last=Max('uploaded_at'))
+    appointments = (Appointment.objects.filter(patient_id=aadhar)
+                    .aggregate(count=Count('id'), last=Max('updated_at')))
+    raw = f"{files['count']}:{files['last']}:{appointments['count']}:{appointments['last']}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+def _file_event(file):
+    local = timezone.localtime(file.uploaded_at)
+    return (local.date().isoformat(), local.time().isoformat()), {
+        'kind': 'file',
+        'at': local.strftime('%Y-%m-%d %H:%M'),
+        'id': str(file.id),
+        'name': file.file_name,
+        'type': file.file_type,
+        'size': file.file_size,
+        'uploader': f"{file.uploader_type}-{file.uploader_id}",
+        'url': reverse('health:download_file', args=[file.id]),
+    }
+
+
+def _appointment_event(appointment):
+    date = appointment.appointment_date.isoformat()
+    return (date, appointment.appointment_time), {
+        'kind': 'appointment',
+        'at': f'{date} {appointment.appointment_time}',
+        'code': appointment.appointment_code,
+        'hospital': appointment.hospital,
+        'doctor_name': appointment.doctor_name,
+        'status': appointment.status,
+    }
+
+
+def timeline_page(aadhar, limit, cursor=None):
+    """
+    Return (events, next_cursor) for one page of the patient's timeline.
+
+    Raises ValueError for a malformed cursor.
+    """
+    files = (MedicalFile.objects.filter(patient_id=aadhar)
+             .only('id', 'file_name', 'file_type', 'file_size', 'uploader_type', 'uploader_id', 'uploaded_at')
+             .order_by('-uploaded_at', '-id'))
+    appointments = (Appointment.objects.filter(patient_id=aadhar)
+                    .only('id', 'appointment_code', 'hospital', 'doctor_name', 'appointment_date',
+                          'appointment_time', 'status')
+                    .order_by('-appointment_date', '-appointment_time', '-id'))
+
+    file_position = appointment_position = None
+    if cursor:
+        try:
+            file_position, appointment_position = decode_cursor(cursor)
+            if file_position:
+                uploaded_at, file_id = parse_datetime(file_position[0]), file_position[1]
+                if uploaded_at is None:
+                    raise ValueError
+                files = files.filter(Q(uploaded_at__lt=uploaded_at) | Q(uploaded_at=uploaded_at, id__lt=file_id))
+            if appointment_position:
+                date, time, appointment_id = parse_date(appointment_position[0]), *appointment_position[1:]
+                if date is None:
+                    raise ValueError
+                appointments = appointments.filter(
+                    Q(appointment_date__lt=date) |
+                    Q(appointment_date=date, appointment_time__lt=time) |
+                    Q(appointment_date=date, appointment_time=time, id__lt=appointment_id)
+                )
+        except (IndexError, TypeError, ValueError, ValidationError):
+            raise ValueError('Invalid cursor')
+
+    # Each table is already in timeline order, so merging keeps that order
+    rows = heapq.merge(
+        ((*_file_event(file), file) for file in files[:limit + 1]),
+        ((*_appointment_event(appointment), appointment) for appointment in appointments[:limit + 1]),
+        key=lambda row: row[0],
+        reverse=True,
+    )
+    events = []
+    more = False
+    for _, event, row in rows:
+        if len(events) == limit:
+            more = True
+            break
+        events.append(event)
+        if event['kind'] == 'file':
+            file_position = [row.uploaded_at.isoformat(), str(row.id)]
+        else:
+            appointment_position = [row.appointment_date.isoformat(), row.appointment_time, row.id]
+
+    next_cursor = encode_cursor(file_position, appointment_position) if more else None
+    return events, next_cursor
@@ -0,0 +1,135 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+
+from .blobstore import CHUNK_SIZE, get_blob_store
+from .models import Blob
+
+
+class UploadError(Exception):
+    pass
+
+
+def upload_root():
+    return str(getattr(settings, 'HEALTH_UPLOAD_DIR', os.path.join(settings.BASE_DIR, 'uploads')))
+
+
+def max_upload_size():
+    return getattr(settings, 'HEALTH_UPLOAD_MAX_SIZE', settings.DATA_UPLOAD_MAX_MEMORY_SIZE)
+
+
+def check_upload_size(file_size):
+    if file_size > max_upload_size():
+        raise UploadError(f'File is larger than the {max_upload_size() // (1024 * 1024)}MB limit')
+
+
+def session_dir(session):
+    return os.path.join(upload_root(), str(session.id))
+
+
+def chunk_path(session, index):
+    return os.path.join(session_dir(session), f'{index:06d}.part')
+
+
+def write_chunk(session, index, stream, expected_sha256=''):
+    """
+    Copy one chunk from ``stream`` to temporary storage, hashing as it arrives.
+
+    The part is only moved into place once it has the expected length and
+    checksum, so an interrupted PUT never leaves a truncated chunk behind.
+    Returns (size, sha256).
+    """
+    if not 0 <= index < session.chunk_count:
+        raise UploadError('Chunk index out of range')
+    expected_size = session.expected_chunk_size(index)
+
+    directory = session_dir(session)
+    os.makedirs(directory, exist_ok=True)
+    hasher = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            for data in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                size += len(data)
+                if size > expected_size:
+                    raise UploadError('Chunk is larger than expected')
+                hasher.update(data)
+                tmp.write(data)
+        if size != expected_size:
+            raise UploadError(f'Chunk {index} must be {expected_size} bytes, got {size}')
+        digest = hasher.hexdigest()
+        if expected_sha256 and expected_sha256.lower() != digest:
+            raise UploadError('Chunk checksum mismatch')
+        os.replace(tmp_path, chunk_path(session, index))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return size, digest
+
+
+class ChunkReader(io.RawIOBase):
+    """Read the parts of an upload session in order as one stream"""
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+        self.current = None
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while True:
+            if self.current is None:
+                if not self.paths:
+                    return b''
+                self.current = open(self.paths.pop(0), 'rb')
+            data = self.current.read(size)
+            if data:
+                return data
+            self.current.close()
+            self.current = None
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+        super().close()
+
+
+def assemble(session):
+    """
+    Stream the received chunks into the blob store and return (digest, size).
+
+    Raises UploadError when the file is over the size limit, chunks are
+    missing or the whole-file checksum declared at init does not match.
+    Content stored for a mismatched upload is left to gc_blobs, as another
+    upload of the same bytes may be about to reference it; Blob.touch()
+    gives it the row gc_blobs needs to find it.
+    """
+    check_upload_size(session.file_size)
+    paths = [chunk_path(session, i) for i in range(session.chunk_count)]
+    missing = [i for i, path in enumerate(paths) if not os.path.exists(path)]
+    if missing:
+        raise UploadError(f'Missing chunks: {missing}')
+    store = get_blob_store()
+    with ChunkReader(paths) as reader:
+        digest, size = store.put(reader)
+    stored = Blob.touch(digest, size)
+    if size != session.file_size or (session.sha256 and session.sha256.lower() != digest):
+        raise UploadError('Assembled file does not match the declared size or checksum')
+    if not stored:
+        # Collected by gc_blobs after put() found it already stored
+        with ChunkReader(paths) as reader:
+            store.put(reader)
+    return digest, size
+
+
+def discard(session):
+    """Remove the temporary chunks of a session"""
+    shutil.rmtree(session_dir(session), ignore_errors=True)
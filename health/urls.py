@@ -5,22 +5,45 @@ app_name = 'health'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('metrics', views.metrics_view, name='metrics'),
     
     # Patient endpoints
     path('api/register-patient/', views.register_patient, name='register_patient'),
     path('api/login-patient/', views.login_patient, name='login_patient'),
+    path('api/import-patients/', views.import_patients, name='import_patients'),
     path('api/patient-files/<str:aadhar>/', views.get_patient_files, name='get_patient_files'),
+    path('api/patient-files/<str:aadhar>/search/', views.search_patient_records, name='search_patient_records'),
+    path('api/patient/<str:aadhar>/timeline/', views.patient_timeline, name='patient_timeline'),
+    path('api/patient/<str:aadhar>/export/', views.export_patient_record, name='export_patient_record'),
     path('api/verify-patient/<str:aadhar>/', views.verify_patient_qr, name='verify_patient_qr'),
+    path('api/verify-qr-tokens/', views.verify_qr_tokens, name='verify_qr_tokens'),
     
     # Doctor endpoints
     path('api/register-doctor/', views.register_doctor, name='register_doctor'),
     path('api/login-doctor/', views.login_doctor, name='login_doctor'),
+    path('api/doctors/search/', views.doctor_search, name='doctor_search'),
     
     # Health Worker endpoints
     path('api/register-worker/', views.register_worker, name='register_worker'),
     path('api/login-worker/', views.login_worker, name='login_worker'),
+    path('api/sync/changes/', views.sync_changes, name='sync_changes'),
+    path('api/sync/push/', views.sync_push, name='sync_push'),
     
     # File and appointment endpoints
     path('api/upload-file/', views.upload_file, name='upload_file'),
     path('api/book-appointment/', views.book_appointment, name='book_appointment'),
+    path('api/cancel-appointment/', views.cancel_appointment, name='cancel_appointment'),
+    path('api/batch/', views.batch, name='batch'),
+    path('api/slots/', views.available_slots, name='available_slots'),
+    path('api/files/<uuid:file_id>/', views.download_file, name='download_file'),
+    path('api/files/<uuid:file_id>/preview/', views.file_preview, name='file_preview'),
+    
+    # Public-health analytics from the daily rollups
+    path('api/analytics/<str:rollup>/', views.analytics, name='analytics'),
+    
+    # Resumable chunked uploads
+    path('api/uploads/', views.init_upload, name='init_upload'),
+    path('api/uploads/<uuid:upload_id>/', views.upload_status, name='upload_status'),
+    path('api/uploads/<uuid:upload_id>/chunks/<int:index>/', views.upload_chunk, name='upload_chunk'),
+    path('api/uploads/<uuid:upload_id>/commit/', views.commit_upload, name='commit_upload'),
 ]
\ No newline at end of file
@@ -0,0 +1,25 @@
+from django.core.exceptions import ValidationError
+
+
+def clean_patient(data):
+    """Validate patient registration fields and return them stripped"""
+    name = str(data.get('name') or '').strip()
+    phone = str(data.get('phone') or '').strip()
+    aadhar = str(data.get('aadhar') or '').strip()
+    email = str(data.get('email') or '').strip()
+
+    if not all([name, phone, aadhar]):
+        raise ValidationError('All required fields must be filled')
+
+    if len(phone) != 10 or not phone.isdigit():
+        raise ValidationError('Phone must be 10 digits')
+
+    if len(aadhar) != 12 or not aadhar.isdigit():
+        raise ValidationError('Aadhar must be 12 digits')
+
+    return {
+        'aadhar': aadhar,
+        'name': name,
+        'phone': phone,
+        'email': email if email else None,
+    }
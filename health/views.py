@@ -1,57 +1,71 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, JsonResponse
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.dateparse import parse_date, parse_datetime
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
-from django.core.exceptions import ObjectDoesNotExist
+from django.views.decorators.http import condition, require_http_methods
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.core.signing import BadSignature
+import hashlib
+import io
 import json
-from .models import Patient, Doctor, HealthWorker, MedicalFile, Appointment
+import uuid
+from datetime import timedelta
+from . import export, importer, metrics, operations, rollups, search, slots, sync, timeline
+from .blobstore import get_blob_store
+from .cache import get_patient_cache, profile_of
+from .compression import accepted_encodings, is_compressible
+from .db import read_only
+from .http import etag_matches, not_modified, ranged_file_response, request_body, stream_async
+from .ids import APPOINTMENT_CODES, DOCTOR_IDS, WORKER_IDS
+from .models import Doctor, HealthWorker, Blob, MedicalFile, UploadSession, UploadChunk
+from .pagination import decode_cursor, encode_cursor, page_size
+from .qr import TokenExpired, issue_token, profile_version, read_token
+from .uploads import assemble, check_upload_size, discard, write_chunk
+
+PREVIEW_MAX_AGE = 365 * 24 * 60 * 60
+# Medical files are immutable too, but only the patient's own client may keep them
+FILE_CACHE_CONTROL = f'private, max-age={PREVIEW_MAX_AGE}, immutable'
+MAX_QR_TOKENS = 500
+MAX_BATCH_OPERATIONS = 100
+MAX_SLOT_RANGE_DAYS = 31
+DEFAULT_ANALYTICS_DAYS = 30
 
 def index(request):
     """Serve the main HTML page"""
     return render(request, 'health/index.html')
 
+@require_http_methods(["GET"])
+def metrics_view(request):
+    """Per-endpoint request metrics in the Prometheus text format"""
+    body = metrics.render() + get_patient_cache().render_stats()
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def register_patient(request):
     """Register a new patient"""
     try:
         data = json.loads(request.body)
-        name = data.get('name', '').strip()
-        phone = data.get('phone', '').strip()
-        aadhar = data.get('aadhar', '').strip()
-        email = data.get('email', '').strip()
-        
-        # Validation
-        if not all([name, phone, aadhar]):
-            return JsonResponse({'success': False, 'error': 'All required fields must be filled'})
-        
-        if len(phone) != 10 or not phone.isdigit():
-            return JsonResponse({'success': False, 'error': 'Phone must be 10 digits'})
         
-        if len(aadhar) != 12 or not aadhar.isdigit():
-            return JsonResponse({'success': False, 'error': 'Aadhar must be 12 digits'})
+        try:
+            patient = operations.register_patient(data)
+        except ValidationError as e:
+            return JsonResponse({'success': False, 'error': e.messages[0]})
         
-        # Check if patient already exists
-        if Patient.objects.filter(aadhar=aadhar).exists():
-            return JsonResponse({'success': False, 'error': 'Patient with this Aadhar already exists'})
-        
-        # Create patient
-        patient = Patient.objects.create(
-            aadhar=aadhar,
-            name=name,
-            phone=phone,
-            email=email if email else None
-        )
+        patient_data = profile_of(patient)
         
         return JsonResponse({
             'success': True, 
             'message': 'Patient registered successfully',
-            'patient_data': {
-                'aadhar': patient.aadhar,
-                'name': patient.name,
-                'phone': patient.phone,
-                'email': patient.email
-            }
+            'patient_data': patient_data,
+            'qr_token': issue_token(patient_data)
         })
         
     except json.JSONDecodeError:
@@ -61,6 +75,38 @@ def register_patient(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+def import_patients(request):
+    """Register many patients from a CSV or JSONL request body"""
+    try:
+        content_type = request.content_type or ''
+        fmt = request.GET.get('format') or ('csv' if 'csv' in content_type else 'jsonl')
+        if fmt not in ('csv', 'jsonl'):
+            return JsonResponse({'success': False, 'error': 'Format must be csv or jsonl'})
+        
+        # Stream the body line by line instead of loading it whole
+        lines = (line.decode('utf-8-sig') for line in request)
+        result = importer.import_patients(importer.read_records(lines, fmt))
+        
+        return JsonResponse({
+            'success': True,
+            'message': f'{result.created} patients registered',
+            'created': result.created,
+            'duplicates': result.duplicates,
+            'rows': result.rows,
+            'errors': [
+                {'row': row, 'aadhar': aadhar, 'error': error}
+                for row, aadhar, error in result.errors
+            ]
+        })
+        
+    except UnicodeDecodeError:
+        return JsonResponse({'success': False, 'error': 'Body must be UTF-8 text'})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@read_only
 def login_patient(request):
     """Login patient by name and phone"""
     try:
@@ -71,16 +117,12 @@ def login_patient(request):
         if not all([name, phone]):
             return JsonResponse({'success': False, 'error': 'Name and phone are required'})
         
-        patient = Patient.objects.get(name=name, phone=phone)
+        patient_data = get_patient_cache().get_by_login(name, phone)
         
         return JsonResponse({
             'success': True,
-            'patient_data': {
-                'aadhar': patient.aadhar,
-                'name': patient.name,
-                'phone': patient.phone,
-                'email': patient.email
-            }
+            'patient_data': patient_data,
+            'qr_token': issue_token(patient_data)
         })
         
     except ObjectDoesNotExist:
@@ -128,6 +170,7 @@ def register_doctor(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@read_only
 def login_doctor(request):
     """Login doctor by ID"""
     try:
@@ -137,7 +180,7 @@ def login_doctor(request):
         if not doctor_id:
             return JsonResponse({'success': False, 'error': 'Doctor ID is required'})
         
-        doctor = Doctor.objects.get(doctor_id=doctor_id)
+        doctor = Doctor.objects.get(doctor_id=DOCTOR_IDS.parse(doctor_id))
         
         return JsonResponse({
             'success': True,
@@ -156,6 +199,47 @@ def login_doctor(request):
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
+@require_http_methods(["GET"])
+def doctor_search(request):
+    """Type-ahead search of the doctor directory by name or hospital"""
+    try:
+        query = request.GET.get('q', '').strip()
+        specialization = request.GET.get('specialization', '').strip()
+        if specialization and specialization not in dict(Doctor.SPECIALIZATIONS):
+            return JsonResponse({'success': False, 'error': 'Unknown specialization'})
+        
+        limit = page_size(request)
+        
+        # Ranked results page by position rather than by key
+        offset = 0
+        cursor = request.GET.get('cursor')
+        if cursor:
+            try:
+                offset, = decode_cursor(cursor)
+                offset = max(0, int(offset))
+            except (ValueError, TypeError):
+                return JsonResponse({'success': False, 'error': 'Invalid cursor'})
+        
+        doctors = search.search_doctors(query, specialization, limit + 1, offset)
+        page = doctors[:limit]
+        has_more = len(doctors) > limit
+        
+        return JsonResponse({
+            'success': True,
+            'doctors': [{
+                'id': doctor.doctor_id,
+                'name': doctor.name,
+                'specialization': doctor.specialization,
+                'hospital': doctor.hospital
+            } for doctor in page],
+            'next_cursor': encode_cursor(offset + limit) if has_more else None
+        })
+        
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def register_worker(request):
@@ -194,6 +278,7 @@ def register_worker(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@read_only
 def login_worker(request):
     """Login health worker by ID"""
     try:
@@ -203,7 +288,7 @@ def login_worker(request):
         if not worker_id:
             return JsonResponse({'success': False, 'error': 'Worker ID is required'})
         
-        worker = HealthWorker.objects.get(worker_id=worker_id)
+        worker = HealthWorker.objects.get(worker_id=WORKER_IDS.parse(worker_id))
         
         return JsonResponse({
             'success': True,
@@ -223,39 +308,206 @@ def login_worker(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def upload_file(request):
+def batch(request):
+    """
+    Run several registrations, bookings and uploads in one request and transaction.
+    
+    The body is {"operations": [{"op": "register_patient", "data": {...}}, ...]}
+    with each ``data`` as its single-request endpoint takes it. With
+    "atomic": true nothing is saved unless every operation succeeds.
+    """
+    try:
+        data = json.loads(request_body(request, settings.DATA_UPLOAD_MAX_MEMORY_SIZE))
+        items = data.get('operations')
+        
+        if not isinstance(items, list) or not items:
+            return JsonResponse({'success': False, 'error': 'operations must be a non-empty list'})
+        if len(items) > MAX_BATCH_OPERATIONS:
+            return JsonResponse({'success': False, 'error': f'At most {MAX_BATCH_OPERATIONS} operations per batch'})
+        
+        results, committed = operations.apply_operations(
+            [(item.get('op'), item.get('data')) if isinstance(item, dict) else (None, None) for item in items],
+            all_or_nothing=bool(data.get('atomic'))
+        )
+        
+        response = {'success': committed, 'results': results}
+        if not committed:
+            response['error'] = 'Batch rolled back'
+        return JsonResponse(response)
+        
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return JsonResponse({'success': False, 'error': 'Invalid JSON data'})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+@require_http_methods(["GET"])
+@read_only
+def sync_changes(request):
+    """Patients, appointments and file metadata changed since the ``since`` cursor, oldest first"""
+    try:
+        worker_id = WORKER_IDS.parse(request.GET.get('worker_id', ''))
+        if not HealthWorker.objects.filter(worker_id=worker_id).exists():
+            return JsonResponse({'success': False, 'error': 'Invalid Worker ID'})
+        
+        limit = page_size(request, default=sync.DEFAULT_CHANGES, maximum=sync.MAX_CHANGES)
+        changes, next_cursor, more = sync.changes_since(request.GET.get('since'), limit)
+        
+        return JsonResponse({
+            'success': True,
+            'changes': changes,
+            'next_cursor': next_cursor,
+            'more': more
+        })
+        
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def sync_push(request):
+    """Apply a worker's queued offline operations; the body may be gzip-compressed"""
+    try:
+        data = json.loads(request_body(request, sync.MAX_PUSH_BYTES))
+        worker = HealthWorker.objects.get(worker_id=WORKER_IDS.parse(str(data.get('worker_id') or '')))
+        
+        try:
+            results = sync.apply_push(worker, data.get('operations'))
+        except ValidationError as e:
+            return JsonResponse({'success': False, 'error': e.messages[0]})
+        
+        return JsonResponse({
+            'success': True,
+            'applied': sum(1 for result in results if result['success'] and not result.get('replayed')),
+            'results': results
+        })
+        
+    except ObjectDoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Invalid Worker ID'})
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return JsonResponse({'success': False, 'error': 'Invalid JSON data'})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def upload_file(request):
     """Upload medical file for a patient"""
+    try:
+        data = json.loads(request.body)
+        
+        try:
+            fields, raw = operations.clean_upload(data)
+        except ValidationError as e:
+            return JsonResponse({'success': False, 'error': e.messages[0]})
+        
+        # Verify patient exists
+        fields['patient_id'] = (await get_patient_cache().aget(fields['patient_id']))['aadhar']
+        
+        # Create medical file record, keeping the bytes in the blob store
+        medical_file = MedicalFile(**fields)
+        await medical_file.astore_content(io.BytesIO(raw))
+        await medical_file.asave()
+        
+        return JsonResponse({
+            'success': True,
+            'message': 'File uploaded successfully',
+            'file_id': str(medical_file.id)
+        })
+        
+    except ObjectDoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Patient not found'})
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON data'})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+@require_http_methods(["GET", "HEAD"])
+async def file_preview(request, file_id):
+    """Serve the cached thumbnail of a medical file"""
+    blob = await (Blob.objects
+                  .filter(sha256=Subquery(MedicalFile.objects.filter(id=file_id).values('content_hash')[:1]))
+                  .exclude(preview_hash='')
+                  .only('preview_hash', 'preview_type')
+                  .afirst())
+    if blob is None:
+        return JsonResponse({'success': False, 'error': 'Preview not available'}, status=404)
+    
+    etag = f'"{blob.preview_hash}"'
+    if etag_matches(request, etag):
+        return not_modified(etag, f'public, max-age={PREVIEW_MAX_AGE}, immutable')
+    
+    try:
+        fileobj = await sync_to_async(get_blob_store().open, thread_sensitive=False)(blob.preview_hash)
+    except FileNotFoundError:
+        return JsonResponse({'success': False, 'error': 'Preview not available'}, status=404)
+    
+    response = FileResponse(fileobj, content_type=blob.preview_type)
+    # A file's content never changes, so neither does its preview
+    patch_cache_control(response, public=True, max_age=PREVIEW_MAX_AGE, immutable=True)
+    response['ETag'] = etag
+    return stream_async(request, response)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def init_upload(request):
+    """Start a resumable chunked upload for a patient file"""
     try:
         data = json.loads(request.body)
         patient_aadhar = data.get('patient_aadhar', '').strip()
         file_name = data.get('file_name', '').strip()
-        file_data = data.get('file_data', '')
         file_type = data.get('file_type', '')
-        file_size = data.get('file_size', 0)
+        file_size = data.get('file_size')
         uploader_type = data.get('uploader_type', '')
         uploader_id = data.get('uploader_id', '')
+        sha256 = data.get('sha256', '').strip().lower()
         
-        if not all([patient_aadhar, file_name, file_data, uploader_type]):
+        if not all([patient_aadhar, file_name, uploader_type]) or file_size is None:
             return JsonResponse({'success': False, 'error': 'Required fields missing'})
         
-        # Verify patient exists
-        patient = Patient.objects.get(aadhar=patient_aadhar)
+        if not isinstance(file_size, int) or file_size < 0:
+            return JsonResponse({'success': False, 'error': 'File size must be a non-negative integer'})
+        
+        check_upload_size(file_size)
         
-        # Create medical file record
-        medical_file = MedicalFile.objects.create(
-            patient=patient,
+        patient_aadhar = get_patient_cache().get(patient_aadhar)['aadhar']
+        
+        # Hash-first handshake: content already in this patient's record is linked, not re-sent.
+        # Only theirs: knowing a hash must not be enough to copy another patient's document.
+        if sha256 and MedicalFile.objects.filter(patient_id=patient_aadhar, content_hash=sha256,
+                                                 file_size=file_size).exists():
+            medical_file = MedicalFile.objects.create(
+                patient_id=patient_aadhar,
+                file_name=file_name,
+                content_hash=sha256,
+                file_type=file_type,
+                file_size=file_size,
+                uploader_type=uploader_type,
+                uploader_id=uploader_id
+            )
+            return JsonResponse({
+                'success': True,
+                'deduplicated': True,
+                'message': 'File uploaded successfully',
+                'file_id': str(medical_file.id)
+            })
+        
+        session = UploadSession.objects.create(
+            patient_id=patient_aadhar,
             file_name=file_name,
-            file_data=file_data,
             file_type=file_type,
             file_size=file_size,
+            chunk_size=settings.HEALTH_UPLOAD_CHUNK_SIZE,
+            sha256=sha256,
             uploader_type=uploader_type,
             uploader_id=uploader_id
         )
         
         return JsonResponse({
             'success': True,
-            'message': 'File uploaded successfully',
-            'file_id': str(medical_file.id)
+            'deduplicated': False,
+            'upload_id': str(session.id),
+            'chunk_size': session.chunk_size,
+            'chunk_count': session.chunk_count
         })
         
     except ObjectDoesNotExist:
@@ -265,32 +517,114 @@ def upload_file(request):
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
+@require_http_methods(["GET"])
+def upload_status(request, upload_id):
+    """Report which chunks of an upload have been received, for resuming"""
+    try:
+        session = UploadSession.objects.get(id=upload_id)
+        received = list(session.chunks.order_by('index').values_list('index', flat=True))
+        
+        return JsonResponse({
+            'success': True,
+            'status': session.status,
+            'chunk_size': session.chunk_size,
+            'chunk_count': session.chunk_count,
+            'received': received,
+            'file_id': str(session.medical_file_id) if session.medical_file_id else None
+        })
+        
+    except ObjectDoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Upload not found'})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+@csrf_exempt
+@require_http_methods(["PUT"])
+def upload_chunk(request, upload_id, index):
+    """Receive one numbered chunk as the raw request body"""
+    try:
+        session = UploadSession.objects.get(id=upload_id, status='open')
+        
+        # Read the body as a stream so the chunk never sits in memory whole
+        size, sha256 = write_chunk(session, index, request, request.headers.get('X-Chunk-SHA256', ''))
+        UploadChunk.objects.update_or_create(
+            session=session,
+            index=index,
+            defaults={'size': size, 'sha256': sha256}
+        )
+        
+        return JsonResponse({'success': True, 'index': index, 'sha256': sha256})
+        
+    except ObjectDoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Upload not found'})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def commit_upload(request, upload_id):
+    """Assemble the received chunks into a medical file"""
+    try:
+        session = UploadSession.objects.get(id=upload_id)
+        
+        # A retried commit returns the file created by the first one
+        if session.status == 'committed':
+            return JsonResponse({
+                'success': True,
+                'message': 'File uploaded successfully',
+                'file_id': str(session.medical_file_id)
+            })
+        
+        content_hash, file_size = assemble(session)
+        
+        with transaction.atomic():
+            medical_file = MedicalFile.objects.create(
+                patient_id=session.patient_id,
+                file_name=session.file_name,
+                content_hash=content_hash,
+                file_type=session.file_type,
+                file_size=file_size,
+                uploader_type=session.uploader_type,
+                uploader_id=session.uploader_id
+            )
+            # Conditional update so two racing commits create only one file
+            committed = UploadSession.objects.filter(id=session.id, status='open').update(
+                status='committed', medical_file=medical_file, updated_at=timezone.now()
+            )
+            if not committed:
+                transaction.set_rollback(True)
+            else:
+                session.chunks.all().delete()
+        
+        if not committed:
+            session.refresh_from_db()
+            medical_file_id = session.medical_file_id
+        else:
+            medical_file_id = medical_file.id
+            discard(session)
+        
+        return JsonResponse({
+            'success': True,
+            'message': 'File uploaded successfully',
+            'file_id': str(medical_file_id)
+        })
+        
+    except ObjectDoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Upload not found'})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def book_appointment(request):
     """Book an appointment"""
     try:
         data = json.loads(request.body)
-        patient_aadhar = data.get('patient_aadhar', '').strip()
-        hospital = data.get('hospital', '').strip()
-        doctor_name = data.get('doctor_name', '').strip()
-        appointment_date = data.get('appointment_date', '').strip()
-        appointment_time = data.get('appointment_time', '').strip()
-        
-        if not all([patient_aadhar, hospital, doctor_name, appointment_date, appointment_time]):
-            return JsonResponse({'success': False, 'error': 'All fields are required'})
         
-        # Verify patient exists
-        patient = Patient.objects.get(aadhar=patient_aadhar)
-        
-        # Create appointment
-        appointment = Appointment.objects.create(
-            patient=patient,
-            hospital=hospital,
-            doctor_name=doctor_name,
-            appointment_date=appointment_date,
-            appointment_time=appointment_time
-        )
+        try:
+            appointment = operations.book_appointment(data)
+        except ValidationError as e:
+            return JsonResponse({'success': False, 'error': e.messages[0]})
         
         return JsonResponse({
     'success': True,
@@ -307,22 +641,116 @@ def book_appointment(request):
 
         })
         
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON data'})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def cancel_appointment(request):
+    """Cancel an appointment, freeing its slot"""
+    try:
+        data = json.loads(request.body)
+        appointment_code = APPOINTMENT_CODES.parse(data.get('appointment_code', ''))
+        
+        if not appointment_code:
+            return JsonResponse({'success': False, 'error': 'Appointment code is required'})
+        
+        if not slots.cancel_appointment(appointment_code):
+            return JsonResponse({'success': False, 'error': 'Appointment is not scheduled'})
+        
+        return JsonResponse({'success': True, 'message': 'Appointment cancelled'})
+        
     except ObjectDoesNotExist:
-        return JsonResponse({'success': False, 'error': 'Patient not found'})
+        return JsonResponse({'success': False, 'error': 'Appointment not found'})
     except json.JSONDecodeError:
         return JsonResponse({'success': False, 'error': 'Invalid JSON data'})
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
 @require_http_methods(["GET"])
-def get_patient_files(request, aadhar):
-    """Get all files for a patient"""
+def available_slots(request):
+    """List open appointment slots over a date range"""
     try:
-        patient = Patient.objects.get(aadhar=aadhar)
-        files = MedicalFile.objects.filter(patient=patient).order_by('-uploaded_at')
+        start = parse_date(request.GET.get('from', '')) or timezone.localdate()
+        end = parse_date(request.GET.get('to', '')) or start + timedelta(days=7)
+        
+        if end < start or (end - start).days > MAX_SLOT_RANGE_DAYS:
+            return JsonResponse({'success': False, 'error': f'Date range must be 0-{MAX_SLOT_RANGE_DAYS} days'})
+        
+        limit = page_size(request)
+        results = slots.available_slots(
+            start, end,
+            hospital=request.GET.get('hospital', '').strip(),
+            doctor_id=DOCTOR_IDS.parse(request.GET.get('doctor_id', '')),
+            specialization=request.GET.get('specialization', '').strip()
+        )[:limit]
+        
+        return JsonResponse({
+            'success': True,
+            'slots': [{
+                'id': slot.id,
+                'doctor_id': slot.doctor_id,
+                'doctor': slot.doctor.name,
+                'specialization': slot.doctor.specialization,
+                'hospital': slot.hospital,
+                'date': slot.date,
+                'time': slot.start_time.strftime('%H:%M'),
+                'available': slot.capacity - slot.booked
+            } for slot in results]
+        })
+        
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+@require_http_methods(["GET"])
+@read_only
+async def get_patient_files(request, aadhar):
+    """Get one page of file metadata for a patient, newest first"""
+    try:
+        limit = page_size(request)
+        
+        # Verify patient exists
+        await get_patient_cache().aget(aadhar)
+        
+        files = (MedicalFile.objects
+                 .filter(patient_id=aadhar)
+                 .only('id', 'file_name', 'content_hash', 'file_type', 'file_size',
+                       'uploader_type', 'uploader_id', 'uploaded_at')
+                 .order_by('-uploaded_at', '-id'))
+        
+        # Keyset pagination on (uploaded_at, id)
+        cursor = request.GET.get('cursor')
+        if cursor:
+            try:
+                uploaded_at, file_id = decode_cursor(cursor)
+                uploaded_at = parse_datetime(uploaded_at)
+                if uploaded_at is None:
+                    raise ValueError
+                files = files.filter(
+                    Q(uploaded_at__lt=uploaded_at) |
+                    Q(uploaded_at=uploaded_at, id__lt=file_id)
+                )
+            except (ValueError, TypeError, ValidationError):
+                return JsonResponse({'success': False, 'error': 'Invalid cursor'})
+        
+        page = [file async for file in files[:limit + 1]]
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_cursor(page[-1].uploaded_at.isoformat(), str(page[-1].id))
+        
+        with_preview = {
+            digest async for digest in
+            Blob.objects
+            .filter(sha256__in={file.content_hash for file in page if file.content_hash})
+            .exclude(preview_hash='')
+            .values_list('sha256', flat=True)
+        } if page else set()
         
         files_data = []
-        for file in files:
+        for file in page:
             files_data.append({
                 'id': str(file.id),
                 'name': file.file_name,
@@ -330,12 +758,14 @@ def get_patient_files(request, aadhar):
                 'size': file.file_size,
                 'uploader': f"{file.uploader_type}-{file.uploader_id}",
                 'uploaded_at': file.uploaded_at.strftime('%Y-%m-%d %H:%M'),
-                'data_url': file.file_data
+                'url': reverse('health:download_file', args=[file.id]),
+                'preview_url': reverse('health:file_preview', args=[file.id]) if file.content_hash in with_preview else None
             })
         
         return JsonResponse({
             'success': True,
-            'files': files_data
+            'files': files_data,
+            'next_cursor': next_cursor
         })
         
     except ObjectDoesNotExist:
@@ -343,23 +773,270 @@ def get_patient_files(request, aadhar):
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
+def timeline_etag(request, aadhar):
+    """ETag of one timeline page: the patient's timeline version plus the page asked for"""
+    try:
+        get_patient_cache().get(aadhar)
+    except ObjectDoesNotExist:
+        return None
+    page = f"{request.GET.get('cursor', '')}:{request.GET.get('limit', '')}"
+    return f'"{timeline.timeline_version(aadhar)}-{hashlib.sha256(page.encode()).hexdigest()[:8]}"'
+
 @require_http_methods(["GET"])
-def verify_patient_qr(request, aadhar):
+@read_only
+@condition(etag_func=timeline_etag)
+def patient_timeline(request, aadhar):
+    """One page of a patient's files and appointments, newest first; 304 when unchanged"""
+    try:
+        limit = page_size(request)
+        
+        # Verify patient exists
+        get_patient_cache().get(aadhar)
+        
+        try:
+            events, next_cursor = timeline.timeline_page(aadhar, limit, request.GET.get('cursor'))
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Invalid cursor'})
+        
+        return JsonResponse({
+            'success': True,
+            'events': events,
+            'next_cursor': next_cursor
+        })
+        
+    except ObjectDoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Patient not found'})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+@require_http_methods(["GET", "HEAD"])
+@read_only
+def export_patient_record(request, aadhar):
+    """
+    Stream a patient's whole record as a ZIP: manifest.json and every file's original bytes.
+    
+    Interrupted downloads resume with Range and If-Range, as for single files.
+    """
+    try:
+        archive, etag = export.patient_archive(aadhar)
+    except ObjectDoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Patient not found'}, status=404)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+    
+    if etag_matches(request, etag):
+        archive.close()
+        return not_modified(etag, 'private, no-cache')
+    response = ranged_file_response(request, archive, content_type='application/zip',
+                                    filename=f'health-record-{aadhar}.zip', as_attachment=True, etag=etag)
+    response['Cache-Control'] = 'private, no-cache'
+    return stream_async(request, response)
+
+@require_http_methods(["GET"])
+@read_only
+def analytics(request, rollup):
+    """
+    Daily rollup totals between ``from`` and ``to``, grouped by ``group_by``.
+
+    Any other dimension of the rollup given as a parameter filters on it,
+    e.g. /api/analytics/appointments/?group_by=date,status&hospital=City.
+    """
+    try:
+        rollup = rollups.ROLLUPS.get(rollup)
+        if rollup is None:
+            return JsonResponse({
+                'success': False,
+                'error': f"Unknown rollup, choose from {', '.join(rollups.ROLLUPS)}"
+            }, status=404)
+        
+        end = parse_date(request.GET.get('to', '')) or timezone.localdate()
+        start = parse_date(request.GET.get('from', '')) or end - timedelta(days=DEFAULT_ANALYTICS_DAYS - 1)
+        if start > end:
+            return JsonResponse({'success': False, 'error': 'from must not be after to'})
+        
+        group_by = [name for name in request.GET.get('group_by', '').split(',') if name]
+        unknown = set(group_by) - set(rollup.dimensions)
+        if unknown:
+            return JsonResponse({'success': False, 'error': f"Cannot group by {', '.join(sorted(unknown))}"})
+        filters = {name: request.GET[name] for name in rollup.dimensions if name != 'date' and name in request.GET}
+        
+        return JsonResponse({
+            'success': True,
+            'from': start,
+            'to': end,
+            'rows': rollup.query(start, end, group_by, filters)
+        })
+        
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+@require_http_methods(["GET"])
+def search_patient_records(request, aadhar):
+    """Full-text search over one patient's files and appointments"""
+    try:
+        limit = page_size(request)
+        query = request.GET.get('q', '').strip()
+        if not query:
+            return JsonResponse({'success': False, 'error': 'Search query is required'})
+        
+        # Verify patient exists
+        get_patient_cache().get(aadhar)
+        
+        offset = 0
+        cursor = request.GET.get('cursor')
+        if cursor:
+            try:
+                offset, = decode_cursor(cursor)
+                offset = max(0, int(offset))
+            except (ValueError, TypeError):
+                return JsonResponse({'success': False, 'error': 'Invalid cursor'})
+        
+        results = search.search_patient_records(aadhar, query, limit + 1, offset)
+        has_more = len(results) > limit
+        results = results[:limit]
+        file_types = dict(
+            MedicalFile.objects
+            .filter(id__in=[result['ref'] for result in results if result['kind'] == 'file'])
+            .values_list('id', 'file_type')
+        )
+        for result in results:
+            if result['kind'] == 'file':
+                result['type'] = file_types.get(uuid.UUID(result['ref']), '')
+                result['url'] = reverse('health:download_file', args=[result['ref']])
+        
+        return JsonResponse({
+            'success': True,
+            'results': results,
+            'next_cursor': encode_cursor(offset + limit) if has_more else None
+        })
+        
+    except ObjectDoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Patient not found'})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+@require_http_methods(["GET", "HEAD"])
+async def download_file(request, file_id):
+    """Stream the original bytes of a medical file, honouring Range requests and conditional GETs"""
+    try:
+        medical_file = await (MedicalFile.objects
+                              .annotate(gzip_hash=Subquery(Blob.objects.filter(sha256=OuterRef('content_hash'))
+                                                           .values('gzip_hash')[:1]))
+                              .aget(id=file_id))
+    except ObjectDoesNotExist:
+        return JsonResponse({'success': False, 'error': 'File not found'}, status=404)
+    
+    # A file's bytes never change, so its content hash is a strong ETag
+    etag = f'"{medical_file.content_hash}"' if medical_file.content_hash else None
+    compressible = bool(medical_file.content_hash) and is_compressible(medical_file.file_type)
+    
+    # Whole text-like files go out as their stored gzip copy when the client takes gzip
+    if (medical_file.gzip_hash and 'Range' not in request.headers
+            and 'gzip' in accepted_encodings(request.headers.get('Accept-Encoding'))):
+        etag = f'"{medical_file.content_hash}-gzip"'
+        if etag_matches(request, etag):
+            response = not_modified(etag, FILE_CACHE_CONTROL)
+            patch_vary_headers(response, ('Accept-Encoding',))
+            return response
+        try:
+            fileobj = await sync_to_async(get_blob_store().open, thread_sensitive=False)(medical_file.gzip_hash)
+        except FileNotFoundError:
+            return JsonResponse({'success': False, 'error': 'File not found'}, status=404)
+        response = FileResponse(fileobj, content_type=medical_file.file_type, filename=medical_file.file_name,
+                                as_attachment=request.GET.get('download') == '1')
+        response['Content-Encoding'] = 'gzip'
+        response['ETag'] = etag
+        response['Cache-Control'] = FILE_CACHE_CONTROL
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return stream_async(request, response)
+    
+    if etag_matches(request, etag):
+        response = not_modified(etag, FILE_CACHE_CONTROL)
+        if compressible:
+            patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+    try:
+        fileobj = await sync_to_async(medical_file.open, thread_sensitive=False)()
+    except FileNotFoundError:
+        return JsonResponse({'success': False, 'error': 'File not found'}, status=404)
+    
+    response = ranged_file_response(
+        request,
+        fileobj,
+        content_type=medical_file.file_type or 'application/octet-stream',
+        filename=medical_file.file_name,
+        as_attachment=request.GET.get('download') == '1',
+        etag=etag
+    )
+    if etag:
+        response['Cache-Control'] = FILE_CACHE_CONTROL
+    if compressible:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return stream_async(request, response)
+
+@require_http_methods(["GET"])
+@read_only
+async def verify_patient_qr(request, aadhar):
     """Verify patient exists by Aadhar from QR scan"""
     try:
-        patient = Patient.objects.get(aadhar=aadhar)
+        patient_data = await get_patient_cache().aget(aadhar)
         
         return JsonResponse({
             'success': True,
-            'patient_data': {
-                'aadhar': patient.aadhar,
-                'name': patient.name,
-                'phone': patient.phone,
-                'email': patient.email
-            }
+            'patient_data': patient_data,
+            'qr_token': issue_token(patient_data)
         })
         
     except ObjectDoesNotExist:
         return JsonResponse({'success': False, 'error': 'Patient not found'})
     except Exception as e:
-        return JsonResponse({'success': False, 'error': str(e)})
\ No newline at end of file
+        return JsonResponse({'success': False, 'error': str(e)})
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def verify_qr_tokens(request):
+    """Check a batch of signed QR tokens and report whether each is still current"""
+    try:
+        data = json.loads(request.body)
+        tokens = data.get('tokens', [])
+        
+        if not isinstance(tokens, list) or not tokens:
+            return JsonResponse({'success': False, 'error': 'tokens must be a non-empty list'})
+        
+        if len(tokens) > MAX_QR_TOKENS:
+            return JsonResponse({'success': False, 'error': f'At most {MAX_QR_TOKENS} tokens per request'})
+        
+        # Check signatures first so only genuine tokens cost a lookup
+        payloads = []
+        for token in tokens:
+            try:
+                payloads.append((read_token(str(token)), None))
+            except TokenExpired:
+                payloads.append((None, 'Token expired'))
+            except BadSignature:
+                payloads.append((None, 'Invalid token'))
+        
+        profiles = get_patient_cache().get_many(p['a'] for p, _ in payloads if p)
+        
+        results = []
+        for payload, error in payloads:
+            if payload is None:
+                results.append({'valid': False, 'error': error})
+                continue
+            profile = profiles.get(payload['a'])
+            if profile is None:
+                results.append({'valid': False, 'aadhar': payload['a'], 'error': 'Patient not found'})
+                continue
+            current = payload.get('v') == profile_version(profile)
+            result = {'valid': True, 'aadhar': payload['a'], 'current': current}
+            if not current:
+                result['patient_data'] = profile
+                result['qr_token'] = issue_token(profile)
+            results.append(result)
+        
+        return JsonResponse({'success': True, 'results': results})
+        
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON data'})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
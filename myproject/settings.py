@@ -29,6 +29,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'health.metrics.MetricsMiddleware',
+    'health.logs.AccessLogMiddleware',
+    'health.compression.CompressionMiddleware',
+    'health.metrics.FailureMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,13 +64,49 @@ TEMPLATES = [
 WSGI_APPLICATION = 'myproject.wsgi.application'
 
 # Database
+DATABASE_PATH = os.environ.get('HEALTH_DB_PATH', BASE_DIR / 'db.sqlite3')
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': DATABASE_PATH,
     }
 }
 
+# HEALTH_DB_PROFILE=production runs SQLite in WAL mode with the pragmas below
+# (applied by health.db on every new connection), keeps connections open
+# between requests, and sends lookup endpoints to a read-only connection.
+HEALTH_DB_PROFILE = os.environ.get('HEALTH_DB_PROFILE', 'development')
+HEALTH_SQLITE_PRAGMAS = {}
+DATABASE_ROUTERS = ['health.db.ReadOnlyRouter']
+
+if HEALTH_DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Take the write lock at BEGIN so a waiting writer honours
+            # busy_timeout instead of failing with "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 5,
+        },
+    })
+    DATABASES['readonly'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'file:{DATABASE_PATH}?mode=ro',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'timeout': 5},
+        'TEST': {'MIRROR': 'default'},
+    }
+    HEALTH_SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,  # ms
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,  # KiB
+        'temp_store': 'MEMORY',
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -115,15 +156,107 @@ CORS_ALLOW_ALL_ORIGINS = True
 FILE_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50MB
 
-# Logging configuration
+# Medical file blob store. Files live on disk sharded by SHA-256; set
+# BACKEND to 'health.blobstore.StorageBlobStore' with OPTIONS
+# {'storage': '<STORAGES alias>'} to keep them in any Django Storage.
+HEALTH_BLOB_STORE = {
+    'BACKEND': 'health.blobstore.LocalBlobStore',
+    'OPTIONS': {
+        'root': BASE_DIR / 'blobstore',
+    },
+}
+
+# Cold archive (see health.archive): the archive_files command moves the
+# bytes of files older than MIN_AGE_DAYS, and of patients inactive for
+# INACTIVE_DAYS, from the blob store into a compressed SQLite file at PATH.
+HEALTH_ARCHIVE = {
+    'PATH': os.environ.get('HEALTH_ARCHIVE_PATH', BASE_DIR / 'archive.sqlite3'),
+    'MIN_AGE_DAYS': 730,
+    'INACTIVE_DAYS': 1095,
+    'BATCH_SIZE': 100,
+}
+
+# Resumable chunked uploads: parts are written here until the upload is
+# committed to the blob store. Files are limited to MAX_SIZE, as the
+# single-request upload always was.
+HEALTH_UPLOAD_DIR = BASE_DIR / 'uploads'
+HEALTH_UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+HEALTH_UPLOAD_MAX_SIZE = 50 * 1024 * 1024  # 50MB
+
+# Thumbnails for uploaded images (and PDFs when PyMuPDF is installed) are
+# generated by this many background threads per process.
+HEALTH_PREVIEW_WORKERS = 2
+
+# Doctor, worker and appointment codes are handed out from blocks of this
+# many values reserved per process (see health.ids).
+HEALTH_ID_BLOCK_SIZE = 100
+
+# Patient profile cache used by QR verification, login and lookups. Set
+# BACKEND to a CACHES alias to share entries between worker processes.
+HEALTH_PATIENT_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TTL': 60,  # seconds
+    'BACKEND': None,
+}
+
+# Lifetime of the signed patient QR tokens (seconds)
+HEALTH_QR_TOKEN_MAX_AGE = 365 * 24 * 60 * 60
+
+# Text and JSON responses of at least MIN_SIZE bytes are sent gzip- or
+# Brotli-compressed (Brotli needs the optional brotli package).
+HEALTH_COMPRESSION = {
+    'MIN_SIZE': 1024,
+}
+
+# Per-endpoint request metrics served at /metrics. With several worker
+# processes (e.g. gunicorn -w 4) set MULTIPROCESS_DIR to a directory they
+# share, emptied on startup, so /metrics reports all of them.
+HEALTH_METRICS = {
+    'ENABLED': True,
+    'MULTIPROCESS_DIR': os.environ.get('HEALTH_METRICS_DIR') or None,
+    'FLUSH_INTERVAL': 5,  # seconds
+}
+
+# Structured access log (access.log, JSON lines). Only SAMPLE_RATE of the
+# requests are written, but server errors and requests slower than
+# SLOW_MS always are.
+HEALTH_ACCESS_LOG = {
+    'ENABLED': True,
+    'SAMPLE_RATE': float(os.environ.get('HEALTH_ACCESS_LOG_SAMPLE_RATE', 1.0)),
+    'SLOW_MS': 1000,
+}
+
+# Logging configuration. Records are written by a background thread to
+# files rotated at 10MB (5 kept), with Aadhar and phone numbers masked.
+LOG_DIR = Path(os.environ.get('HEALTH_LOG_DIR', BASE_DIR))
+# Each process rotates its own files, so production's worker processes write one set each
+LOG_SUFFIX = '.{pid}' if HEALTH_DB_PROFILE == 'production' else ''
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'text': {
+            '()': 'health.logs.RedactingFormatter',
+            'format': '{asctime} {levelname} {name} {message}',
+            'style': '{',
+        },
+        'json': {
+            '()': 'health.logs.JsonFormatter',
+        },
+    },
     'handlers': {
         'file': {
+            '()': 'health.logs.QueuedFileHandler',
+            'level': 'INFO',
+            'formatter': 'text',
+            'filename': LOG_DIR / f'django{LOG_SUFFIX}.log',
+        },
+        'access': {
+            '()': 'health.logs.QueuedFileHandler',
             'level': 'INFO',
-            'class': 'logging.FileHandler',
-            'filename': BASE_DIR / 'django.log',
+            'formatter': 'json',
+            'filename': LOG_DIR / f'access{LOG_SUFFIX}.log',
         },
     },
     'loggers': {
@@ -132,5 +265,15 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'health': {
+            'handlers': ['file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'health.access': {
+            'handlers': ['access'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
-}
\ No newline at end of file
+}